@@ -21,6 +21,7 @@ export type Order = {
     user: User;
     state: OrderState;
     total_cost: number;
+    currency: string;
     items: {
         product: {
             name: string;
@@ -93,6 +94,7 @@ export const ordersCollection = buildCollection<Order>({
                             },
                             price: {
                                 name: "Price",
+                                description: "In the smallest unit of the currency",
                                 dataType: "number"
                             },
                         }
@@ -112,9 +114,15 @@ export const ordersCollection = buildCollection<Order>({
         }),
         total_cost: buildProperty({
             title: "Total Cost",
+            description: "In the smallest unit of the currency, e.g. 2550 for GHS 25.50",
             dataType: "number",
             readOnly: true
         }),
+        currency: buildProperty({
+            title: "Currency",
+            dataType: "string",
+            readOnly: true
+        }),
 
     }
 });
@@ -9,6 +9,7 @@ enum ProductStatus {
 export type Product = {
     name: string;
     price: number;
+    currency: string;
     status: ProductStatus;
     image: string;
     description: string;
@@ -38,13 +39,21 @@ export const productsCollection = buildCollection<Product>({
             name: "Price",
             validation: {
                 required: true,
-                requiredMessage: "You must set a price between 0 and 1000",
+                requiredMessage: "You must set a price between 0 and 100000",
                 min: 0,
-                max: 1000
+                max: 100000,
+                integer: true
             },
-            description: "Price with range validation",
+            description: "Price in the smallest unit of the currency, e.g. 2550 for GHS 25.50",
             dataType: "number"
         },
+        currency: {
+            name: "Currency",
+            validation: { required: true, length: 3 },
+            description: "ISO 4217 code of the currency the price is in",
+            dataType: "string",
+            defaultValue: "GHS"
+        },
         status: {
             name: "Status",
             validation: { required: true },
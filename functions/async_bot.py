@@ -0,0 +1,121 @@
+""" Runs the bot with long polling, handling the updates of several chats at once
+    bot.py handles one update at a time on the calling thread, which is what the Cloud Functions
+    webhook needs. For long-running deployments this file polls Telegram with telebot's
+    AsyncTeleBot and hands every update to bot.py's handlers on a worker thread, so the updates of
+    different chats are handled concurrently while those of one chat are handled in the order they
+    came. The handlers run as they do behind the webhook: each update in a unit of work of its own,
+    sending through the rate limited sender and claimed through the deduplicator first.
+
+    python async_bot.py
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+import bot
+import config
+from idempotency import UpdateDeduplicator
+
+logger = logging.getLogger(__name__)
+
+
+def chat_of(update: types.Update) -> Optional[int]:
+    """The ID of the chat an update came from, None if it has none"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None and update.callback_query.message is not None:
+        return update.callback_query.message.chat.id
+    return None
+
+
+class UpdateRunner:
+    """Runs bot.py's handlers on worker threads, one update of a chat at a time"""
+
+    def __init__(self, deduplicator: UpdateDeduplicator, workers: int = config.POLLING_WORKERS):
+        """
+        Args:
+            deduplicator (UpdateDeduplicator): Claims every update before it is handled
+            workers (int, optional): Updates handled at once. Defaults to config.POLLING_WORKERS.
+        """
+        self.deduplicator = deduplicator
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="update")
+        # chat ID -> the task of the chat's last update, which its next update waits for
+        self.tails: dict[int, asyncio.Task] = {}
+        self.running: set[asyncio.Task] = set()
+
+    def submit(self, update: types.Update) -> asyncio.Task:
+        """Schedules an update after the updates of its chat submitted before it"""
+        chat_id = chat_of(update)
+        task = asyncio.create_task(self.run(update, self.tails.get(chat_id)))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+        if chat_id is not None:
+            self.tails[chat_id] = task
+            task.add_done_callback(functools.partial(self.forget, chat_id))
+        return task
+
+    def forget(self, chat_id: int, task: asyncio.Task):
+        """Drops a chat's last task once it finished, unless a later update of the chat replaced it"""
+        if self.tails.get(chat_id) is task:
+            del self.tails[chat_id]
+
+    async def run(self, update: types.Update, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.process, update)
+
+    def process(self, update: types.Update):
+        """Runs the handlers of an update on the calling thread, unless it was handled before. An
+        update whose handlers failed is released, so it is handled if Telegram delivers it again."""
+        if self.deduplicator.is_duplicate(update.update_id):
+            return
+        try:
+            bot.bot.process_new_updates([update])
+        except Exception:  # pylint: disable = broad-except
+            self.deduplicator.release(update.update_id)
+            logger.exception("Update %d failed", update.update_id)
+
+    async def join(self):
+        """Waits for every submitted update"""
+        while self.running:
+            await asyncio.wait(list(self.running))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def poll(runner: UpdateRunner, poller: AsyncTeleBot, timeout: int = 20):
+    """Hands the updates Telegram has for the bot to the runner, as they arrive"""
+    offset = None
+    while True:
+        try:
+            updates = await poller.get_updates(offset=offset, timeout=timeout, request_timeout=timeout + 10)
+        except Exception:  # pylint: disable = broad-except
+            logger.exception("Polling for updates failed")
+            await asyncio.sleep(3)
+            continue
+        for update in updates:
+            runner.submit(update)
+            offset = update.update_id + 1
+
+
+async def main():
+    poller = AsyncTeleBot(token=config.API_KEY)
+    runner = UpdateRunner(UpdateDeduplicator(bot.db, config.PROCESSED_UPDATES_CACHE_SIZE))
+    await poller.remove_webhook()
+    try:
+        await poll(runner, poller)
+    finally:
+        await runner.join()
+        runner.close()
+        await poller.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,3 @@
+"""Benchmarks for the bot.
+    Run them from the functions directory, e.g. `python -m benchmarks.startup`.
+"""
@@ -0,0 +1,97 @@
+"""Compares awaiting the independent lookups of a handler one after the other and together.
+
+AsyncSqlDb runs on an SQLite file in a temporary directory, or on the database at --url, so every
+lookup is a real round trip through the driver and no latency is assumed. The lookups are those
+of bot.py's checkout and name handlers: the cart and the user, then the name update and the cart.
+The time per update of both ways is printed along with the speedup, which depends on how long the
+database's round trips are and is not checked. The script exits with status 1 when the lookups
+awaited together return something other than the same lookups awaited one after the other.
+
+    python -m benchmarks.async_db --updates 200
+    python -m benchmarks.async_db --url postgresql+asyncpg://localhost/shop
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Optional
+
+os.environ.setdefault("API_KEY", "benchmark")
+
+# pylint: disable = wrong-import-position
+from data.async_interface import AsyncDBInterface
+from data.async_sql import AsyncSqlDb
+from data.money import Money
+
+
+async def sequential(db: AsyncDBInterface, chat_id: str) -> tuple:
+    cart = await db.get_cart(chat_id)
+    user = await db.get_user_by_id(chat_id)
+    updated = await db.update_user(chat_id, display_name="Ama Mensah")
+    return cart, user, updated, await db.get_cart(chat_id)
+
+
+async def gathered(db: AsyncDBInterface, chat_id: str) -> tuple:
+    cart, user = await asyncio.gather(db.get_cart(chat_id), db.get_user_by_id(chat_id))
+    updated, cart_again = await asyncio.gather(db.update_user(chat_id, display_name="Ama Mensah"),
+                                               db.get_cart(chat_id))
+    return cart, user, updated, cart_again
+
+
+async def measure(url: str, updates: int) -> tuple[dict[str, float], list[str]]:
+    """Returns the milliseconds per update of each way of awaiting the lookups, and the users whose
+    lookups returned different results"""
+    db = AsyncSqlDb(url)
+    # IDs no earlier run used, so a database given with --url can be measured again
+    run = uuid.uuid4().hex[:8]
+    users = [f"{run}-{user}" for user in range(updates)]
+    await db.create_product(f"Shea Butter {run}", Money.parse("25.50"), "", "")
+    product = (await db.get_products_by_name(f"Shea Butter {run}"))[0]
+    for user in users:
+        # created with the name the handlers set, so both ways read the same user
+        await db.create_new_user(user, "Ama Mensah")
+        await db.add_to_cart(user, product.id_, 2, product.price)
+
+    results, milliseconds = {}, {}
+    for name, handler in (("sequential", sequential), ("gathered", gathered)):
+        start = time.perf_counter()
+        results[name] = [await handler(db, user) for user in users]
+        milliseconds[name] = (time.perf_counter() - start) * 1000 / updates
+    await db.close()
+
+    differing = [user for user, one, other in zip(users, results["sequential"], results["gathered"]) if one != other]
+    return milliseconds, differing
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--url", help="the database of an async driver, a temporary SQLite file by default")
+    args = parser.parse_args()
+
+    directory: Optional[tempfile.TemporaryDirectory] = None
+    url = args.url
+    if url is None:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite+aiosqlite:///{os.path.join(directory.name, 'benchmark.sqlite3')}"
+    try:
+        milliseconds, differing = asyncio.run(measure(url, args.updates))
+    finally:
+        if directory is not None:
+            directory.cleanup()
+
+    for name, value in milliseconds.items():
+        print(f"{name:<12}{value:>10.2f} ms/update")
+    print(f"{'speedup':<12}{milliseconds['sequential'] / milliseconds['gathered']:>10.2f}x")
+
+    for user in differing:
+        print(f"The lookups of user {user} returned different results when awaited together")
+    return 1 if differing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
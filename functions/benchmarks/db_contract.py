@@ -0,0 +1,262 @@
+"""Runs the same DBInterface calls against each backend and checks they return the same results.
+
+SqlDb and AsyncSqlDb run on in-memory databases, and MemoryDb and FakeDb, the stand-in the other
+benchmarks use for Firestore, run in process without a directory. Firestore and AsyncFirestore are only checked when
+FIRESTORE_EMULATOR_HOST points at a running emulator. The async backends are called through
+RunSync. The script exits with status 1 when a backend breaks the contract.
+
+    python -m benchmarks.db_contract --backends sql sql-async memory fake firestore firestore-async
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import os
+import sys
+import traceback
+import uuid
+from typing import Callable
+
+from benchmarks import fakes
+
+# pylint: disable = wrong-import-position
+from data.DatabaseInterface import (CartItem, ConversationState, DBInterface, NavigationHistory, Order,
+                                    OrderInProgress, OrderState, Product, User)
+from data.async_interface import AsyncDBInterface
+from data.money import Money
+
+PRICE = Money.parse("25.50")
+
+
+class RunSync:
+    """Calls the coroutines of an AsyncDBInterface from synchronous code, on an event loop of its own"""
+
+    def __init__(self, db: AsyncDBInterface):
+        self.db = db
+        self.loop = asyncio.new_event_loop()
+
+    def __getattr__(self, name: str):
+        method = getattr(self.db, name)
+        return lambda *args, **kwargs: self.loop.run_until_complete(method(*args, **kwargs))
+
+
+def create_backend(name: str) -> DBInterface | RunSync | None:
+    """Creates an empty instance of a backend, or None when it cannot run here"""
+    # pylint: disable = import-outside-toplevel
+    if name == "sql":
+        from data.SqlDb import SqlDb
+        return SqlDb("sqlite://")
+    if name == "sql-async":
+        from data.async_sql import AsyncSqlDb
+        return RunSync(AsyncSqlDb("sqlite+aiosqlite://"))
+    if name == "memory":
+        from data.memory import MemoryDb
+        return MemoryDb("")
+    if name == "fake":
+        return fakes.FakeDb()
+    if name == "firestore" and os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        from data.firestore import Firestore
+        return Firestore()
+    if name == "firestore-async" and os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        from data.async_firestore import AsyncFirestore
+        return RunSync(AsyncFirestore())
+    return None
+
+
+def new_user(db: DBInterface, name: str = "Ama Mensah") -> str:
+    """Creates a user with an ID no earlier run used, so a shared emulator can be reused"""
+    id_ = uuid.uuid4().hex
+    assert db.create_user_if_absent(id_, display_name=name)
+    return id_
+
+
+def new_product(db: DBInterface, name: str = "", price: Money = PRICE) -> Product:
+    """Creates a product with a name no earlier run used and returns it"""
+    name = name or f"Shea Butter {uuid.uuid4().hex[:8]}"
+    db.create_product(name, price, "500g tub", "shea.png")
+    products = db.get_products_by_name(name)
+    assert len(products) == 1, products
+    return products[0]
+
+
+def check_users(db: DBInterface):
+    id_ = new_user(db)
+    assert not db.create_user_if_absent(id_, display_name="Someone Else")
+    assert db.get_user_by_id(id_) == User(id_, "Ama Mensah", "", "", 0), db.get_user_by_id(id_)
+    assert db.get_user_by_id(uuid.uuid4().hex) is None
+
+    updated = db.update_user(id_, phone="0240000000", display_name="Ama M.")
+    assert updated == User(id_, "Ama M.", "0240000000", "", 0), updated
+    assert db.get_user_by_id(id_) == updated
+    assert id_ in {user.id_ for user in db.get_users()}
+
+    assert id_ not in {admin.id_ for admin in db.get_admins()}
+    assert db.authenticate_user(id_).is_admin == 1
+    assert id_ in {admin.id_ for admin in db.get_admins()}
+
+
+def check_products(db: DBInterface):
+    product = new_product(db)
+    assert isinstance(product, Product) and isinstance(product.id_, str), product
+    assert (product.price, product.description, product.image) == (PRICE, "500g tub", "shea.png"), product
+    assert (product.published, product.status) == (True, "IN_STOCK"), product
+    assert db.get_product_by_id(product.id_) == product
+    assert product.id_ in {other.id_ for other in db.get_products()}
+    assert db.get_product_by_id("999999") is None
+
+    db.update_product(product.id_, description="1kg tub")
+    assert db.get_product_by_id(product.id_).description == "1kg tub"
+
+
+def check_cart(db: DBInterface):
+    user, product = new_user(db), new_product(db)
+    assert db.get_cart(user) == {"total_cost": Money(0), "products": []}
+
+    # adding a product again raises its quantity
+    db.add_to_cart(user, product.id_, 2, product.price)
+    db.add_to_cart(user, product.id_, 1, product.price)
+    cart = db.get_cart(user)
+    assert cart["total_cost"] == PRICE * 3, cart
+    assert cart["products"] == [CartItem(product, 3)], cart
+    assert db.get_cart_items(user) == cart["products"]
+
+    assert db.remove_item_from_cart(user, cart["products"][0])
+    assert db.get_cart(user) == {"total_cost": Money(0), "products": []}
+
+
+def check_cart_prices(db: DBInterface):
+    user, product = new_user(db), new_product(db, price=Money.parse("10"))
+
+    # a product added again after its price changed is charged the new price for all of it, in the
+    # cart and in the order
+    db.add_to_cart(user, product.id_, 1, product.price)
+    db.update_product(product.id_, price=Money.parse("12"))
+    db.add_to_cart(user, product.id_, 1, Money.parse("12"))
+    cart = db.get_cart(user)
+    assert cart["products"] == [CartItem(dataclasses.replace(product, price=Money.parse("12")), 2)], cart
+    assert cart["total_cost"] == Money.parse("24"), cart
+    order = db.get_order_by_id(db.place_order(user))
+    assert order.total_cost == Money.parse("24"), order
+
+    # a zero price is a price, not a missing one
+    free = new_product(db)
+    db.add_to_cart(user, free.id_, 1, Money(0))
+    assert db.get_cart(user)["products"] == [CartItem(dataclasses.replace(free, price=Money(0)), 1)], db.get_cart(user)
+    db.remove_item_from_cart(user, CartItem(free, 1))
+
+    # carts in a currency other than config.CURRENCY add up in their own currency
+    dollars = new_product(db, price=Money.parse("5", "USD"))
+    db.add_to_cart(user, dollars.id_, 3, dollars.price)
+    assert db.get_cart(user)["total_cost"] == Money.parse("15", "USD"), db.get_cart(user)
+
+
+def check_orders(db: DBInterface):
+    user, product = new_user(db), new_product(db)
+    assert db.place_order(user) is None
+
+    db.add_to_cart(user, product.id_, 2, product.price)
+    order_id = db.place_order(user)
+    assert isinstance(order_id, str), order_id
+    assert db.get_cart(user)["products"] == []
+
+    order = db.get_order_by_id(order_id)
+    assert isinstance(order, Order), order
+    assert (order.id_, order.user.id_, order.total_cost, order.state) == \
+        (order_id, user, PRICE * 2, OrderState.PENDING), order
+    assert [(item.product.id_, item.product.name, item.quantity, item.price) for item in order.items] == \
+        [(product.id_, product.name, 2, PRICE)], order.items
+    assert db.get_order_by_id("999999") is None
+
+    created = db.create_order(user, PRICE, [CartItem(product, 1)])
+    assert isinstance(created, str), created
+    assert {order.id_ for order in db.get_orders(user_id=user)} == {order_id, created}
+
+    db.update_order(order_id, OrderState.COMPLETED)
+    assert order_id in {order.id_ for order in db.get_orders_by_order_state(OrderState.COMPLETED)}
+    assert {order.id_ for order in db.get_orders(user_id=user, state=OrderState.PENDING)} == {created}
+
+
+def check_order_in_progress(db: DBInterface):
+    user, product = new_user(db), new_product(db)
+    assert db.get_order_in_progress(user) is None
+
+    db.create_order_in_progress(user, product)
+    db.update_order_in_progress(user, 4)
+    assert db.get_order_in_progress(user) == OrderInProgress(product, 4)
+
+    db.remove_order_in_progress(user)
+    assert db.get_order_in_progress(user) is None
+
+
+def check_navigation(db: DBInterface):
+    user = new_user(db)
+    assert db.get_user_navigation(user) == NavigationHistory(user, "", [])
+
+    # a page already visited is not added again
+    for page in ("home", "products", "home"):
+        db.update_user_navigation(user, page)
+    assert db.get_user_navigation(user) == NavigationHistory(user, "home", ["home", "products"])
+
+    db.update_user_navigation(user, "cart", reset=True)
+    assert db.get_user_navigation(user) == NavigationHistory(user, "cart", ["cart"])
+
+
+def check_conversations(db: DBInterface):
+    chat = uuid.uuid4().hex
+    assert db.get_conversation_state(chat) == ConversationState(chat, "", [])
+    db.save_conversation_state(ConversationState(chat, "quantity", ["product", "quantity"]))
+    assert db.get_conversation_state(chat) == ConversationState(chat, "quantity", ["product", "quantity"])
+
+    update_id = uuid.uuid4().int % 2 ** 31
+    assert db.claim_update(update_id)
+    assert not db.claim_update(update_id)
+    db.release_update(update_id)
+    assert db.claim_update(update_id)
+
+
+CHECKS: dict[str, Callable[[DBInterface], None]] = {
+    "users": check_users,
+    "products": check_products,
+    "cart": check_cart,
+    "cart prices": check_cart_prices,
+    "orders": check_orders,
+    "order in progress": check_order_in_progress,
+    "navigation": check_navigation,
+    "conversations": check_conversations,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["sql", "sql-async", "memory", "fake", "firestore", "firestore-async"])
+    args = parser.parse_args()
+
+    backends = {name: create_backend(name) for name in args.backends}
+    print(f"{'check':<20}" + "".join(f"{name:>12}" for name in backends))
+    failures = []
+    for check, run in CHECKS.items():
+        row = f"{check:<20}"
+        for name, db in backends.items():
+            if db is None:
+                row += f"{'skipped':>12}"
+                continue
+            try:
+                run(db)
+                row += f"{'ok':>12}"
+            except Exception:  # pylint: disable = broad-except
+                row += f"{'FAIL':>12}"
+                failures.append(f"{name} {check}:\n{traceback.format_exc()}")
+        print(row)
+
+    # the async drivers keep threads of their own running until their connections are closed
+    for db in backends.values():
+        if isinstance(db, RunSync):
+            db.close()
+
+    for failure in failures:
+        print(f"\n{failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Compares finding a message's handler with telebot's filters and with a Router.
+
+For every handler count a TeleBot gets that many handlers, a third keyed by command, a third by
+exact text and a third by text and conversation step, with filters written like those bot.py had.
+A second TeleBot routes the same handlers through a Router. Messages for the first, the middle and
+the last handler and one no handler takes are each processed --messages times, and the step reads
+they cost are counted. The script checks both bots reach the same handler, and exits with status 1
+when they do not or when the router is slower for the last handler at the largest count.
+
+    python -m benchmarks.dispatch --handlers 10 20 100 --messages 2000
+"""
+
+import argparse
+import sys
+import time
+
+import telebot
+from telebot import types
+
+from router import Router
+
+STEP = "quantity_selection"
+
+
+class Chats:
+    """The conversation step of every chat, counting how often it is read"""
+
+    def __init__(self):
+        self.reads = 0
+
+    def step(self, message: types.Message) -> str:
+        self.reads += 1
+        return STEP if str(message.chat.id) else ""
+
+
+def key(number: int) -> tuple[str, str]:
+    """The kind of the number-th handler and the text that reaches it"""
+    kind = ("command", "text", "state")[number % 3]
+    return kind, f"/command{number}" if kind == "command" else f"text{number}"
+
+
+def filter_bot(count: int, chats: Chats, reached: list[str]) -> telebot.TeleBot:
+    """A TeleBot with a filter per handler, tried in order"""
+    bot = telebot.TeleBot("0:benchmark", threaded=False)
+    for number in range(count):
+        kind, text = key(number)
+
+        def handler(message, name=f"handler{number}"):
+            reached.append(name)
+
+        if kind == "command":
+            bot.register_message_handler(handler, commands=[text[1:]])
+        elif kind == "text":
+            bot.register_message_handler(handler, func=lambda message, text=text: message.text == text)
+        else:
+            bot.register_message_handler(
+                handler, func=lambda message, text=text: message.text == text and chats.step(message) == STEP)
+    bot.register_message_handler(lambda message: reached.append("fallback"), func=lambda message: True)
+    return bot
+
+
+def router_bot(count: int, chats: Chats, reached: list[str]) -> telebot.TeleBot:
+    """A TeleBot whose only handler hands every message to a Router"""
+    bot = telebot.TeleBot("0:benchmark", threaded=False)
+    router = Router(chats.step)
+    for number in range(count):
+        kind, text = key(number)
+
+        def handler(message, name=f"handler{number}"):
+            reached.append(name)
+
+        if kind == "command":
+            router.command(text[1:])(handler)
+        elif kind == "text":
+            router.text(text)(handler)
+        else:
+            router.text(text, state=STEP)(handler)
+    router.fallback(lambda message: reached.append("fallback"))
+    bot.register_message_handler(router.dispatch, func=lambda message: True)
+    return bot
+
+
+def message(text: str) -> types.Message:
+    payload = {"message_id": 1, "date": 0, "text": text, "chat": {"id": 1, "type": "private"}}
+    if text.startswith("/"):
+        payload["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return types.Message.de_json(payload)
+
+
+def measure(bot: telebot.TeleBot, chats: Chats, update: types.Message, messages: int) -> tuple[float, float]:
+    """Returns the microseconds and the step reads of processing a message"""
+    chats.reads = 0
+    start = time.perf_counter()
+    for _ in range(messages):
+        bot.process_new_messages([update])
+    return (time.perf_counter() - start) * 1e6 / messages, chats.reads / messages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handlers", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'handlers':>8}  {'message':<10}{'filters us':>12}{'router us':>11}{'speedup':>9}"
+          f"{'filter reads':>14}{'router reads':>14}")
+    failures = []
+    for count in args.handlers:
+        chats, filter_reached, router_reached = Chats(), [], []
+        filters = filter_bot(count, chats, filter_reached)
+        router = router_bot(count, chats, router_reached)
+        targets = {"first": key(0)[1], "middle": key(count // 2)[1], "last": key(count - 1)[1],
+                   "unmatched": "hello"}
+        for name, text in targets.items():
+            update = message(text)
+            filter_us, filter_reads = measure(filters, chats, update, args.messages)
+            router_us, router_reads = measure(router, chats, update, args.messages)
+            print(f"{count:>8}  {name:<10}{filter_us:>12.2f}{router_us:>11.2f}{filter_us / router_us:>8.1f}x"
+                  f"{filter_reads:>14g}{router_reads:>14g}")
+
+            if filter_reached[-1] != router_reached[-1]:
+                failures.append(f"{text!r} reached {filter_reached[-1]} through the filters "
+                                f"and {router_reached[-1]} through the router")
+            if count == max(args.handlers) and name == "last" and router_us >= filter_us:
+                failures.append(f"The router is not faster than the filters with {count} handlers")
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
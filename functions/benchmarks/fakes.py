@@ -0,0 +1,135 @@
+"""In-process stand-ins for the database, the media storage and the Telegram API.
+
+Import this module before the bot: it registers the "fake" database and media handler, selects them
+through the environment and makes the bot's Telegram calls return canned responses instead of
+going over the network.
+"""
+
+import abc
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# config reads the environment when it is first imported
+os.environ.update({"API_KEY": "0:benchmark", "DB_TYPE": "fake",
+                  "MEDIA_TYPE": "fake", "STATE_STORE": "database"})
+
+# pylint: disable = wrong-import-position
+from telebot import apihelper
+
+import db as registry
+from data.DatabaseInterface import DBInterface
+from data.memory import MemoryDb
+from data.money import Money
+from media_handler import MediaHandler
+
+registry.DATABASES["fake"] = "benchmarks.fakes:FakeDb"
+registry.MEDIA_HANDLERS["fake"] = "benchmarks.fakes:FakeMedia"
+
+
+def round_trip(name: str):
+    """A FakeDb method that makes a call on the MemoryDb and counts it as a request to the database,
+    unless it is a write collected in a batch"""
+    def method(self, *args, **kwargs):
+        if not (self.batching and name in FakeDb.WRITES):
+            self.round_trips += FakeDb.ROUND_TRIPS.get(name, 1)
+            self.calls[name] += 1
+        return getattr(self.db, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class FakeDb(DBInterface):
+    """MemoryDb kept in the process only, counting the requests a real database would get"""
+
+    WRITES = {"create_new_user", "update_user", "add_to_cart", "remove_item_from_cart",
+              "create_order_in_progress", "update_order_in_progress", "remove_order_in_progress",
+              "update_user_navigation", "save_conversation_state"}
+    # calls a real database needs more than one request for. place_order reads the cart in its
+    # transaction and then commits.
+    ROUND_TRIPS = {"place_order": 2}
+
+    def __init__(self):
+        self.db = MemoryDb("")
+        self.round_trips = 0
+        self.calls: Counter = Counter()
+        self.batching = False
+
+    def reset_counts(self):
+        """Sets the request counters back to zero"""
+        self.round_trips = 0
+        self.calls.clear()
+
+    @contextmanager
+    def batch(self):
+        with self.db.batch():
+            self.batching = True
+            try:
+                yield
+            finally:
+                self.batching = False
+        self.round_trips += 1
+        self.calls["batch"] += 1
+
+
+for _name in DBInterface.__abstractmethods__:
+    setattr(FakeDb, _name, round_trip(_name))
+abc.update_abstractmethods(FakeDb)
+
+
+class FakeMedia(MediaHandler):
+    """Serves the same few bytes for every image"""
+
+    def upload(self, file: str, filename: str):
+        pass
+
+    def download(self, filename: str) -> bytes:
+        return b"\x89PNG\r\n\x1a\n"
+
+    def delete(self, filename: str):
+        pass
+
+
+class FakeResponse:
+    """The parts of requests.Response that telebot reads"""
+
+    status_code = 200
+    reason = "OK"
+
+    def __init__(self, result):
+        self.result = result
+        self.text = ""
+
+    def json(self):
+        return {"ok": True, "result": self.result}
+
+
+class FakeTelegram:
+    """Answers the bot's Telegram calls in process and counts them by method, from any thread"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.message_id = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, params=None, files=None, **kwargs):
+        name = url.rsplit("/", 1)[-1]
+        with self.lock:
+            self.calls[name] += 1
+            self.message_id += 1
+            message_id = self.message_id
+        if name in ("answerCallbackQuery", "setWebhook", "deleteWebhook"):
+            return FakeResponse(True)
+
+        chat_id = int((params or {}).get("chat_id", 0))
+        message = {"message_id": message_id, "date": 0,
+                   "chat": {"id": chat_id, "type": "private"}}
+        if name == "sendPhoto":
+            message["photo"] = [{"file_id": f"photo{message_id}", "file_unique_id": "u",
+                                 "width": 1, "height": 1}]
+        return FakeResponse(message)
+
+    def install(self):
+        """Routes the bot's requests to this fake"""
+        apihelper.CUSTOM_REQUEST_SENDER = self
@@ -0,0 +1,195 @@
+"""Measures every handler of bot.py on synthetic updates, with no network involved.
+
+Telegram is answered by FakeTelegram and the database is FakeDb behind the bot's unit of work. For
+every handler a fresh chat replays the steps of the purchase flow that lead to it and then sends
+the update being measured. The latency of processing that update is sampled --iterations times,
+its memory allocations are traced in a second pass, and the database requests and Telegram calls
+it made are counted. The script exits with status 1 when a handler makes more calls than its
+budget, or when a p95 latency is over --max-p95-ms if that is given.
+
+    python -m benchmarks.handlers --iterations 200 --budget checkout_handler=2,3
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+# the sender's rate limits would make every latency a wait for a token, see sender.py for them
+os.environ.update({"TELEGRAM_GLOBAL_RATE": "1e9", "TELEGRAM_CHAT_RATE": "1e9", "TELEGRAM_CHAT_BURST": "1e9"})
+
+# pylint: disable = wrong-import-position
+from benchmarks import fakes
+from benchmarks.unit_of_work import FLOW, update
+
+import bot  # pylint: disable = wrong-import-order
+
+STEPS = [name for name, _ in FLOW]
+
+# handler -> the number of purchase flow steps replayed before it and the update it is measured on
+SCENARIOS = {
+    "start_handler": (STEPS.index("start"), dict(FLOW)["start"]),
+    "display_products": (STEPS.index("make_purchase"), "make_purchase"),
+    "callback_query": (STEPS.index("product_selection"), "product_selection_1"),
+    "quantity_selection_handler": (STEPS.index("quantity_selection"), dict(FLOW)["quantity_selection"]),
+    "add_to_cart_handler": (STEPS.index("add_to_cart"), dict(FLOW)["add_to_cart"]),
+    "view_cart_handler": (STEPS.index("checkout"), "view_cart"),
+    "checkout_handler": (STEPS.index("checkout"), "checkout"),
+    "phone_number_handler": (STEPS.index("phone_number"), dict(FLOW)["phone_number"]),
+    "address_handler": (STEPS.index("address"), dict(FLOW)["address"]),
+    "name_handler": (STEPS.index("name"), dict(FLOW)["name"]),
+    "confirm_order_handler": (STEPS.index("confirm_order"), dict(FLOW)["confirm_order"]),
+    "default_handler": (0, {"text": "Hello"}),
+}
+
+# handler -> the most database requests and Telegram calls of one update
+DEFAULT_BUDGETS = {
+    "start_handler": (1, 1),
+    "display_products": (1, 3),
+    "callback_query": (3, 3),
+    "quantity_selection_handler": (3, 1),
+    "add_to_cart_handler": (3, 2),
+    "view_cart_handler": (1, 4),
+    "checkout_handler": (2, 3),
+    "phone_number_handler": (3, 1),
+    "address_handler": (2, 1),
+    "name_handler": (4, 4),
+    "confirm_order_handler": (3, 2),
+    "default_handler": (1, 1),
+}
+
+
+class Samples:
+    """The measurements of one handler"""
+
+    def __init__(self):
+        self.nanoseconds: list[int] = []
+        self.peak_bytes: list[int] = []
+        self.retained_bytes: list[int] = []
+        self.db_calls: list[int] = []
+        self.telegram_calls: list[int] = []
+        self.db_methods: Counter = Counter()
+
+    def percentile(self, fraction: float) -> float:
+        """A latency percentile in microseconds"""
+        ordered = sorted(self.nanoseconds)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] / 1000
+
+
+class Driver:
+    """Sends the updates of the purchase flow to the bot"""
+
+    def __init__(self, database: fakes.FakeDb, telegram: fakes.FakeTelegram):
+        self.database = database
+        self.telegram = telegram
+        self.update_ids = itertools.count(1)
+        self.chat_ids = itertools.count(100000)
+
+    def prepare(self, steps: int) -> int:
+        """Replays the first steps of the purchase flow in a new chat and returns the chat's ID"""
+        chat_id = next(self.chat_ids)
+        for _, step in FLOW[:steps]:
+            bot.bot.process_new_updates([update(next(self.update_ids), step, chat_id)])
+        return chat_id
+
+    def measure(self, name: str, samples: Samples, trace: bool):
+        """Processes the update of a handler once and adds its measurements to the samples"""
+        steps, step = SCENARIOS[name]
+        chat_id = self.prepare(steps)
+        payload = update(next(self.update_ids), step, chat_id)
+        self.database.reset_counts()
+        self.telegram.calls.clear()
+
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            bot.bot.process_new_updates([payload])
+            current, peak = tracemalloc.get_traced_memory()
+            samples.peak_bytes.append(peak - before)
+            samples.retained_bytes.append(current - before)
+            return
+
+        start = time.perf_counter_ns()
+        bot.bot.process_new_updates([payload])
+        samples.nanoseconds.append(time.perf_counter_ns() - start)
+        samples.db_calls.append(self.database.round_trips)
+        samples.telegram_calls.append(sum(self.telegram.calls.values()))
+        samples.db_methods.update(self.database.calls)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handlers", nargs="*", default=list(SCENARIOS), metavar="HANDLER",
+                        help=f"one of {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--alloc-iterations", type=int, default=50,
+                        help="updates traced for allocations, tracing slows the handlers down")
+    parser.add_argument("--budget", action="append", default=[], metavar="HANDLER=DB,TELEGRAM",
+                        help="most database requests and Telegram calls of an update")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--verbose", action="store_true", help="list the database methods called")
+    args = parser.parse_args()
+    for name in set(args.handlers) - set(SCENARIOS):
+        parser.error(f"unknown handler {name}")
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for budget in args.budget:
+        name, _, limits = budget.partition("=")
+        db_calls, _, telegram_calls = limits.partition(",")
+        budgets[name] = (int(db_calls), int(telegram_calls))
+
+    database = bot.database
+    database.create_product("Shea Butter", fakes.Money.parse("25.50"), "500g tub", "shea.png")
+    telegram = fakes.FakeTelegram()
+    telegram.install()
+    driver = Driver(database, telegram)
+
+    results = {}
+    for name in args.handlers:
+        samples = results[name] = Samples()
+        for _ in range(args.warmup):
+            driver.measure(name, Samples(), trace=False)
+        for _ in range(args.iterations):
+            driver.measure(name, samples, trace=False)
+
+    tracemalloc.start()
+    for name in args.handlers:
+        for _ in range(args.alloc_iterations):
+            driver.measure(name, results[name], trace=True)
+    tracemalloc.stop()
+
+    print(f"{'handler':<28}{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}{'max us':>9}"
+          f"{'peak KiB':>10}{'kept KiB':>10}{'db':>5}{'tg':>5}")
+    failures = []
+    for name, samples in results.items():
+        db_calls = statistics.median(samples.db_calls)
+        telegram_calls = statistics.median(samples.telegram_calls)
+        print(f"{name:<28}{samples.percentile(0.5):>9.0f}{samples.percentile(0.95):>9.0f}"
+              f"{samples.percentile(0.99):>9.0f}{max(samples.nanoseconds) / 1000:>9.0f}"
+              f"{statistics.median(samples.peak_bytes) / 1024:>10.1f}"
+              f"{statistics.median(samples.retained_bytes) / 1024:>10.1f}"
+              f"{db_calls:>5g}{telegram_calls:>5g}")
+        if args.verbose:
+            print("    " + ", ".join(f"{method} {count / args.iterations:g}"
+                                     for method, count in samples.db_methods.most_common()))
+
+        db_budget, telegram_budget = budgets.get(name, (None, None))
+        if db_budget is not None and db_calls > db_budget:
+            failures.append(f"{name} made {db_calls:g} database requests, its budget is {db_budget}")
+        if telegram_budget is not None and telegram_calls > telegram_budget:
+            failures.append(f"{name} made {telegram_calls:g} Telegram calls, its budget is {telegram_budget}")
+        if args.max_p95_ms is not None and samples.percentile(0.95) / 1000 > args.max_p95_ms:
+            failures.append(f"{name} took {samples.percentile(0.95) / 1000:.2f} ms at p95")
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
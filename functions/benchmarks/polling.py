@@ -0,0 +1,79 @@
+"""Runs the purchase flow in many chats at once through the UpdateRunner of async_bot.py.
+
+Telegram is answered by FakeTelegram and the database is FakeDb behind the bot's unit of work. The
+whole flow of a chat is submitted at once, before that of the next chat, and every update is
+submitted twice, as Telegram redelivers updates. The script exits with status 1 when a chat does
+not end with exactly one order, which happens when the updates of a chat are handled out of order
+or a redelivered update is handled again.
+
+    python -m benchmarks.polling --chats 200 --workers 8
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+# the sender's rate limits would hold every chat to a message per second, see sender.py for them
+os.environ.update({"TELEGRAM_GLOBAL_RATE": "1e9", "TELEGRAM_CHAT_RATE": "1e9", "TELEGRAM_CHAT_BURST": "1e9"})
+
+# pylint: disable = wrong-import-position
+from benchmarks import fakes
+from benchmarks.unit_of_work import FLOW, update
+
+import async_bot  # pylint: disable = wrong-import-order
+import bot  # pylint: disable = wrong-import-order
+from idempotency import UpdateDeduplicator
+
+FIRST_CHAT = 200000
+
+
+async def run(chats: int, workers: int) -> async_bot.UpdateRunner:
+    """Submits the flow of every chat, each update twice, and waits for all of them"""
+    runner = async_bot.UpdateRunner(UpdateDeduplicator(bot.db), workers)
+    update_ids = itertools.count(1)
+    for chat_id in range(FIRST_CHAT, FIRST_CHAT + chats):
+        for _, step in FLOW:
+            payload = update(next(update_ids), step, chat_id)
+            runner.submit(payload)
+            runner.submit(payload)
+    await runner.join()
+    runner.close()
+    return runner
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    telegram = fakes.FakeTelegram()
+    telegram.install()
+    database = bot.database
+    database.create_product("Shea Butter", fakes.Money.parse("25.50"), "500g tub", "shea.png")
+
+    start = time.perf_counter()
+    runner = asyncio.run(run(args.chats, args.workers))
+    seconds = time.perf_counter() - start
+
+    updates = args.chats * len(FLOW)
+    print(f"Handled {updates} updates of {args.chats} chats on {args.workers} workers in {seconds:.2f}s, "
+          f"{updates / seconds:.0f} updates/s")
+    print(f"Dropped {runner.deduplicator.duplicates} redelivered updates, made {sum(telegram.calls.values())} "
+          f"Telegram calls")
+
+    failures = [f"Chat {chat_id} placed {len(orders)} orders instead of 1"
+                for chat_id in range(FIRST_CHAT, FIRST_CHAT + args.chats)
+                if len(orders := database.get_orders(user_id=str(chat_id))) != 1]
+    if runner.deduplicator.duplicates != updates:
+        failures.append(f"{runner.deduplicator.duplicates} of {updates} redelivered updates were dropped")
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
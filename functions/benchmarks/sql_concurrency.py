@@ -0,0 +1,98 @@
+"""Measures how the SQL backend's throughput changes with the number of threads using it.
+
+Every simulated update reads a user and their cart, adds to the cart one time in ten and then
+waits for as long as a Telegram call takes, which is where threads overlap. The script exits with
+status 1 when a call fails or when the most threads are not at least --min-speedup times faster
+than one.
+
+    python -m benchmarks.sql_concurrency --updates 2000 --workers 1 2 4 8 16
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("API_KEY", "benchmark")
+
+# pylint: disable = wrong-import-position
+from data.SqlDb import SqlDb
+from data.money import Money
+
+USERS = 200
+
+
+def seed(database: SqlDb) -> str:
+    """Creates the users and a product, and returns the product's ID"""
+    database.create_product("Shea Butter", Money.parse("25.50"), "500g tub", "shea.png")
+    with database.batch():
+        for user in range(USERS):
+            database.create_new_user(str(user), f"User {user}")
+    return database.get_products_by_name("Shea Butter")[0].id_
+
+
+def run(database: SqlDb, product: str, updates: int, workers: int, io_ms: float) -> tuple[float, list[Exception]]:
+    """Processes updates on a number of threads
+
+    Returns:
+        tuple[float, list[Exception]]: Updates per second, and the errors raised
+    """
+    errors: list[Exception] = []
+    lock = threading.Lock()
+
+    def update(number: int):
+        user_id = str(random.randrange(USERS))
+        try:
+            database.get_user_by_id(user_id)
+            database.get_cart(user_id)
+            if number % 10 == 0:
+                database.add_to_cart(user_id, product, 1, Money.parse("25.50"))
+        except Exception as error:  # pylint: disable = broad-except
+            with lock:
+                errors.append(error)
+        time.sleep(io_ms / 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(update, range(updates)))
+    return updates / (time.perf_counter() - start), errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--io-ms", type=float, default=5,
+                        help="time each update waits on Telegram, in milliseconds")
+    parser.add_argument("--min-speedup", type=float, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = SqlDb(f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}")
+        product = seed(database)
+
+        print(f"{'workers':>8}{'updates/s':>12}{'speedup':>10}{'errors':>8}")
+        results = {}
+        failed = False
+        for workers in args.workers:
+            results[workers], errors = run(database, product, args.updates, workers, args.io_ms)
+            speedup = results[workers] / results[args.workers[0]]
+            print(f"{workers:>8}{results[workers]:>12.0f}{speedup:>10.2f}{len(errors):>8}")
+            for error in errors[:3]:
+                print(f"    {type(error).__name__}: {error}")
+            failed = failed or bool(errors)
+        database.engine.dispose()
+
+    speedup = results[args.workers[-1]] / results[args.workers[0]]
+    if speedup < args.min_speedup:
+        print(f"{args.workers[-1]} workers are only {speedup:.2f}x faster than {args.workers[0]}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
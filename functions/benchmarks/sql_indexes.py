@@ -0,0 +1,148 @@
+"""Measures SqlDb's order and cart queries on a database of 100k orders, before and after the
+migration that adds the indexes.
+
+The seeded database is stripped of its indexes and set back to the schema version before them,
+as a database created by an older release would be. The queries are timed, the database is
+upgraded in place and they are timed again. The script exits with status 1 when a query still
+scans a whole table after the upgrade.
+
+    python -m benchmarks.sql_indexes --orders 100000 --users 10000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable
+
+os.environ.setdefault("API_KEY", "benchmark")
+
+# pylint: disable = wrong-import-position
+from sqlalchemy import text
+
+import models
+from data.SqlDb import SqlDb
+from data.money import Money
+from migrations import SQL_MIGRATIONS, create_sql_indexes, set_sql_version, upgrade_sql
+
+PRODUCTS = 100
+STATES = ["COMPLETED"] * 97 + ["PENDING", "PROCESSING", "CANCELLED"]
+
+# the statements behind the timed queries, whose plans must use an index after the upgrade
+PLANS = {
+    "orders of a user": 'SELECT * FROM "order" WHERE user_id = 1',
+    "orders of a user by state": 'SELECT * FROM "order" WHERE user_id = 1 AND state = \'PENDING\'',
+    "orders by state": 'SELECT * FROM "order" WHERE state = \'PENDING\'',
+    "items of orders": "SELECT * FROM order_item WHERE order_id IN (1, 2, 3)",
+    "cart of a user": "SELECT * FROM cart WHERE user_id = 1",
+    "items of a cart": "SELECT * FROM cart_item WHERE cart_id = 1",
+    "product by name": "SELECT * FROM product WHERE name = 'Product 1'",
+}
+
+
+def seed(database: SqlDb, orders: int, users: int):
+    """Inserts users with a cart of three items each, and orders of two items each"""
+    price = Money.parse("25.50")
+    with database.engine.begin() as connection:
+        connection.execute(models.User.__table__.insert(), [
+            {"id": str(user), "fullname": f"User {user}", "phone": "", "address": "", "is_admin": 0}
+            for user in range(users)])
+        connection.execute(models.Product.__table__.insert(), [
+            {"id": product, "name": f"Product {product}", "price": price.amount, "currency": price.currency,
+             "description": "", "image": "", "published": True, "status": "IN_STOCK"}
+            for product in range(PRODUCTS)])
+        connection.execute(models.Cart.__table__.insert(), [
+            {"id": user, "user_id": str(user)} for user in range(users)])
+        connection.execute(models.CartItem.__table__.insert(), [
+            {"cart_id": user, "product_id": random.randrange(PRODUCTS), "quantity": 1,
+             "price": price.amount, "currency": price.currency} for user in range(users) for _ in range(3)])
+        connection.execute(models.Order.__table__.insert(), [
+            {"id": order, "user_id": str(random.randrange(users)), "total_cost": 2 * price.amount,
+             "currency": price.currency, "state": random.choice(STATES)} for order in range(orders)])
+        connection.execute(models.OrderItem.__table__.insert(), [
+            {"order_id": order, "product_id": product, "product": f"Product {product}", "quantity": 1,
+             "price": price.amount, "currency": price.currency}
+            for order in range(orders) for product in random.sample(range(PRODUCTS), 2)])
+
+
+def downgrade(database: SqlDb):
+    """Drops the indexes and sets the schema version back to before create_sql_indexes"""
+    with database.engine.begin() as connection:
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection, checkfirst=True)
+        set_sql_version(connection, SQL_MIGRATIONS.index(create_sql_indexes))
+
+
+def timed(call: Callable[[], object], runs: int) -> float:
+    """The median time of a call in milliseconds"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def measure(database: SqlDb, users: int, runs: int) -> dict[str, float]:
+    """Times the SqlDb methods that filter on the indexed columns"""
+    user = str(random.randrange(users))
+    return {
+        "get_orders(user_id)": timed(lambda: database.get_orders(user_id=user), runs),
+        "get_orders(user_id, state)": timed(lambda: database.get_orders(user_id=user, state="PENDING"), runs),
+        "get_orders(state)": timed(lambda: database.get_orders(state="CANCELLED"), runs),
+        "get_order_by_id": timed(lambda: database.get_order_by_id(str(random.randrange(users))), runs),
+        "get_cart": timed(lambda: database.get_cart(user), runs),
+        "get_cart_items": timed(lambda: database.get_cart_items(user), runs),
+    }
+
+
+def full_scans(database: SqlDb) -> list[str]:
+    """The statements whose query plan scans a whole table"""
+    scans = []
+    with database.engine.connect() as connection:
+        for name, statement in PLANS.items():
+            plan = " ".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+            if "SCAN" in plan and "USING" not in plan:
+                scans.append(f"{name}: {plan}")
+    return scans
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = SqlDb(f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}")
+        start = time.perf_counter()
+        seed(database, args.orders, args.users)
+        print(f"Seeded {args.orders} orders for {args.users} users in {time.perf_counter() - start:.1f}s\n")
+
+        downgrade(database)
+        before = measure(database, args.users, args.runs)
+
+        start = time.perf_counter()
+        upgrade_sql(database.engine)
+        print(f"Upgraded the schema in place in {time.perf_counter() - start:.2f}s\n")
+        after = measure(database, args.users, args.runs)
+        scans = full_scans(database)
+        database.engine.dispose()
+
+    print(f"{'query':<30}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<30}{before[name]:>12.2f}{after[name]:>12.2f}{before[name] / after[name]:>10.1f}")
+
+    for scan in scans:
+        print(f"Full table scan after the upgrade: {scan}")
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
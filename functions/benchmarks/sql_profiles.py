@@ -0,0 +1,100 @@
+"""Compares the write and read throughput of SqlDb under each SQLite profile.
+
+Every profile gets a fresh database file. Writes add to carts and create orders, each call
+committing on its own as the bot's handlers do. Reads fetch carts and orders. The figures are
+set against a remote database round trip of --remote-ms, which is an assumption passed on the
+command line and not a measurement. The script exits with status 1 when the tuned profile does
+not write faster than SQLite's default settings.
+
+    python -m benchmarks.sql_profiles --operations 500 --remote-ms 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable
+
+os.environ.setdefault("API_KEY", "benchmark")
+
+# pylint: disable = wrong-import-position
+from data.DatabaseInterface import CartItem
+from data.SqlDb import SQLITE_PROFILES, SqlDb
+from data.money import Money
+
+USERS = 50
+PRODUCTS = 20
+PRICE = Money.parse("25.50")
+
+
+def seed(database: SqlDb):
+    """Creates the users and products"""
+    with database.batch():
+        for user in range(USERS):
+            database.create_new_user(str(user), f"User {user}")
+        for product in range(PRODUCTS):
+            database.create_product(f"Product {product}", PRICE, "", "")
+
+
+def throughput(call: Callable[[int], object], operations: int) -> float:
+    """Calls a function a number of times and returns the calls per second"""
+    start = time.perf_counter()
+    for number in range(operations):
+        call(number)
+    return operations / (time.perf_counter() - start)
+
+
+def measure(profile: str, directory: str, operations: int) -> dict[str, float]:
+    """Measures the operations per second of the writes and reads under a profile"""
+    random.seed(0)
+    database = SqlDb(f"sqlite:///{os.path.join(directory, f'{profile}.sqlite3')}", profile=profile)
+    seed(database)
+    products = [product.id_ for product in database.get_products()]
+    items = [CartItem(database.get_product_by_id(products[0]), 2)]
+
+    results = {
+        "add_to_cart": throughput(lambda number: database.add_to_cart(
+            str(number % USERS), random.choice(products), 1, PRICE), operations),
+        "create_order": throughput(lambda number: database.create_order(
+            str(number % USERS), PRICE * 2, items), operations),
+        "get_cart": throughput(lambda number: database.get_cart(str(number % USERS)), operations),
+        "get_order_by_id": throughput(
+            lambda number: database.get_order_by_id(str(number % operations + 1)), operations),
+    }
+    database.engine.dispose()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--profiles", nargs="+", default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    parser.add_argument("--remote-ms", type=float, default=50,
+                        help="assumed round trip to a remote database such as Firestore, in milliseconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {profile: measure(profile, directory, args.operations) for profile in args.profiles}
+
+    remote = 1000 / args.remote_ms
+    print(f"{'operation':<18}" + "".join(f"{f'{profile} op/s':>16}{'ms':>8}" for profile in args.profiles) +
+          f"{f'vs {args.remote_ms:g}ms remote':>22}")
+    for name in results[args.profiles[0]]:
+        row = f"{name:<18}"
+        for profile in args.profiles:
+            row += f"{results[profile][name]:>16.0f}{1000 / results[profile][name]:>8.3f}"
+        best = max(results[profile][name] for profile in args.profiles)
+        print(row + f"{best / remote:>21.0f}x")
+
+    if {"default", "tuned"} <= set(args.profiles):
+        for name in ("add_to_cart", "create_order"):
+            if results["tuned"][name] <= results["default"][name]:
+                print(f"The tuned profile is not faster than the default one at {name}")
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
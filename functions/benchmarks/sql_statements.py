@@ -0,0 +1,116 @@
+"""Counts the SQL statements SqlDb sends for carts and orders of different sizes.
+
+The count of every method has to stay the same however many rows it touches, otherwise it runs
+a query per row. The script exits with status 1 when a count changes with the number of rows or
+goes over its budget.
+
+    python -m benchmarks.sql_statements --rows 1 10 100
+"""
+
+import argparse
+import os
+import sys
+from typing import Callable
+
+os.environ.setdefault("API_KEY", "benchmark")
+
+# pylint: disable = wrong-import-position
+from sqlalchemy import event
+
+from data.DatabaseInterface import CartItem
+from data.SqlDb import SqlDb
+from data.money import Money
+
+USER = "1"
+PRICE = Money.parse("25.50")
+
+# most statements each method may send
+BUDGETS = {
+    "get_cart": 2,
+    "get_cart_items": 1,
+    "remove_item_from_cart": 4,
+    "get_orders": 2,
+    "get_order_by_id": 2,
+    "create_order": 2,
+    "place_order": 6,
+}
+
+
+def seed(rows: int) -> SqlDb:
+    """Creates an in-memory database with a cart of `rows` items and `rows` orders of `rows` items"""
+    database = SqlDb("sqlite://")
+    with database.batch():
+        database.create_new_user(USER, "Ama Mensah")
+        for number in range(rows):
+            database.create_product(f"Product {number}", PRICE, "", "")
+    products = database.get_products()
+    with database.batch():
+        for product in products:
+            database.add_to_cart(USER, product.id_, 1, PRICE)
+    items = [CartItem(product, 1) for product in products]
+    for _ in range(rows):
+        database.create_order(USER, PRICE * rows, items)
+    return database
+
+
+def calls(database: SqlDb, rows: int) -> dict[str, Callable[[], object]]:
+    """The calls to count, in an order where each leaves what the next one needs"""
+    items = [CartItem(product, 1) for product in database.get_products()]
+    return {
+        "get_cart": lambda: database.get_cart(USER),
+        "get_cart_items": lambda: database.get_cart_items(USER),
+        "get_orders": database.get_orders,
+        "get_order_by_id": lambda: database.get_order_by_id("1"),
+        "create_order": lambda: database.create_order(USER, PRICE * rows, items),
+        "place_order": lambda: database.place_order(USER),
+    }
+
+
+def count(database: SqlDb, call: Callable[[], object]) -> int:
+    """Counts the statements a call sends"""
+    statements = 0
+
+    def before_cursor_execute(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def measure(rows: int) -> dict[str, int]:
+    """Counts the statements of every method for a given number of rows"""
+    database = seed(rows)
+    counts = {name: count(database, call) for name, call in calls(database, rows).items()}
+
+    # place_order empties the cart, removing items is counted on a cart of its own
+    database = seed(rows)
+    item = database.get_cart(USER)["products"][0]
+    counts["remove_item_from_cart"] = count(database, lambda: database.remove_item_from_cart(USER, item))
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    results = {rows: measure(rows) for rows in args.rows}
+
+    print(f"{'method':<24}" + "".join(f"{f'{rows} rows':>10}" for rows in args.rows) + f"{'budget':>8}")
+    failed = False
+    for name, budget in BUDGETS.items():
+        counts = [results[rows][name] for rows in args.rows]
+        ok = len(set(counts)) == 1 and counts[0] <= budget
+        failed = failed or not ok
+        print(f"{name:<24}" + "".join(f"{statements:>10}" for statements in counts) +
+              f"{budget:>8}" + ("" if ok else "  FAIL"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Measures how long it takes to import the cloud function and the bot.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so the numbers match a cold
+start. The median import time of every module is reported with the top-level packages that
+contributed most to it, and the script exits with status 1 when a module is over its budget.
+
+    python -m benchmarks.startup --runs 5 --budget main=1500 --budget bot=1000
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# milliseconds
+DEFAULT_BUDGETS = {
+    "main": 2000,
+    "bot": 1500,
+}
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Imports a module in a new interpreter
+
+    Args:
+        module (str): The module to import
+
+    Returns:
+        dict[str, int]: Self import time in microseconds of every module that was loaded
+    """
+    env = {**os.environ, "API_KEY": os.environ.get("API_KEY", "benchmark")}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=FUNCTIONS_DIR, env=env, capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(self_us)
+    return times
+
+
+def breakdown(times: dict[str, int]) -> dict[str, int]:
+    """Groups import times by top-level package"""
+    packages: dict[str, int] = defaultdict(int)
+    for name, self_us in times.items():
+        packages[name.split(".")[0]] += self_us
+    return packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of packages to show per module")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="maximum median import time of a module")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for budget in args.budget:
+        module, _, milliseconds = budget.partition("=")
+        budgets[module] = int(milliseconds)
+
+    over_budget = []
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        totals = [sum(times.values()) / 1000 for times in runs]
+        median = statistics.median(totals)
+        budget = budgets.get(module)
+
+        print(f"{module}: median {median:.1f} ms, min {min(totals):.1f} ms, "
+              f"max {max(totals):.1f} ms over {args.runs} runs"
+              + (f" (budget {budget} ms)" if budget else ""))
+
+        packages: dict[str, list[int]] = defaultdict(list)
+        for times in runs:
+            for package, self_us in breakdown(times).items():
+                packages[package].append(self_us)
+        ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]),
+                        reverse=True)
+        for package, samples in ranked[:args.top]:
+            print(f"    {package:<30} {statistics.median(samples) / 1000:8.1f} ms")
+
+        if budget and median > budget:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Reports the database round trips of every step of the purchase flow, with and without the
+unit of work.
+
+It also handles two updates on separate threads, the second beginning and ending while the first
+is still open, and exits with status 1 if either update lost or sent the other's writes.
+
+    python -m benchmarks.unit_of_work
+"""
+
+import sys
+import threading
+
+from telebot import types
+
+from benchmarks import fakes
+
+import bot  # pylint: disable = wrong-import-order
+from conversation import DatabaseStateStore
+from data.unit_of_work import UnitOfWork
+
+CHAT_ID = 1000
+
+FLOW = [
+    ("start", {"text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}),
+    ("make_purchase", "make_purchase"),
+    ("product_selection", "product_selection_1"),
+    ("quantity_selection", {"text": "2"}),
+    ("add_to_cart", {"text": "Yes"}),
+    ("checkout", "checkout"),
+    ("phone_number", {"text": "0201234567", "reply_to": "Please enter your phone number"}),
+    ("address", {"text": "1 Main Street, Accra", "reply_to": "Please enter your address"}),
+    ("name", {"text": "Ama Mensah", "reply_to": "Please enter your name"}),
+    ("confirm_order", {"text": "Proceed"}),
+]
+
+
+def message(message_id: int, text: str, reply_to: str | None = None, entities=None, chat_id: int = CHAT_ID) -> dict:
+    """Builds a message sent by the benchmark's user"""
+    payload = {"message_id": message_id, "date": 0, "text": text,
+               "chat": {"id": chat_id, "type": "private"},
+               "from": {"id": chat_id, "is_bot": False, "first_name": "Ama", "last_name": "Mensah"}}
+    if entities:
+        payload["entities"] = entities
+    if reply_to:
+        payload["reply_to_message"] = {"message_id": message_id - 1, "date": 0, "text": reply_to,
+                                       "chat": {"id": chat_id, "type": "private"}}
+    return payload
+
+
+def update(update_id: int, step, chat_id: int = CHAT_ID) -> types.Update:
+    """Builds the update of a step of the flow"""
+    if isinstance(step, str):
+        return types.Update.de_json({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": step,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Ama"},
+            "message": message(update_id, "menu", chat_id=chat_id)}})
+    return types.Update.de_json({"update_id": update_id, "message": message(update_id, chat_id=chat_id, **step)})
+
+
+def run_flow(database: fakes.FakeDb, wrap: bool) -> dict[str, int]:
+    """Runs the purchase flow, returning the round trips of every step"""
+    bot.db = UnitOfWork(database) if wrap else database
+    bot.conversations.store = DatabaseStateStore(bot.db)
+
+    round_trips = {}
+    for update_id, (name, step) in enumerate(FLOW, start=1):
+        database.reset_counts()
+        bot.bot.process_new_updates([update(update_id, step)])
+        round_trips[name] = database.round_trips
+    return round_trips
+
+
+def check_interleaved_updates() -> list[str]:
+    """Handles two updates at once on one unit of work, returning what went wrong"""
+    database = fakes.FakeDb()
+    database.create_product("Shea Butter", fakes.Money.parse("25.50"), "500g tub", "shea.png")
+    product = database.get_products()[0]
+    db = UnitOfWork(database)
+    first_began, second_ended = threading.Event(), threading.Event()
+    failures = []
+
+    def first():
+        db.begin_update()
+        db.create_order_in_progress("1", product)
+        first_began.set()
+        second_ended.wait(5)
+        if database.get_order_in_progress("1") is not None:
+            failures.append("The second update sent the first update's writes")
+        if db.get_order_in_progress("1") is None:
+            failures.append("The first update forgot its own write")
+        db.end_update()
+
+    def second():
+        first_began.wait(5)
+        db.begin_update()
+        if db.get_order_in_progress("1") is not None:
+            failures.append("The second update saw the first update's write before it was sent")
+        db.create_order_in_progress("2", product)
+        db.end_update()
+        second_ended.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for user_id in ("1", "2"):
+        if database.get_order_in_progress(user_id) is None:
+            failures.append(f"The write of update {user_id} was lost")
+    return failures
+
+
+def main() -> int:
+    fakes.FakeTelegram().install()
+
+    results = {}
+    for wrap in (False, True):
+        database = fakes.FakeDb()
+        database.create_product("Shea Butter", fakes.Money.parse("25.50"), "500g tub", "shea.png")
+        results[wrap] = run_flow(database, wrap)
+
+    print(f"{'step':<20}{'direct':>8}{'unit of work':>14}{'saved':>8}")
+    for name, _ in FLOW:
+        direct, wrapped = results[False][name], results[True][name]
+        print(f"{name:<20}{direct:>8}{wrapped:>14}{direct - wrapped:>8}")
+    direct, wrapped = sum(results[False].values()), sum(results[True].values())
+    print(f"{'total':<20}{direct:>8}{wrapped:>14}{direct - wrapped:>8}")
+
+    failures = check_interleaved_updates()
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,45 +4,90 @@
 
 # pylint: disable = missing-function-docstring, line-too-long
 
-import decimal
 import logging
+import sys
 
 import telebot
 
 import config
-from data.DatabaseInterface import DatabaseFactory
-from data.firestore import Firestore
-from media_handler import FirebaseStorage, MediaHandlerFactory
-
-db = DatabaseFactory(Firestore).get_database()
-media_handler = MediaHandlerFactory(FirebaseStorage).get_handler()
-
-if not config.API_KEY:
-    raise ValueError("API_KEY is not set")
-
-# Firebase does not support threading for cloud functions
-bot = telebot.TeleBot(token=config.API_KEY, threaded=False)
+import views
+from data.DatabaseInterface import Product
+from conversation import Conversations, get_state_store
+from data.unit_of_work import UnitOfWork
+from db import get_db, get_media_handler
+from middleware import UpdateMiddleware
+from navigation import NavigationTracker
+from router import Router
+from sender import create_sender
+from tasks import get_task_queue
+
+database = get_db(config.DB_TYPE)
+# reads are remembered and writes batched for the duration of each update
+db = UnitOfWork(database)
+media_handler = get_media_handler(config.MEDIA_TYPE)
+
+bot = create_sender(use_class_middlewares=True)
 
 logger = telebot.logger
 telebot.logger.setLevel(logging.DEBUG)
 
-step = {}
+conversations = Conversations(get_state_store(config.STATE_STORE, db))
+# importing the bot starts nothing: the tracker's queue thread, timer and shutdown hooks are set up
+# when it records its first event
+navigation = NavigationTracker(
+    database, get_task_queue("sync" if config.NAVIGATION_FLUSH_INTERVAL == 0 else "deferred"),
+    mode=config.NAVIGATION_TRACKING, sample_rate=config.NAVIGATION_SAMPLE_RATE,
+    flush_interval=config.NAVIGATION_FLUSH_INTERVAL, batch_size=config.NAVIGATION_BATCH_SIZE,
+    flush_at_shutdown=True)
+bot.setup_middleware(UpdateMiddleware(
+    begin=[lambda chat_id: db.begin_update(), conversations.begin],
+    end=[conversations.end, lambda: db.end_update(), navigation.end_update]))
+
+# Telegram file_ids of product photos keyed by product ID, along with the image
+# path they were uploaded from so that a changed image is uploaded again.
+photo_ids: dict[str, tuple[str, str]] = {}
 
 
 def modify_step(chat_id, new_step, reset=False):
-    chat_id = str(chat_id)
+    conversations.advance(str(chat_id), new_step, reset)
 
-    if chat_id not in step:
-        step[chat_id] = {"current": "", "path": []}
 
-    if reset:
-        step[chat_id] = {"current": "", "path": []}
-        step[chat_id]["path"].append(new_step)
-        step[chat_id]["current"] = new_step
-        return
+def current_step(message: telebot.types.Message) -> str:
+    return conversations.current(str(message.chat.id))
+
 
-    step[chat_id]["current"] = new_step
-    step[chat_id]["path"].append(new_step)
+router = Router(current_step)
+
+
+def send_product_photo(chat_id, product: Product, caption: str, reply_markup):
+    """
+    Sends a product's photo, reusing the file_id Telegram returned the last time it was sent.
+
+    Parameters:
+    - chat_id: The ID of the chat.
+    - product (Product): The product whose image is sent.
+    - caption (str): The caption of the photo.
+    - reply_markup: The markup attached to the photo.
+
+    Returns:
+    None
+    """
+
+    cached = photo_ids.get(product.id_)
+    if cached is not None and cached[0] == product.image:
+        try:
+            bot.send_photo(chat_id, cached[1], caption=caption,
+                           reply_markup=reply_markup)
+            return
+        except telebot.apihelper.ApiTelegramException:
+            logger.warning("Cached photo for product %s was rejected", product.id_)
+
+    photo_ids.pop(product.id_, None)
+    image = media_handler.download(product.image)
+    message = bot.send_photo(chat_id, image, caption=caption,
+                             reply_markup=reply_markup)
+    if message.photo:
+        photo_ids[product.id_] = (product.image, message.photo[-1].file_id)
 
 
 def display_main_menu(chat_id: str, text: str):
@@ -57,17 +102,7 @@ def display_main_menu(chat_id: str, text: str):
     None
     """
 
-    # menu_markup = telebot.types.ReplyKeyboardMarkup(
-    #     resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Select An Option", row_width=2)
-    menu_markup = telebot.types.InlineKeyboardMarkup()
-    menu_markup.add(telebot.types.InlineKeyboardButton(
-        "Make A Purchase", callback_data="make_purchase"),
-        telebot.types.InlineKeyboardButton(
-            "View Cart", callback_data="view_cart"),
-        telebot.types.InlineKeyboardButton(
-            "Checkout", callback_data="checkout"))
-
-    bot.send_message(chat_id=chat_id, text=text, reply_markup=menu_markup)
+    bot.send_message(chat_id=chat_id, text=text, reply_markup=views.main_menu_markup())
 
 
 def display_products(chat_id: str):
@@ -81,21 +116,11 @@ def display_products(chat_id: str):
     None
     """
 
-    products_markup = telebot.types.InlineKeyboardMarkup()
-
-    for product in db.get_products():
-        products_markup.add(telebot.types.InlineKeyboardButton(
-            product.name, callback_data=f"product_selection_{product.id_}"))
-
-    products_markup.add(telebot.types.InlineKeyboardButton(
-        "Main Menu", callback_data="main_menu"),
-        telebot.types.InlineKeyboardButton("Checkout", callback_data="checkout"))
+    products_markup = views.products_markup(db.get_products())
 
-    text = "Hello, what would you like to purchase?\nSelect a product from the list below"
+    navigation.record(chat_id, "display_products")
 
-    db.update_user_navigation(chat_id, "display_products")
-
-    bot.send_message(chat_id=chat_id, text=text, reply_markup=products_markup)
+    bot.send_message(chat_id=chat_id, text=views.PRODUCTS, reply_markup=products_markup)
 
 
 def display_cart(chat_id: str):
@@ -109,21 +134,10 @@ def display_cart(chat_id: str):
         None
     """
 
-    cart = db.get_cart(chat_id)
-
-    if not cart['products']:
-        text = "Your cart is empty"
-        bot.send_message(chat_id=chat_id, text=text)
-        return
+    bot.send_message(chat_id=int(chat_id), text=views.cart_text(db.get_cart(chat_id)))
 
-    text = f"Total Cost: {cart['total_cost']}\n\n"
-    for cart_item in cart["products"]:
-        text += f"Product: {cart_item.product.name}\nQuantity: {cart_item.quantity}\n\n"
 
-    bot.send_message(chat_id=int(chat_id), text=text)
-
-
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def start_handler(message: telebot.types.Message):
     """
     Handles the start command from the user.
@@ -135,16 +149,15 @@ def start_handler(message: telebot.types.Message):
         None
     """
 
-    if db.get_user_by_id(str(message.chat.id)) is None:
-        fullname = f"{message.from_user.first_name} {message.from_user.last_name if message.from_user.last_name else ''}"
-        db.create_new_user(str(message.chat.id), display_name=fullname)
+    fullname = f"{message.from_user.first_name} {message.from_user.last_name if message.from_user.last_name else ''}"
+    db.create_user_if_absent(str(message.chat.id), display_name=fullname)
 
     text = f"Hello {message.from_user.first_name}, welcome to our store.\n\nWhat would you like to do?"
 
     display_main_menu(str(message.chat.id), text)
 
 
-@bot.message_handler(commands=['cancel'])
+@router.command('cancel')
 def cancel_handler(message: telebot.types.Message):
     """
     Handles the cancel command from the user.
@@ -152,10 +165,10 @@ def cancel_handler(message: telebot.types.Message):
     Args:
         message (telebot.types.Message): The message object received from the user.
     """
-    display_main_menu(str(message.chat.id), "What would you like to do next?")
+    display_main_menu(str(message.chat.id), views.NEXT)
 
 
-@bot.message_handler(commands=['help'])
+@router.command('help')
 def send_welcome(message: telebot.types.Message):
     """
     Sends a welcome message to the user.
@@ -169,7 +182,7 @@ def send_welcome(message: telebot.types.Message):
     bot.reply_to(message, "Howdy, how are you doing?")
 
 
-@bot.message_handler(func=lambda message: message.text == "Make A Purchase")
+@router.text("Make A Purchase")
 def make_purchase_handler(message: telebot.types.Message):
     """
     Handles the logic for making a purchase.
@@ -180,11 +193,11 @@ def make_purchase_handler(message: telebot.types.Message):
     Returns:
         None
     """
-    db.update_user_navigation(str(message.chat.id), "make_purchase")
+    navigation.record(str(message.chat.id), "make_purchase")
     display_products(str(message.chat.id))
 
 
-@bot.message_handler(func=lambda message: message.text in ("Checkout", "Proceed To Checkout"))
+@router.text("Checkout", "Proceed To Checkout")
 def checkout_handler(message: telebot.types.Message):
     """
     Handles the checkout process for the user.
@@ -196,33 +209,26 @@ def checkout_handler(message: telebot.types.Message):
         None
     """
 
-    db.update_user_navigation(str(message.chat.id), "checkout")
+    navigation.record(str(message.chat.id), "checkout")
     cart = db.get_cart(str(message.chat.id))
 
     if not cart['products']:
-        text = "Your cart is empty"
-        display_main_menu(str(message.chat.id), text)
+        display_main_menu(str(message.chat.id), views.CART_EMPTY)
         return
     user = db.get_user_by_id(str(message.chat.id))
 
     if not user:
-        bot.send_message(chat_id=message.chat.id,
-                         text="An error occurred, please try again")
-        display_main_menu(str(message.chat.id),
-                          "What would you like to do next?")
+        bot.send_message(chat_id=message.chat.id, text=views.ERROR)
+        display_main_menu(str(message.chat.id), views.NEXT)
         return
 
-    text = "Please enter your phone number to proceed with payment\n\nFormat: 0201234567"
-    db.update_user_navigation(str(message.chat.id), "phone_number")
-
-    reply_markup = telebot.types.ForceReply(
-        input_field_placeholder="Enter Phone Number")
+    navigation.record(str(message.chat.id), "phone_number")
 
-    bot.send_message(chat_id=message.chat.id, text=text,
-                     reply_markup=reply_markup)
+    bot.send_message(chat_id=message.chat.id, text=views.PHONE_PROMPT,
+                     reply_markup=views.prompt_markup("Enter Phone Number"))
 
 
-@bot.message_handler(func=lambda message: message.text == "View Cart")
+@router.text("View Cart")
 def view_cart_handler(message: telebot.types.Message):
     """
     Handles the view cart functionality.
@@ -231,7 +237,7 @@ def view_cart_handler(message: telebot.types.Message):
         message (telebot.types.Message): The message object received from the user.
     """
 
-    db.update_user_navigation(str(message.chat.id), "view_cart")
+    navigation.record(str(message.chat.id), "view_cart")
 
     reply_markup = telebot.types.ReplyKeyboardMarkup(
         resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Select An Option", row_width=1)
@@ -239,10 +245,10 @@ def view_cart_handler(message: telebot.types.Message):
 
     reply_markup.add("Proceed To Checkout")
     display_cart(str(message.chat.id))
-    display_main_menu(str(message.chat.id), "What would you like to do next?")
+    display_main_menu(str(message.chat.id), views.NEXT)
 
 
-@bot.message_handler(func=lambda message: message.text == "Main Menu")
+@router.text("Main Menu")
 def main_menu_handler(message: telebot.types.Message):
     """
     Handles the main menu functionality.
@@ -250,12 +256,10 @@ def main_menu_handler(message: telebot.types.Message):
     Args:
         message (telebot.types.Message): The incoming message object.
     """
-    display_main_menu(str(message.chat.id), "What would you like to do next?")
+    display_main_menu(str(message.chat.id), views.NEXT)
 
 
-@bot.message_handler(
-    func=lambda message: message.text and step.get(str(message.chat.id)) and step[str(message.chat.id)][
-        "current"] == "display_products")
+@router.state("display_products", when=bool)
 def product_selection_handler(message: telebot.types.Message):
     """
     Handles the selection of a product by the user.
@@ -269,34 +273,20 @@ def product_selection_handler(message: telebot.types.Message):
 
     if message.text is None:
         return
-    print(message.text)
     products = db.get_products_by_name(message.text)
-    print(products)
     if not products:
-        bot.send_message(chat_id=message.chat.id,
-                         text="Product not found, please try again")
+        bot.send_message(chat_id=message.chat.id, text=views.PRODUCT_NOT_FOUND)
         return
     product = products[0]
 
-    reply = f"Product: {message.text}\nPrice: {product.price}\n\nHow many would you like to purchase?"
-
-    image = media_handler.download(product.image)
-
-    quantity_markup = telebot.types.ReplyKeyboardMarkup(
-        resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Enter Quantity", row_width=3)
-    quantity_markup.add(*[str(i) for i in range(1, 11)], "Back")
-
     modify_step(str(message.chat.id), "product_selection")
 
     db.create_order_in_progress(str(message.chat.id), product)
 
-    bot.send_photo(message.chat.id, image, caption=reply,
-                   reply_markup=quantity_markup)
+    send_product_photo(message.chat.id, product, views.product_text(product), views.quantity_markup())
 
 
-@bot.message_handler(
-    func=lambda message: message.text.isdecimal() and step.get(str(message.chat.id)) and step[str(message.chat.id)][
-        "current"] == "product_selection")
+@router.state("product_selection", when=str.isdecimal)
 def quantity_selection_handler(message: telebot.types.Message):
     if message.text is None:
         return
@@ -307,42 +297,30 @@ def quantity_selection_handler(message: telebot.types.Message):
     db.update_order_in_progress(chat_id, quantity=int(message.text))
     orders_in_progress = db.get_order_in_progress(chat_id)
     if not orders_in_progress:
-        bot.send_message(chat_id=message.chat.id,
-                         text="An error occurred, please try again")
-        display_main_menu(str(message.chat.id),
-                          "What would you like to do next?")
+        bot.send_message(chat_id=message.chat.id, text=views.ERROR)
+        display_main_menu(str(message.chat.id), views.NEXT)
         return
 
-    total_cost = int(message.text) * \
-        decimal.Decimal(orders_in_progress.product.price)
-
-    text = f"{orders_in_progress.product.name}\nQuantity: {message.text}\nTotal Cost: {total_cost}\n\nWould you like to add this to your cart?"
-
-    reply_markup = telebot.types.ReplyKeyboardMarkup(
-        resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Select An Option")
-    reply_markup.row("Yes", "No")
-    reply_markup.row("Back")
+    text = views.order_in_progress_text(orders_in_progress, int(message.text))
 
     bot.send_message(chat_id=message.chat.id, text=text,
-                     reply_markup=reply_markup)
+                     reply_markup=views.yes_no_markup())
 
 
-@bot.message_handler(func=lambda message: message.text == "Yes" or message.text == "No" and step[str(message.chat.id)][
-    "current"] == "quantity_selection")
+@router.text("Yes")
+@router.text("No", state="quantity_selection")
 def add_to_cart_handler(message: telebot.types.Message):
     chat_id = str(message.chat.id)
 
     if message.text == "Yes":
         orders_in_progress = db.get_order_in_progress(chat_id)
         if not orders_in_progress:
-            bot.send_message(chat_id=message.chat.id,
-                             text="An error occurred, please try again")
-            display_main_menu(
-                str(message.chat.id), "What would you like to do next?")
+            bot.send_message(chat_id=message.chat.id, text=views.ERROR)
+            display_main_menu(str(message.chat.id), views.NEXT)
             return
 
         db.add_to_cart(chat_id, orders_in_progress.product.id_,
-                       orders_in_progress.quantity, decimal.Decimal(0))
+                       orders_in_progress.quantity, orders_in_progress.product.price)
 
         text = "Product added to cart"
 
@@ -358,15 +336,13 @@ def add_to_cart_handler(message: telebot.types.Message):
         str(message.chat.id), text="What would you like to do next?\nSelect checkout to proceed with payment")
 
 
-@bot.message_handler(
-    func=lambda message: message.text == "Back" and step[str(message.chat.id)]["current"] == "product_selection")
+@router.text("Back", state="product_selection")
 def quantity_selection_back_handler(message: telebot.types.Message):
     db.remove_order_in_progress(str(message.chat.id))
     display_products(str(message.chat.id))
 
 
-@bot.message_handler(
-    func=lambda message: message.text and message.reply_to_message and ("phone" in message.reply_to_message.text.lower()))
+@router.reply("phone")
 def phone_number_handler(message: telebot.types.Message):
     chat_id = str(message.chat.id)
     phone = message.text
@@ -374,22 +350,17 @@ def phone_number_handler(message: telebot.types.Message):
         return
 
     if len(phone) != 10 or not phone.isdecimal():
-        text = "Please enter a valid phone number\n\nFormat: 0201234567"
-        bot.send_message(chat_id=message.chat.id, text=text)
+        bot.send_message(chat_id=message.chat.id, text=views.INVALID_PHONE)
         return
 
     db.update_user(chat_id, phone=phone)
 
     modify_step(str(message.chat.id), "address")
-    text = "Please enter your address\n\nFormat: 1234 Street Name, City, Region\n\nExample: 1234 Street Name, Accra, Greater Accra"
-    reply_markup = telebot.types.ForceReply(
-        input_field_placeholder="Enter Address")
-    bot.send_message(chat_id=message.chat.id, text=text,
-                     reply_markup=reply_markup)
+    bot.send_message(chat_id=message.chat.id, text=views.ADDRESS_PROMPT,
+                     reply_markup=views.prompt_markup("Enter Address"))
 
 
-@bot.message_handler(
-    func=lambda message: message.text and message.reply_to_message and ("address" in message.reply_to_message.text.lower()))
+@router.reply("address")
 def address_handler(message: telebot.types.Message):
     chat_id = str(message.chat.id)
 
@@ -400,15 +371,11 @@ def address_handler(message: telebot.types.Message):
 
     db.update_user(chat_id, address=address)
 
-    text = "Please enter your name\n\nFormat: First Name Last Name\n\nExample: John Doe"
-    reply_markup = telebot.types.ForceReply(
-        input_field_placeholder="Enter Name")
-    bot.send_message(chat_id=message.chat.id, text=text,
-                     reply_markup=reply_markup)
+    bot.send_message(chat_id=message.chat.id, text=views.NAME_PROMPT,
+                     reply_markup=views.prompt_markup("Enter Name"))
 
 
-@bot.message_handler(
-    func=lambda message: message.text and message.reply_to_message and ("name" in message.reply_to_message.text.lower()))
+@router.reply("name")
 def name_handler(message: telebot.types.Message):
     if message.text is None:
         return
@@ -416,51 +383,41 @@ def name_handler(message: telebot.types.Message):
     chat_id = str(message.chat.id)
     name = message.text
 
-    user = db.update_user(chat_id, display_name=name)
+    # in an update the change is collected without reading the user, which is read here instead
+    user = db.update_user(chat_id, display_name=name) or db.get_user_by_id(chat_id)
+    if not user:
+        bot.send_message(chat_id=message.chat.id, text=views.ERROR)
+        display_main_menu(chat_id, views.NEXT)
+        return
 
     text = "Your order of"
     bot.send_message(chat_id=message.chat.id, text=text)
     display_cart(str(message.chat.id))
-    text = f"will be delivered to\n\n{user.display_name}\n\n{user.address}\n\n{user.phone}\n\nPlease confirm your order"
-    bot.send_message(chat_id=message.chat.id, text=text)
-    text = "Due to current limitations, we only accept cash payments." \
-           "Once you confirm your order, you will be contacted by our delivery agent to arrange payment and delivery."
-
-    reply_markup = telebot.types.InlineKeyboardMarkup()
-    reply_markup.add(telebot.types.InlineKeyboardButton(
-        "Confirm Order", callback_data="confirm_order"))
-    reply_markup.add(telebot.types.InlineKeyboardButton(
-        "Cancel Order", callback_data="cancel_order"))
+    bot.send_message(chat_id=message.chat.id, text=views.delivery_text(user))
 
     modify_step(str(message.chat.id), "confirm_order")
-    bot.send_message(chat_id=message.chat.id, text=text,
-                     reply_markup=reply_markup)
+    bot.send_message(chat_id=message.chat.id, text=views.CASH_ONLY,
+                     reply_markup=views.confirm_order_markup())
 
 
-@bot.message_handler(func=lambda message: message.text == "Cancel Order" and step.get(str(message.chat.id)) and step[str(message.chat.id)][
-    "current"] == "confirm_order")
+@router.text("Cancel Order", state="confirm_order")
 def cancel_order_handler(message: telebot.types.Message):
     db.remove_order_in_progress(str(message.chat.id))
-    display_main_menu(str(message.chat.id), "What would you like to do next?")
+    display_main_menu(str(message.chat.id), views.NEXT)
 
 
-@bot.message_handler(
-    func=lambda message: message.text == "Proceed" and step.get(str(message.chat.id)) and step[str(message.chat.id)][
-        "current"] == "confirm_order")
+@router.text("Proceed", state="confirm_order")
 def confirm_order_handler(message: telebot.types.Message):
-    cart = db.get_cart(str(message.chat.id))
-    order_id = db.create_order(
-        str(message.chat.id), cart["total_cost"], db.get_cart_items(str(message.chat.id)))
-    text = f"Your order with ID {order_id[:5]} is being processed. You will be contacted by our delivery agent shortly."
-
-    for product in cart["products"]:
-        db.remove_item_from_cart(str(message.chat.id), product)
+    order_id = db.place_order(str(message.chat.id))
+    if order_id is None:
+        display_main_menu(str(message.chat.id), "Your cart is empty")
+        return
 
-    bot.send_message(chat_id=message.chat.id, text=text)
-    display_main_menu(str(message.chat.id), "What would you like to do next?")
+    bot.send_message(chat_id=message.chat.id, text=views.order_placed_text(order_id))
+    display_main_menu(str(message.chat.id), views.NEXT)
 
 
-@bot.message_handler(commands=['admin_login'], func=lambda message: message.text == config.ADMIN_PASSWORD)
+@router.command('admin_login', when=lambda text: text == config.ADMIN_PASSWORD)
 def register_chat_as_admin(message: telebot.types.Message):
     """
     Registers a chat as an admin chat.
@@ -478,7 +435,7 @@ def register_chat_as_admin(message: telebot.types.Message):
     bot.send_message(chat_id=message.chat.id, text=text)
 
 
-@bot.message_handler(commands=['admin_login'], func=lambda message: message.text != config.ADMIN_PASSWORD)
+@router.command('admin_login', when=lambda text: text != config.ADMIN_PASSWORD)
 def register_chat_as_admin_incorrect_password(message: telebot.types.Message):
     """
     Registers a chat as an admin chat.
@@ -494,7 +451,7 @@ def register_chat_as_admin_incorrect_password(message: telebot.types.Message):
     bot.send_message(chat_id=message.chat.id, text=text)
 
 
-@bot.message_handler(commands=['admin_logout'], func=lambda message: message.text == config.ADMIN_PASSWORD)
+@router.command('admin_logout', when=lambda text: text == config.ADMIN_PASSWORD)
 def unregister_chat_as_admin(message: telebot.types.Message):
     """
     Unregisters a chat as an admin chat.
@@ -514,12 +471,18 @@ def unregister_chat_as_admin(message: telebot.types.Message):
 # catch all handler
 
 
-@bot.message_handler(func=lambda m: True)
+@router.fallback
 def default_handler(message: telebot.types.Message):
     text = "Sorry, I didn't understand that command.\n\nPlease select an option from the menu below."
     display_main_menu(str(message.chat.id), text)
 
 
+# every text message goes through the router, which finds its handler with a few dict lookups
+@bot.message_handler(func=lambda message: True)
+def route_message(message: telebot.types.Message):
+    router.dispatch(message)
+
+
 handlers = {
     "start": start_handler,
     "help": send_welcome,
@@ -552,38 +515,37 @@ def callback_query(query: telebot.types.CallbackQuery):
             product_id = x.split("_")[2]
             product = db.get_product_by_id(product_id)
             if product is None:
-                bot.send_message(chat_id=query.message.chat.id,
-                                 text="Product not found, please try again")
+                bot.send_message(chat_id=query.message.chat.id, text=views.PRODUCT_NOT_FOUND)
                 return
 
-            reply = f"Product: {product.name}\nPrice: {product.price}\n\nHow many would you like to purchase?"
-
-            image = media_handler.download(product.image)
-
-            quantity_markup = telebot.types.ReplyKeyboardMarkup(
-                resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Enter Quantity", row_width=3)
-            quantity_markup.add(*[str(i) for i in range(1, 11)], "Back")
-
             modify_step(str(query.message.chat.id), "product_selection")
 
             db.create_order_in_progress(
                 str(query.message.chat.id), product)
 
-            bot.send_photo(query.message.chat.id, image, caption=reply,
-                           reply_markup=quantity_markup)
+            send_product_photo(query.message.chat.id, product,
+                               views.product_text(product), views.quantity_markup())
         case _:
-            bot.send_message(chat_id=query.message.chat.id,
-                             text="An error occurred, please try again")
+            bot.send_message(chat_id=query.message.chat.id, text=views.ERROR)
 
     bot.edit_message_reply_markup(
         query.message.chat.id, message_id=query.message.id, reply_markup=None)
     bot.answer_callback_query(query.id)
 
 
-if config.ENV == "development":
-    bot.remove_webhook()
-    bot.polling()
-else:
+def register_webhook():
+    """
+    Points the bot's webhook at config.WEBHOOK_URL if it is not already set.
+    Run `python bot.py set_webhook` when deploying instead of doing this on every cold start.
+    """
     if bot.get_webhook_info().url != config.WEBHOOK_URL:
         bot.delete_webhook()
         bot.set_webhook(config.WEBHOOK_URL)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["set_webhook"]:
+        register_webhook()
+    else:
+        bot.remove_webhook()
+        bot.polling()
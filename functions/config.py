@@ -17,12 +17,68 @@ CLOUDINARY_CLOUD_NAME = getenv('CLOUDINARY_CLOUD_NAME')
 
 FIREBASE_BUCKET_NAME = getenv('FIRESTORE_BUCKET_NAME')
 
-DB_TYPE = getenv('DB_TYPE', "sql")
+DB_TYPE = getenv('DB_TYPE', "firestore")
+MEDIA_TYPE = getenv('MEDIA_TYPE', "firebase")
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 SENTRY_DSN = getenv('SENTRY_DSN')
 
+# used when DB_TYPE is "sql". Each process keeps up to SQL_POOL_SIZE connections open and opens
+# up to SQL_MAX_OVERFLOW more under load, waiting at most SQL_POOL_TIMEOUT seconds for one.
+SQL_URL = getenv('SQL_URL', "sqlite:///db.sqlite3")
+SQL_POOL_SIZE = int(getenv('SQL_POOL_SIZE', '5'))
+SQL_MAX_OVERFLOW = int(getenv('SQL_MAX_OVERFLOW', '10'))
+SQL_POOL_TIMEOUT = float(getenv('SQL_POOL_TIMEOUT', '30'))
+# SQLite connection settings, "tuned" or "default" (see data.SqlDb.SQLITE_PROFILES). SQL_PRAGMAS
+# overrides single PRAGMAs of the profile, e.g. "cache_size=-16384,mmap_size=0".
+SQL_PROFILE = getenv('SQL_PROFILE', "tuned")
+SQL_PRAGMAS = getenv('SQL_PRAGMAS', "")
+# the same database through an async driver, for code running on an event loop (db.get_async_db)
+SQL_ASYNC_URL = getenv('SQL_ASYNC_URL', "sqlite+aiosqlite:///db.sqlite3")
+
+# used when DB_TYPE is "memory". The data is kept in MEMORY_DB_PATH, empty keeps it only in the
+# process, and a snapshot is taken every MEMORY_SNAPSHOT_INTERVAL writes.
+MEMORY_DB_PATH = getenv('MEMORY_DB_PATH', "memory_db")
+MEMORY_SNAPSHOT_INTERVAL = int(getenv('MEMORY_SNAPSHOT_INTERVAL', '1000'))
+
+# ISO 4217 code of the currency prices are in
+CURRENCY = getenv('CURRENCY', "GHS")
+
+CATALOG_CACHE_TTL = int(getenv('CATALOG_CACHE_TTL', '300'))
+CATALOG_CACHE_SIZE = int(getenv('CATALOG_CACHE_SIZE', '256'))
+
+USER_CACHE_TTL = int(getenv('USER_CACHE_TTL', '60'))
+USER_CACHE_SIZE = int(getenv('USER_CACHE_SIZE', '1024'))
+
+PROCESSED_UPDATES_CACHE_SIZE = int(getenv('PROCESSED_UPDATES_CACHE_SIZE', '1024'))
+
+# "sync" processes an update before answering the webhook, "deferred" answers first and
+# processes it on a background thread
+WEBHOOK_MODE = getenv('WEBHOOK_MODE', "sync")
+
+# async_bot.py handles the updates of up to POLLING_WORKERS chats at once, each on a thread of its own
+POLLING_WORKERS = int(getenv('POLLING_WORKERS', '8'))
+
+NOTIFICATION_WORKERS = int(getenv('NOTIFICATION_WORKERS', '8'))
+
+# outbound Telegram calls per second, for the whole bot and for a single chat. A chat can make
+# TELEGRAM_CHAT_BURST calls at once before it is held to its rate, which blocks the update's thread.
+TELEGRAM_GLOBAL_RATE = float(getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_CHAT_BURST = float(getenv('TELEGRAM_CHAT_BURST', '10'))
+
+# "database" shares conversation state between instances, "memory" keeps it in the process
+STATE_STORE = getenv('STATE_STORE', "database")
+
+# navigation history is written in batches. "all" records every user, "sample" a share of them
+# and "off" nobody. Events wait at most NAVIGATION_FLUSH_INTERVAL seconds, 0 writes them when
+# the update ends. Whatever is buffered is also written when the instance shuts down.
+NAVIGATION_TRACKING = getenv('NAVIGATION_TRACKING', "all")
+NAVIGATION_SAMPLE_RATE = float(getenv('NAVIGATION_SAMPLE_RATE', '0.1'))
+NAVIGATION_FLUSH_INTERVAL = float(getenv('NAVIGATION_FLUSH_INTERVAL', '30'))
+NAVIGATION_BATCH_SIZE = int(getenv('NAVIGATION_BATCH_SIZE', '100'))
+
 
 def get_config():
     """
@@ -41,7 +97,34 @@ def get_config():
         'CLOUDINARY_CLOUD_NAME': CLOUDINARY_CLOUD_NAME,
         'FIREBASE_BUCKET_NAME': FIREBASE_BUCKET_NAME,
         'DB_TYPE': DB_TYPE,
+        'MEDIA_TYPE': MEDIA_TYPE,
         'ROOT_DIR': ROOT_DIR,
-        'SENTRY_DSN': SENTRY_DSN
+        'SENTRY_DSN': SENTRY_DSN,
+        'SQL_URL': SQL_URL,
+        'SQL_POOL_SIZE': SQL_POOL_SIZE,
+        'SQL_MAX_OVERFLOW': SQL_MAX_OVERFLOW,
+        'SQL_POOL_TIMEOUT': SQL_POOL_TIMEOUT,
+        'SQL_PROFILE': SQL_PROFILE,
+        'SQL_PRAGMAS': SQL_PRAGMAS,
+        'SQL_ASYNC_URL': SQL_ASYNC_URL,
+        'MEMORY_DB_PATH': MEMORY_DB_PATH,
+        'MEMORY_SNAPSHOT_INTERVAL': MEMORY_SNAPSHOT_INTERVAL,
+        'CURRENCY': CURRENCY,
+        'CATALOG_CACHE_TTL': CATALOG_CACHE_TTL,
+        'CATALOG_CACHE_SIZE': CATALOG_CACHE_SIZE,
+        'USER_CACHE_TTL': USER_CACHE_TTL,
+        'USER_CACHE_SIZE': USER_CACHE_SIZE,
+        'PROCESSED_UPDATES_CACHE_SIZE': PROCESSED_UPDATES_CACHE_SIZE,
+        'WEBHOOK_MODE': WEBHOOK_MODE,
+        'POLLING_WORKERS': POLLING_WORKERS,
+        'NOTIFICATION_WORKERS': NOTIFICATION_WORKERS,
+        'TELEGRAM_GLOBAL_RATE': TELEGRAM_GLOBAL_RATE,
+        'TELEGRAM_CHAT_RATE': TELEGRAM_CHAT_RATE,
+        'TELEGRAM_CHAT_BURST': TELEGRAM_CHAT_BURST,
+        'STATE_STORE': STATE_STORE,
+        'NAVIGATION_TRACKING': NAVIGATION_TRACKING,
+        'NAVIGATION_SAMPLE_RATE': NAVIGATION_SAMPLE_RATE,
+        'NAVIGATION_FLUSH_INTERVAL': NAVIGATION_FLUSH_INTERVAL,
+        'NAVIGATION_BATCH_SIZE': NAVIGATION_BATCH_SIZE
     }
     return config
@@ -0,0 +1,138 @@
+"""Conversation state of every chat.
+
+The step a chat is at decides which handler its next message goes to, so it has to survive
+instance restarts and be shared between instances. A chat's state is read from a StateStore at
+most once per update, every handler filter is answered from that snapshot, and the snapshot is
+written back once after the handlers ran, if it changed.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from data.DatabaseInterface import ConversationState, DBInterface
+
+# how many past steps are kept in a chat's path
+PATH_LENGTH = 20
+
+
+class StateStore(ABC):
+    """Abstract class for conversation state stores"""
+
+    @abstractmethod
+    def load(self, chat_id: str) -> ConversationState:
+        """Reads the state of a chat
+
+        Args:
+            chat_id (str): The chat's ID
+
+        Returns:
+            ConversationState: The chat's state, empty if it has none
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, state: ConversationState):
+        """Writes the state of a chat
+
+        Args:
+            state (ConversationState): The chat's state
+        """
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """Keeps states in the process. They are lost on restart and not shared between instances."""
+
+    def __init__(self):
+        self.states: dict[str, ConversationState] = {}
+
+    def load(self, chat_id: str) -> ConversationState:
+        state = self.states.get(chat_id)
+        if state is None:
+            return ConversationState(chat_id, "", [])
+        return ConversationState(state.chat_id, state.current, list(state.path))
+
+    def save(self, state: ConversationState):
+        self.states[state.chat_id] = state
+
+
+class DatabaseStateStore(StateStore):
+    """Keeps states in the bot's database"""
+
+    def __init__(self, db: DBInterface):
+        self.db = db
+
+    def load(self, chat_id: str) -> ConversationState:
+        return self.db.get_conversation_state(chat_id)
+
+    def save(self, state: ConversationState):
+        self.db.save_conversation_state(state)
+
+
+def get_state_store(store_type: str, db: DBInterface) -> StateStore:
+    """Returns a state store
+
+    Args:
+        store_type (str): "memory" or "database", usually config.STATE_STORE
+        db (DBInterface): The database used by the "database" store
+
+    Returns:
+        StateStore: The state store
+    """
+    match store_type:
+        case "memory":
+            return MemoryStateStore()
+        case "database":
+            return DatabaseStateStore(db)
+    raise ValueError(
+        f"Unknown state store '{store_type}', expected memory or database")
+
+
+class Conversations:
+    """Serves the state of the chat being handled from a snapshot taken once per update"""
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.local = threading.local()
+
+    def begin(self, chat_id: str):
+        """Starts handling an update from a chat. The state is loaded when it is first needed."""
+        self.local.chat_id = chat_id
+        self.local.state = None
+        self.local.dirty = False
+
+    def snapshot(self, chat_id: str) -> ConversationState:
+        """Returns the state of a chat, loading it if this update has not done so yet"""
+        if getattr(self.local, "chat_id", None) != chat_id:
+            self.begin(chat_id)
+        if self.local.state is None:
+            self.local.state = self.store.load(chat_id)
+        return self.local.state
+
+    def current(self, chat_id: str) -> str:
+        """Returns the step a chat is at"""
+        return self.snapshot(chat_id).current
+
+    def advance(self, chat_id: str, new_step: str, reset: bool = False):
+        """Moves a chat to a new step
+
+        Args:
+            chat_id (str): The chat's ID
+            new_step (str): The step the chat moved to
+            reset (bool, optional): Forget the steps taken before. Defaults to False.
+        """
+        state = self.snapshot(chat_id)
+        state.path = [new_step] if reset else (
+            state.path + [new_step])[-PATH_LENGTH:]
+        state.current = new_step
+        self.local.dirty = True
+
+    def end(self):
+        """Finishes handling an update, writing the chat's state back if it changed"""
+        state: Optional[ConversationState] = getattr(self.local, "state", None)
+        if state is not None and self.local.dirty:
+            self.store.save(state)
+        self.local.chat_id = None
+        self.local.state = None
+        self.local.dirty = False
@@ -3,12 +3,14 @@ This module contains the interface for the database.
 """
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 from dataclasses import dataclass
-from decimal import Decimal
 from enum import Enum
 from typing import Type, TypedDict
 
+from .money import Money
+
 
 class OrderState(Enum):
     """
@@ -54,7 +56,7 @@ class Product:
     Attributes:
         id_ (str): The unique identifier of the product.
         name (str): The name of the product.
-        price (str): The price of the product.
+        price (Money): The price of the product.
         description (str): The description of the product.
         image (str): The image URL of the product.
         published (bool): Indicates whether the product is published (True) or not (False).
@@ -62,7 +64,7 @@ class Product:
     """
     id_: str
     name: str
-    price: str
+    price: Money
     description: str
     image: str
     published: bool
@@ -97,7 +99,7 @@ class Cart:
     id_: str
     user_id: str
     items: list[CartItem]
-    total_cost: str
+    total_cost: Money
 
 
 @dataclass
@@ -108,12 +110,12 @@ class OrderItem:
     Attributes:
         product (Product): The product
         quantity (int): The quantity of the product
-        price (str): The price of the product
+        price (Money): The price of the product
     """
     id_: str
     product: Product
     quantity: int
-    price: str
+    price: Money
 
 
 @dataclass
@@ -124,13 +126,13 @@ class Order:
     Attributes:
         id_ (str): The order's ID
         user_id (str): The user's ID
-        total_cost (str): The total cost of the order
+        total_cost (Money): The total cost of the order
         items (list[OrderItem]): The items in the order
         state (OrderState): The order's state
     """
     id_: str
     user: User
-    total_cost: Decimal
+    total_cost: Money
     items: list[OrderItem]
     state: OrderState
 
@@ -164,6 +166,22 @@ class NavigationHistory:
     breadcrumb: list[str]
 
 
+@dataclass
+class ConversationState:
+    """
+    Represents where a chat is in a conversation with the bot.
+
+    Attributes:
+        chat_id (str): The ID of the chat.
+        current (str): The step the chat is at.
+        path (list[str]): The steps the chat went through, ending with the current one.
+    """
+
+    chat_id: str
+    current: str
+    path: list[str]
+
+
 class DBInterface(ABC):
     """
     Interface for the database
@@ -172,6 +190,30 @@ class DBInterface(ABC):
     def __init__(self, *args, **kwargs):
         pass
 
+    def begin_update(self):
+        """
+        Called once before a Telegram update is processed.
+        Implementations can use it to reset any per-update state.
+        """
+
+    def end_update(self):
+        """
+        Called once after the handlers of a Telegram update have run.
+        """
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups the writes made inside the block so they are committed together.
+        Implementations that cannot group writes run them as they are made.
+        """
+        yield
+
+    def invalidate_catalog(self):
+        """
+        Drops any cached products so the next read fetches them from the database.
+        """
+
     @abstractmethod
     def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "", is_admin: int = 0):
         """
@@ -187,6 +229,22 @@ class DBInterface(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "", address: str = "") -> bool:
+        """
+        Creates a user in the database unless one with the same ID exists, without reading it first.
+
+        Args:
+            id_ (str): The unique identifier for the user.
+            display_name (str, optional): The display name of the user. Defaults to "".
+            phone (str, optional): The phone number of the user. Defaults to "".
+            address (str, optional): The address of the user. Defaults to "".
+
+        Returns:
+            bool: True if the user was created, False if it already existed.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_admins(self) -> list[User]:
         """
@@ -211,16 +269,18 @@ class DBInterface(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def update_user(self, id_: str, **kwargs) -> User:
+    def update_user(self, id_: str, **kwargs) -> (User | None):
         """
         Updates the information of a user in the database.
+        Implementations should return the updated user without reading it again. An update collected
+        in a batch may return None instead when the user is not known without a read.
 
         Args:
             id_ (str): The ID of the user.
             **kwargs: Additional keyword arguments representing the updated fields of the user.
 
         Returns:
-            User: The updated user object.
+            User | None: The updated user object, or None if it is not known.
         """
         raise NotImplementedError
 
@@ -248,13 +308,13 @@ class DBInterface(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def create_product(self, name, price: str, description: str, image: str):
+    def create_product(self, name, price: Money, description: str, image: str):
         """
         Creates a new product in the database.
 
         Args:
             name (str): The name of the product.
-            price (str): The price of the product.
+            price (Money): The price of the product.
             description (str): The description of the product.
             image (str): The image URL of the product.
         """
@@ -320,7 +380,7 @@ class DBInterface(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def add_to_cart(self, user_id, product: str, quantity: int, price: Decimal):
+    def add_to_cart(self, user_id, product: str, quantity: int, price: (Money | None)):
         """
         Adds a product to a user's cart.
 
@@ -328,12 +388,13 @@ class DBInterface(ABC):
             user_id (str): The ID of the user.
             product (str): The ID of the product to be added.
             quantity (int): The quantity of the product.
-            price (Decimal): The price of the product.
+            price (Money | None): The price of the product, None for its current price. A zero
+                price is a price.
         """
         raise NotImplementedError
 
     GetCartReturn = TypedDict(
-        "get_cart_return", {"total_cost": Decimal, "products": list[CartItem]})
+        "get_cart_return", {"total_cost": Money, "products": list[CartItem]})
 
     @abstractmethod
     def get_cart(self, user_id: str) -> GetCartReturn:
@@ -344,7 +405,7 @@ class DBInterface(ABC):
             user_id (str): The ID of the user.
 
         Returns:
-            dict[str, Union[Decimal, list[CartItem]]]: A dictionary containing the total cost of the cart and a list of CartItem objects.
+            dict[str, Union[Money, list[CartItem]]]: A dictionary containing the total cost of the cart and a list of CartItem objects.
         """
         raise NotImplementedError
 
@@ -355,10 +416,10 @@ class DBInterface(ABC):
 
         Args:
             user_id (str): The ID of the user.
-            *args (str): The IDs of the items to be removed.
+            item (CartItem): The item to be removed, every item of its product is removed.
 
         Returns:
-            bool: True if the item(s) were successfully removed, False otherwise.
+            bool: True if the item was successfully removed, False otherwise.
         """
         raise NotImplementedError
 
@@ -368,7 +429,7 @@ class DBInterface(ABC):
         Retrieves all orders from the database.
 
         Args:
-            **kwargs: Additional arguments to filter the orders.
+            **kwargs: Filters on the orders, user_id and state (an OrderState or its value).
 
         Returns:
             list[Order]: A list of order objects.
@@ -402,13 +463,13 @@ class DBInterface(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def create_order(self, user_id: str, total_cost: Decimal, items: list[CartItem]) -> str:
+    def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]) -> str:
         """
         Creates a new order in the database.
 
         Args:
             user_id (str): The ID of the user placing the order.
-            total_cost (Decimal): The total cost of the order.
+            total_cost (Money): The total cost of the order.
             items (list[CartItem]): The items in the order.
 
         Returns:
@@ -416,6 +477,21 @@ class DBInterface(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def place_order(self, user_id: str) -> (str | None):
+        """
+        Creates an order from a user's cart and clears the cart, atomically.
+        The cart is read once and the order and the cleared cart are written together, so an
+        interrupted call leaves either both or neither.
+
+        Args:
+            user_id (str): The ID of the user placing the order.
+
+        Returns:
+            str | None: The ID of the order, or None if the cart is empty.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def update_order(self, order_id: str, state: OrderState):
         """
@@ -508,6 +584,52 @@ class DBInterface(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def get_conversation_state(self, chat_id: str) -> ConversationState:
+        """
+        Retrieves the conversation state of a chat from the database.
+
+        Args:
+            chat_id (str): The ID of the chat.
+
+        Returns:
+            ConversationState: The state of the chat, empty if it has none.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_conversation_state(self, state: ConversationState):
+        """
+        Saves the conversation state of a chat in the database.
+
+        Args:
+            state (ConversationState): The state of the chat.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_update(self, update_id: int) -> bool:
+        """
+        Records that a Telegram update is being processed.
+
+        Args:
+            update_id (int): The ID of the update.
+
+        Returns:
+            bool: True if the update was not claimed before, False if it is a duplicate.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_update(self, update_id: int):
+        """
+        Forgets the claim of a Telegram update whose processing failed, so a retry can claim it.
+
+        Args:
+            update_id (int): The ID of the update.
+        """
+        raise NotImplementedError
+
 
 class DatabaseFactory:
     """
@@ -1,258 +1,486 @@
+"""
+This module contains the SQL database, on SQLAlchemy. Any database SQLAlchemy supports can be used,
+SQLite is tuned through the profiles below.
+"""
+
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+import config
+import models
+from data.DatabaseInterface import (CartItem, ConversationState, DBInterface, NavigationHistory, Order,
+                                    OrderInProgress, OrderItem, OrderState, Product, User)
+from data.money import Money
+from migrations import upgrade_sql
+from media_handler import delete_image
+
+
+def user_from_row(user: models.User) -> User:
+    """Builds a user from its row"""
+    return User(id_=user.id, display_name=user.fullname, phone=user.phone, address=user.address,
+                is_admin=user.is_admin)
+
+
+def product_from_row(product: models.Product, price: Optional[Money] = None) -> Product:
+    """Builds a product from its row, with the price it was added to a cart at if one is given"""
+    if price is None:
+        price = Money(product.price, product.currency)
+    return Product(id_=str(product.id), name=product.name, price=price,
+                   description=product.description, image=product.image, published=bool(product.published),
+                   status=product.status)
+
+
+def order_from_row(order: models.Order) -> Order:
+    """Builds an order from its row, loaded with its user and items"""
+    items = []
+    for item in order.items:
+        price = Money(item.price, item.currency)
+        # order items keep the product's name and ID, not its description or image
+        product = Product(id_=str(item.product_id or ""), name=item.product, price=price, description="",
+                          image="", published=True, status="")
+        items.append(OrderItem(str(item.id), product, item.quantity, price))
+    return Order(id_=str(order.id), user=user_from_row(order.user),
+                 total_cost=Money(order.total_cost, order.currency), items=items, state=OrderState(order.state))
+
+
+@dataclass
+class SqliteProfile:
+    """
+    Settings applied to every SQLite connection
+
+    Attributes:
+        pragmas (dict[str, Union[str, int]]): PRAGMAs run when a connection is opened
+        cached_statements (int): Prepared statements sqlite3 keeps per connection
+        query_cache_size (int): Compiled statements SQLAlchemy keeps for the engine
+    """
+    pragmas: dict[str, Union[str, int]] = field(default_factory=dict)
+    cached_statements: int = 128
+    query_cache_size: int = 500
+
+
+# selected by config.SQL_PROFILE
+SQLITE_PROFILES = {
+    # SQLite's own settings, a rollback journal synced to disk on every commit
+    "default": SqliteProfile(),
+    # the write-ahead log is only synced at checkpoints, so commits do not wait for the disk and
+    # readers do not wait for writers. A power cut can lose the last commits but cannot corrupt
+    # the database.
+    "tuned": SqliteProfile(pragmas={
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        # negative sizes are in KiB
+        "cache_size": -64 * 1024,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    }, cached_statements=512, query_cache_size=1200),
+}
+
+
+def engine_options(url: str, profile: str, pool_class: type = QueuePool) -> dict:
+    """The create_engine arguments for a database: its connection pool, and the statement caches
+    of its SQLite profile
+
+    Args:
+        url (str): The database URL
+        profile (str): The SQLITE_PROFILES entry used for SQLite
+        pool_class (type, optional): The pool of databases that are not in memory. Defaults to QueuePool.
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    if make_url(url).database in (None, "", ":memory:"):
+        # every connection to an in-memory database gets a database of its own, so there is one
+        options: dict = {"poolclass": StaticPool}
+    else:
+        options = {"poolclass": pool_class, "pool_size": config.SQL_POOL_SIZE,
+                   "max_overflow": config.SQL_MAX_OVERFLOW, "pool_timeout": config.SQL_POOL_TIMEOUT}
+    if url.startswith("sqlite"):
+        settings = SQLITE_PROFILES[profile]
+        # sqlite connections are handed between threads by the pool, never used by two at once
+        options["connect_args"] = {"check_same_thread": False, "cached_statements": settings.cached_statements}
+        options["query_cache_size"] = settings.query_cache_size
+    return options
+
+
+def apply_profile(engine: Engine, profile: str):
+    """Runs the PRAGMAs of an SQLite profile, and those of config.SQL_PRAGMAS, on every new connection"""
+    pragmas = {**SQLITE_PROFILES[profile].pragmas, **dict(
+        pragma.split("=", 1) for pragma in config.SQL_PRAGMAS.split(",") if pragma)}
+
+    def connect(connection, _):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name.strip()} = {str(value).strip()}")
+        cursor.close()
+
+    event.listen(engine, "connect", connect)
 
-import decimal
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from data.DatabaseInterface import DBInterface
 
-from models import CartItem, Order, OrderItem, OrderNotificationUser, User, Product, Cart
-from media_handler import delete_image
-  
 class SqlDb(DBInterface):
     """Database class for the bot"""
 
-    def __init__(self, db_name="db.sqlite3", echo=False, future=True):
+    def __init__(self, url=config.SQL_URL, echo=False, future=True, profile=config.SQL_PROFILE):
         """
+        Every call gets its own session from a pool of connections, so the database can be used
+        from several threads at once.
 
         Args:
-            db_name (str, optional): Name of the database file to use for sqlite. Defaults to "db.sqlite3".
+            url (str, optional): The database URL. Defaults to config.SQL_URL.
             echo (bool, optional): Log database activity to terminal. Defaults to False.
             future (bool, optional): See https://docs.sqlalchemy.org/en/14/core/future.html. Defaults to True.
+            profile (str, optional): The SQLITE_PROFILES entry used for SQLite. Defaults to config.SQL_PROFILE.
         """
-        self.engine = create_engine(
-            f'sqlite:///{db_name}', echo=echo, future=future)
-        self.conn = self.engine.connect()
-        self.session = Session(self.engine)
-        
+        self.engine = create_engine(url, echo=echo, future=future, **engine_options(url, profile))
+        if url.startswith("sqlite"):
+            apply_profile(self.engine, profile)
+        self.Session = sessionmaker(self.engine, expire_on_commit=False, future=future)
+        # the session of the batch open in each thread
+        self.local = threading.local()
+
         self.create()
 
+    @property
+    def pending(self) -> Optional[Session]:
+        """The session of the batch open in the current thread, if any"""
+        return getattr(self.local, "session", None)
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """A session for a single call, committed when the call ends. While a batch is open the
+        batch's session is used instead and committed with the batch.
+
+        Yields:
+            Session: The session
+        """
+        if self.pending is not None:
+            yield self.pending
+            return
+        with self.Session.begin() as session:
+            yield session
+
+    @contextmanager
+    def batch(self):
+        with self.Session.begin() as session:
+            self.local.session = session
+            try:
+                yield
+            finally:
+                self.local.session = None
+
     def create(self):
-        """Creates the database tables"""
-        from models import Base
-        Base.metadata.create_all(self.engine)
+        """Creates the database tables, or upgrades the schema of an existing database"""
+        upgrade_sql(self.engine)
 
-    def create_new_user(self, id, fullname="", phone="", address="", is_admin=0):
-        """Creates a new user
+    def create_new_user(self, id_, display_name="", phone="", address="", is_admin=0):
+        """Creates a new user and their empty cart
 
         Args:
-            id (_type_): ID of the user, usually their telegram ID
-            fullname (str, optional): Defaults to "".
+            id_ (str): ID of the user, usually their telegram ID
+            display_name (str, optional): Defaults to "".
             phone (str, optional): Defaults to "".
             address (str, optional): Defaults to "".
             is_admin (int, optional): Defaults to 0.
 
         Raises:
             Exception: Exception raised by SQLAlchemy when user creation fails
-
-        Returns:
-            User: The newly created user
         """
-        with self.session:
+        with self.session() as session:
+            session.add(models.User(id=id_, fullname=display_name, phone=phone, address=address, is_admin=is_admin))
+            session.add(models.Cart(user_id=id_))
+
+    def create_user_if_absent(self, id_, display_name="", phone="", address=""):
+        # inserted without reading first, so two updates of a new user cannot both create it. The
+        # insert is made in a session of its own, a user that exists must not roll back an open batch.
+        with self.Session() as session:
             try:
-                user = User(id=id, fullname=fullname,
-                            phone=phone, address=address, is_admin=is_admin)
-            except Exception as e:
-                raise Exception(e)
-            cart = Cart(user_id=id, total_cost=str(decimal.Decimal(0)))
-            self.session.add(cart)
-            self.session.add(user)
-            self.session.commit()
-            return user
-
-    def get_user_by_id(self, id):
-        return self.session.query(User).filter_by(id=id).first()
-
-    def authenticate_user(self, id):
-        with self.session:
-            user = self.session.query(User).filter_by(id=id).first()
-            user.is_admin = 1
-            self.session.commit()
-            return user
-
-    def update_user(self, id, fullname="", phone="", address="", is_admin=0):
-        with self.session as session:
-            user = session.query(User).filter_by(id=id).first()
-            user.fullname = fullname if fullname != "" else user.fullname
-            user.phone = phone if phone != "" else user.phone
-            user.address = address if address != "" else user.address
-            user.is_admin = is_admin if is_admin != user.is_admin else user.is_admin
-            session.expire_on_commit = False
-            session.commit()
-            return user
+                session.add(models.User(id=id_, fullname=display_name, phone=phone, address=address, is_admin=0))
+                session.add(models.Cart(user_id=id_))
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return False
+            return True
+
+    def get_admins(self):
+        with self.session() as session:
+            return [user_from_row(user) for user in session.query(models.User).filter_by(is_admin=1)]
+
+    def get_user_by_id(self, id_):
+        with self.session() as session:
+            user = session.get(models.User, id_)
+            return user_from_row(user) if user is not None else None
+
+    def authenticate_user(self, id_):
+        return self.update_user(id_, is_admin=1)
+
+    def update_user(self, id_, **kwargs):
+        # the users table names the display name fullname
+        if "display_name" in kwargs:
+            kwargs["fullname"] = kwargs.pop("display_name")
+        with self.session() as session:
+            user = session.get(models.User, id_)
+            for key, value in kwargs.items():
+                setattr(user, key, value)
+            return user_from_row(user)
 
     def get_users(self):
-        users = self.session.query(User).all()
-        return {user.id: {"fullname": user.fullname, "phone": user.phone, "address": user.address,
-                          "is_admin": user.is_admin} for user in users}
+        with self.session() as session:
+            return [user_from_row(user) for user in session.query(models.User)]
 
     def create_product(self, name, price, description, image):
-        with self.session:
-            product = Product(name=name, price=price,
-                              description=description, image=image)
-            self.session.add(product)
-            self.session.commit()
-            return product
+        with self.session() as session:
+            session.add(models.Product(name=name, price=price.amount, currency=price.currency,
+                                       description=description, image=image, published=True, status="IN_STOCK"))
 
     def get_products(self):
-        products = self.session.query(Product).all()
-        return {product.name: {"price": product.price, "description": product.description, "image": product.image, "id": product.id} for
-                product in products}
-
-    def get_product_by_id(self, id):
-        product = self.session.query(Product).filter_by(id=id).first()
-        return {"name": product.name, "price": product.price, "description": product.description,
-                "image": product.image}
-
-    def remove_product(self, id):
-        with self.session:
-            product = self.session.query(Product).filter_by(id=id).first()
-            delete_image(product.name)
-            self.session.delete(product)
-            self.session.commit()
+        with self.session() as session:
+            return [product_from_row(product) for product in session.query(models.Product)]
+
+    def get_products_by_name(self, name):
+        with self.session() as session:
+            return [product_from_row(product) for product in session.query(models.Product).filter_by(name=name)]
+
+    def get_product_by_id(self, id_):
+        with self.session() as session:
+            product = session.query(models.Product).filter_by(id=id_).first()
+            return product_from_row(product) if product is not None else None
+
+    def remove_product(self, id_):
+        name = self.delete_product(id_)
+        if name is not None:
+            delete_image(name)
+
+    def delete_product(self, id_) -> Optional[str]:
+        """Deletes the row of a product, leaving its image
+
+        Args:
+            id_ (str): ID of the product
+
+        Returns:
+            Optional[str]: The name the product's image is stored under, None if there is no such product
+        """
+        with self.session() as session:
+            product = session.query(models.Product).filter_by(id=id_).first()
+            if product is None:
+                return None
+            session.delete(product)
+            return product.name
+
+    def update_product(self, id_, **kwargs):
+        if "price" in kwargs:
+            price = kwargs.pop("price")
+            kwargs.update(price=price.amount, currency=price.currency)
+        with self.session() as session:
+            session.query(models.Product).filter_by(id=id_).update(kwargs, synchronize_session=False)
 
     def get_cart_items(self, user_id):
-        cart = self.session.query(Cart).filter_by(user_id=user_id).first()
-        items = self.session.query(CartItem).filter_by(cart_id=cart.id).all()
-        print()
-        return [
-            {"name": self.get_product_by_id(item.product_id)['name'], "price": item.price, "quantity": item.quantity}
-            for item in items]
+        with self.session() as session:
+            items = session.query(models.CartItem).join(models.Cart, models.CartItem.cart_id == models.Cart.id).options(
+                joinedload(models.CartItem.product)).filter(models.Cart.user_id == user_id).all()
+            return [CartItem(product=product_from_row(item.product, Money(item.price, item.currency)),
+                             quantity=item.quantity) for item in items if item.product is not None]
 
     def add_to_cart(self, user_id, product, quantity, price):
-        with self.session:
-            cart = self.session.query(Cart).filter_by(user_id=user_id).first()
-            product = self.session.query(
-                Product).filter_by(name=product).first()
-            cart.total_cost = str((decimal.Decimal(price) * int(quantity)) + (
-                decimal.Decimal(cart.total_cost) if cart.total_cost else decimal.Decimal(0)))
-            cart_item = CartItem(
-                product_id=product.id, quantity=quantity, price=str(price), cart_id=cart.id)
-            self.session.add(cart_item)
-            self.session.commit()
+        # a product added again raises the quantity of its item, as in the other backends
+        with self.session() as session:
+            cart = session.query(models.Cart).filter_by(user_id=user_id).first()
+            if cart is None:
+                cart = models.Cart(user_id=user_id)
+                session.add(cart)
+                session.flush()
+            if price is None:
+                row = session.query(models.Product.price, models.Product.currency).filter_by(id=product).one()
+                price = Money(row.price, row.currency)
+
+            item = session.query(models.CartItem).filter_by(cart_id=cart.id, product_id=product).first()
+            if item is None:
+                session.add(models.CartItem(cart_id=cart.id, product_id=product, quantity=quantity,
+                                            price=price.amount, currency=price.currency))
+            else:
+                item.quantity += quantity
+                item.price, item.currency = price.amount, price.currency
 
     def get_cart(self, user_id):
-        try:
-            cart = self.session.query(Cart).filter_by(user_id=user_id).first()
-        except:
-            return {
-            "total_cost": 0,
-            "products": []
-        }
-        try:
-             
-            cart_items = self.session.query(
-                CartItem).filter_by(cart_id=cart.id).all()
-        except:
-            return {
-            "total_cost": 0,
-            "products": []
-        }
-            
-        products = []
-        for product in cart_items:
-            products.append(self.session.query(
-                Product).filter_by(id=product.product_id).first())
-
-        return {
-            "total_cost": cart.total_cost,
-            "products": [
-                {'product': self.session.query(Product).filter_by(id=product.product_id).first().name,
-                 'quantity': product.quantity, 'price': product.price, 'id': product.id} for product in cart_items
-            ]
-        }
-
-    def remove_item_from_cart(self, user_id, *args):
-        with self.session as session:
-            cart = session.query(Cart).filter_by(user_id=user_id).first()
-            for item in args:
-                item = session.query(CartItem).filter_by(id=item).first()
-                cart.total_cost = str(
-                    decimal.Decimal(cart.total_cost) - (decimal.Decimal(item.price) * int(item.quantity)))
-                session.delete(item)
-            session.commit()
+        # the cart, then its items with their products in a second query
+        with self.session() as session:
+            cart = session.query(models.Cart).options(
+                selectinload(models.Cart.items).joinedload(models.CartItem.product)).filter_by(
+                user_id=user_id).first()
+            # items of removed products are left out
+            items = [CartItem(product=product_from_row(item.product, Money(item.price, item.currency)),
+                              quantity=item.quantity)
+                     for item in (cart.items if cart is not None else []) if item.product is not None]
+            # the total is worked out from the items, whose prices are those they were last added at
+            return {"total_cost": sum((item.product.price * item.quantity for item in items), Money(0)),
+                    "products": items}
+
+    def remove_item_from_cart(self, user_id, item):
+        with self.session() as session:
+            cart = session.query(models.Cart).filter_by(user_id=user_id).first()
+            if cart is None:
+                return False
+            session.query(models.CartItem).filter_by(cart_id=cart.id, product_id=item.product.id_).delete(
+                synchronize_session=False)
             return True
 
     def get_orders(self, **kwargs):
-        orders = self.session.query(Order).filter_by(**kwargs).all()
-        response = {}
-        for order in orders:
-            user = self.session.query(User).filter_by(id=order.user_id).first()
-            response[order.id] = {"user_id": order.user_id, "fullname": user.fullname, "phone": user.phone, "address": user.address, "total_cost": order.total_cost, "state": order.state, "items": [
-                {'product': item.product, 'price': item.price,
-                'quantity': item.quantity}
-                for item in self.session.query(OrderItem).filter_by(order_id=order.id).all()]}
-            
+        if "state" in kwargs:
+            kwargs["state"] = OrderState(kwargs["state"]).value
+        # the orders with their users, then the items of all of them in a second query
+        with self.session() as session:
+            orders = session.query(models.Order).options(
+                joinedload(models.Order.user), selectinload(models.Order.items)).filter_by(**kwargs)
+            return [order_from_row(order) for order in orders]
+
     def get_orders_by_order_state(self, state):
-        # return super method
-        return super().get_orders_by_order_state(state)
-
-    def get_order_by_id(self, id):
-        order = self.session.query(Order).filter_by(id=id).first()
-        user = self.session.query(User).filter_by(id=order.user_id).first()
-        return {
-            "user_id": order.user_id,
-            "fullname": user.fullname,
-            "phone": user.phone,
-            "address": user.address,
-            "total_cost": order.total_cost,
-            "state": order.state,
-            "items": [
-                {'product': item.product, 'price': item.price,
-                 'quantity': item.quantity}
-                for item in self.session.query(OrderItem).filter_by(order_id=order.id).all()
-            ]
-        }
+        return self.get_orders(state=state)
+
+    def get_order_by_id(self, id_):
+        with self.session() as session:
+            order = session.query(models.Order).options(
+                joinedload(models.Order.user), selectinload(models.Order.items)).filter_by(id=id_).first()
+            return order_from_row(order) if order is not None else None
 
     def create_order(self, user_id, total_cost, items):
-        def save_order():
-            with self.session as session:
-                order = Order(user_id=user_id,
-                              total_cost=total_cost, state="pending")
-                session.add(order)
-                session.commit()
-                return order.id
-
-        order_id = save_order()
-        with self.session as session:
-            for item in items:
-                order_item = OrderItem(
-                    product=item['name'], price=item['price'], quantity=item['quantity'], order_id=order_id)
-                session.add(order_item)
-            session.commit()
+        # the order, then all of its items in a single executemany, in one transaction
+        with self.session() as session:
+            order = models.Order(user_id=user_id, total_cost=total_cost.amount, currency=total_cost.currency,
+                                 state=OrderState.PENDING.value)
+            session.add(order)
+            session.flush()
+            session.bulk_insert_mappings(models.OrderItem, [
+                {"product": item.product.name, "product_id": item.product.id_, "price": item.product.price.amount,
+                 "currency": item.product.price.currency, "quantity": item.quantity, "order_id": order.id}
+                for item in items])
+            return str(order.id)
+
+    def place_order(self, user_id):
+        with self.session() as session:
+            cart = session.query(models.Cart).filter_by(user_id=user_id).first()
+            if cart is None:
+                return None
+            items = session.query(
+                models.CartItem.price, models.CartItem.currency, models.CartItem.quantity, models.Product.id,
+                models.Product.name).join(models.Product, models.CartItem.product_id == models.Product.id).filter(
+                models.CartItem.cart_id == cart.id).all()
+            if not items:
+                return None
+
+            total_cost = sum((Money(price, currency) * quantity for price, currency, quantity, _, _ in items),
+                             Money(0))
+            order = models.Order(user_id=user_id, total_cost=total_cost.amount, currency=total_cost.currency,
+                                 state=OrderState.PENDING.value)
+            session.add(order)
+            session.flush()
+            session.bulk_insert_mappings(models.OrderItem, [
+                {"product": name, "product_id": product_id, "price": price, "currency": currency,
+                 "quantity": quantity, "order_id": order.id}
+                for price, currency, quantity, product_id, name in items])
+            session.query(models.CartItem).filter_by(cart_id=cart.id).delete(synchronize_session=False)
+            return str(order.id)
 
-        return order_id
+    def update_order(self, order_id, state):
+        with self.session() as session:
+            session.query(models.Order).filter_by(id=order_id).update(
+                {"state": OrderState(state).value}, synchronize_session=False)
 
     def activate_notifications(self, user_id):
-        with self.session as session:
-            if session.query(OrderNotificationUser).filter_by(chat_id=user_id).first():
+        with self.session() as session:
+            if session.query(models.OrderNotificationUser).filter_by(chat_id=user_id).first():
                 return False
-            session.add(OrderNotificationUser(chat_id=user_id))
-            session.commit()
-
-    def update_order(self, order_id, state):
-        with self.session as session:
-            order = session.query(Order).filter_by(id=order_id).first()
-            order.state = state
-            session.commit()
+            session.add(models.OrderNotificationUser(chat_id=user_id))
+            return True
 
-    def deactivate_notifications(self, id):
-        with self.session as session:
-            session.query(OrderNotificationUser).filter_by(chat_id=id).delete()
-            session.commit()
+    def deactivate_notifications(self, id_):
+        with self.session() as session:
+            session.query(models.OrderNotificationUser).filter_by(chat_id=id_).delete()
 
     def get_notification_users(self):
-        return [user.chat_id for user in self.session.query(OrderNotificationUser).all()]
+        with self.session() as session:
+            return [user.chat_id for user in session.query(models.OrderNotificationUser)]
+
+    def create_order_in_progress(self, user_id, product):
+        with self.session() as session:
+            session.merge(models.OrderInProgress(user_id=user_id, product_id=product.id_, quantity=0))
+
+    def update_order_in_progress(self, user_id, quantity):
+        with self.session() as session:
+            session.query(models.OrderInProgress).filter_by(user_id=user_id).update(
+                {"quantity": quantity}, synchronize_session=False)
+
+    def get_order_in_progress(self, user_id):
+        with self.session() as session:
+            order = session.query(models.OrderInProgress).options(
+                joinedload(models.OrderInProgress.product)).filter_by(user_id=user_id).first()
+            if order is None or order.product is None:
+                return None
+            return OrderInProgress(product=product_from_row(order.product), quantity=order.quantity)
+
+    def remove_order_in_progress(self, user_id):
+        with self.session() as session:
+            session.query(models.OrderInProgress).filter_by(user_id=user_id).delete(synchronize_session=False)
+
+    def update_user_navigation(self, user_id, path, reset=False):
+        with self.session() as session:
+            navigation = session.get(models.Navigation, user_id)
+            if navigation is None:
+                session.add(models.Navigation(user_id=user_id, current_page=path, breadcrumb=[path]))
+                return
+            navigation.current_page = path
+            # a page already in the breadcrumb is not added again, as with Firestore's ArrayUnion
+            if reset:
+                navigation.breadcrumb = [path]
+            elif path not in navigation.breadcrumb:
+                navigation.breadcrumb = navigation.breadcrumb + [path]
+
+    def get_user_navigation(self, user_id):
+        with self.session() as session:
+            navigation = session.get(models.Navigation, user_id)
+        if navigation is None:
+            return NavigationHistory(user_id=user_id, current_page="", breadcrumb=[])
+        return NavigationHistory(user_id=user_id, current_page=navigation.current_page,
+                                 breadcrumb=list(navigation.breadcrumb))
+
+    def get_conversation_state(self, chat_id):
+        with self.session() as session:
+            conversation = session.get(models.Conversation, chat_id)
+        if conversation is None:
+            return ConversationState(chat_id=chat_id, current="", path=[])
+        return ConversationState(chat_id=chat_id, current=conversation.current, path=list(conversation.path))
+
+    def save_conversation_state(self, state):
+        with self.session() as session:
+            session.merge(models.Conversation(chat_id=state.chat_id, current=state.current, path=state.path))
+
+    def claim_update(self, update_id):
+        # claimed in a session of its own, a failed claim must not roll back an open batch
+        with self.Session() as session:
+            try:
+                session.add(models.ProcessedUpdate(update_id=update_id))
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return False
+            return True
 
-    def update_product(self, id_, **kwargs):
-        with self.session as session:
-            product = session.query(Product).filter_by(id=id_).first()
-            for key, value in kwargs.items():
-                setattr(product, key, value)
+    def release_update(self, update_id):
+        with self.Session() as session:
+            session.query(models.ProcessedUpdate).filter(models.ProcessedUpdate.update_id == update_id).delete()
             session.commit()
 
+
 if __name__ == "__main__":
-    db = DB("test.sqlite", echo=True)
-    db.create()
-    ID = 234567890
+    db = SqlDb("sqlite:///test.sqlite", echo=True)
+    ID = "234567890"
 
     if db.get_user_by_id(ID) is None:
         db.create_new_user(ID, "John Doe", "1234567890", "123 Main St")
@@ -262,6 +490,3 @@ if __name__ == "__main__":
 
     db.activate_notifications(ID)
     print(db.get_notification_users())
-
-
-
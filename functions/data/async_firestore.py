@@ -0,0 +1,322 @@
+# pylint: disable = line-too-long, missing-module-docstring, missing-function-docstring, too-many-arguments
+import asyncio
+import dataclasses
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import config
+
+from cachetools import TTLCache
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from google.cloud.firestore_v1 import DELETE_FIELD, ArrayUnion, FieldFilter, Increment
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud import firestore
+
+from .DatabaseInterface import CartItem, ConversationState, DBInterface, NavigationHistory, Order, OrderInProgress, OrderState, Product, User
+from .async_interface import AsyncDBInterface
+from .firestore import not_none, order_from_dict, product_from_dict, product_to_dict
+from .money import Money
+
+
+class AsyncFirestore(AsyncDBInterface):
+    """
+    Implementation of the AsyncDBInterface on Firestore's AsyncClient, storing documents the same
+    way as Firestore so both can share a database.
+
+    Independent reads are awaited together instead of being cached. The only copies kept are of
+    users, with their update time, so that update_user can return the updated user without reading
+    it back, like Firestore.update_user does. Writes that change products or admins bump the
+    version stamps Firestore instances cache them under.
+    """
+
+    def __init__(self):
+        self._client: Optional[firestore.AsyncClient] = None
+        self.users: TTLCache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+    @property
+    def db(self) -> firestore.AsyncClient:
+        """The Firestore client, created on first use inside the event loop that uses it"""
+        if self._client is None:
+            self._client = firestore.AsyncClient()
+        return self._client
+
+    async def bump_version(self, name: str):
+        """Increments a version stamp so every Firestore instance drops what it cached under it"""
+        await self.db.collection("meta").document(name).set({"version": Increment(1)}, merge=True)
+
+    async def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "", is_admin: int = 0):
+        result = await self.db.collection("users").document(id_).set({
+            "display_name": display_name,
+            "phone": phone,
+            "address": address,
+            "is_admin": is_admin
+        })
+        self.users[id_] = (User(id_, display_name, phone, address, is_admin), result.update_time)
+        if is_admin:
+            await self.bump_version("admins")
+
+    async def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "", address: str = "") -> bool:
+        try:
+            result = await self.db.collection("users").document(id_).create({
+                "display_name": display_name,
+                "phone": phone,
+                "address": address,
+                "is_admin": 0
+            })
+        except AlreadyExists:
+            return False
+        self.users[id_] = (User(id_, display_name, phone, address, 0), result.update_time)
+        return True
+
+    async def get_admins(self) -> list[User]:
+        admins = self.db.collection("users").where(filter=FieldFilter("is_admin", "==", 1)).stream()
+        return [User(id_=admin.id, **not_none(admin.to_dict())) async for admin in admins]
+
+    async def get_user_by_id(self, id_: str) -> (User | None):
+        user = await self.db.collection("users").document(id_).get()
+        if user.exists:
+            self.users[id_] = (User(id_, **not_none(user.to_dict())), user.update_time)
+            return self.users[id_][0]
+        return None
+
+    async def update_user(self, id_: str, **kwargs) -> User:
+        ref = self.db.collection("users").document(id_)
+        user = None
+        cached = self.users.get(id_)
+        if cached is not None:
+            # only applies if the user is unchanged since the copy was read or written, see Firestore.update_user
+            try:
+                result = await ref.update(kwargs, option=self.db.write_option(last_update_time=cached[1]))
+                user = dataclasses.replace(cached[0], **kwargs)
+                self.users[id_] = (user, result.update_time)
+            except FailedPrecondition:
+                pass
+
+        if user is None:
+            # the user is read while the update is sent. The read may see the update or not and the
+            # changes are merged into it either way, and if it did not the copy's update time makes
+            # the next update fall back to this again.
+            snapshot, _ = await asyncio.gather(ref.get(), ref.update(kwargs))
+            user = dataclasses.replace(User(id_, **not_none(snapshot.to_dict())), **kwargs)
+            self.users[id_] = (user, snapshot.update_time)
+
+        if "is_admin" in kwargs:
+            await self.bump_version("admins")
+        return user
+
+    async def get_users(self) -> list[User]:
+        return [User(user.id, **not_none(user.to_dict())) async for user in self.db.collection("users").stream()]
+
+    async def authenticate_user(self, id_: str) -> User:
+        return await self.update_user(id_, is_admin=1)
+
+    async def create_product(self, name, price: Money, description: str, image: str):
+        await self.db.collection("products").add({
+            "name": name,
+            "price": price.amount,
+            "currency": price.currency,
+            "description": description,
+            "image": image,
+            "published": True,
+            "status": "IN_STOCK",
+        })
+        await self.bump_version("catalog")
+
+    async def get_products(self) -> list[Product]:
+        return [product_from_dict(not_none(product.to_dict()), product.id)
+                async for product in self.db.collection("products").stream()]
+
+    async def get_products_by_name(self, name: str) -> list[Product]:
+        products = self.db.collection("products").where(filter=FieldFilter("name", "==", name)).stream()
+        return [product_from_dict(not_none(product.to_dict()), product.id) async for product in products]
+
+    async def get_product_by_id(self, id_: str) -> (Product | None):
+        product = await self.db.collection("products").document(id_).get()
+        return product_from_dict(not_none(product.to_dict()), product.id) if product.exists else None
+
+    async def remove_product(self, id_: str):
+        await self.db.collection("products").document(id_).delete()
+        await self.bump_version("catalog")
+
+    async def update_product(self, id_: str, **kwargs):
+        if "price" in kwargs:
+            price = kwargs.pop("price")
+            kwargs.update(price=price.amount, currency=price.currency)
+        await self.db.collection("products").document(id_).update(kwargs)
+        await self.bump_version("catalog")
+
+    async def add_to_cart(self, user_id, product: str, quantity: int, price: Money):
+        # the cart layout of Firestore.add_to_cart, changed with an increment and never read
+        snapshot = not_none(await self.get_product_by_id(product))
+        if price is not None:
+            snapshot = dataclasses.replace(snapshot, price=price)
+        await self.db.collection("carts").document(user_id).set({
+            "items": {
+                product: {
+                    "product": product_to_dict(snapshot),
+                    "quantity": Increment(quantity),
+                },
+            },
+        }, merge=True)
+
+    async def cart_from_snapshot(self, cart) -> DBInterface.GetCartReturn:
+        """Reads a cart document. Carts stored as an array of items are read as they are, Firestore
+        rewrites them in the map layout when it reads them.
+
+        Args:
+            cart (DocumentSnapshot): The cart document
+
+        Returns:
+            DBInterface.GetCartReturn: The cart's items and total cost
+        """
+        if not cart.exists:
+            return {"total_cost": Money(0), "products": []}
+
+        data = not_none(cart.to_dict())
+        if isinstance(data["items"], list):
+            products = await asyncio.gather(*(self.get_product_by_id(item["product_id"]) for item in data["items"]))
+            items = [CartItem(product=product, quantity=item["quantity"])
+                     for item, product in zip(data["items"], products) if product is not None]
+            return {"total_cost": sum((item.product.price * item.quantity for item in items), Money(0)),
+                    "products": items}
+
+        items = [CartItem(product=product_from_dict(item["product"]), quantity=item["quantity"])
+                 for item in data["items"].values() if item["quantity"] > 0]
+        if not items:
+            return {"total_cost": Money(0), "products": []}
+        # carts store no total, see Firestore.add_to_cart
+        return {"total_cost": sum((item.product.price * item.quantity for item in items), Money(0)),
+                "products": items}
+
+    async def get_cart_items(self, user_id) -> list[CartItem]:
+        return (await self.get_cart(user_id))["products"]
+
+    async def get_cart(self, user_id) -> DBInterface.GetCartReturn:
+        return await self.cart_from_snapshot(await self.db.collection("carts").document(user_id).get())
+
+    async def remove_item_from_cart(self, user_id: str, item: CartItem):
+        await self.db.collection("carts").document(user_id).update({
+            FieldPath("items", item.product.id_).to_api_repr(): DELETE_FIELD,
+        })
+        return True
+
+    async def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]):
+        order_ref = self.db.collection("orders").document()
+        await order_ref.set({
+            "id_": order_ref.id,
+            "user": dataclasses.asdict(not_none(await self.get_user_by_id(user_id))),
+            "total_cost": total_cost.amount,
+            "currency": total_cost.currency,
+            "state": OrderState.PENDING.value,
+            "items": [{"product": product_to_dict(item.product), "quantity": item.quantity} for item in items],
+        })
+        return order_ref.id
+
+    async def place_order(self, user_id: str) -> Optional[str]:
+        cart_ref = self.db.collection("carts").document(user_id)
+        user_ref = self.db.collection("users").document(user_id)
+        order_ref = self.db.collection("orders").document()
+
+        # the cart and the user are read together in the transaction, which commits the order and
+        # the cleared cart together and is retried if the cart changes in between
+        @firestore.async_transactional
+        async def place(transaction) -> Optional[str]:
+            cart, user = await asyncio.gather(cart_ref.get(transaction=transaction),
+                                              user_ref.get(transaction=transaction))
+            if not user.exists:
+                return None
+            cart = await self.cart_from_snapshot(cart)
+            if not cart["products"]:
+                return None
+
+            items, total_cost = cart["products"], cart["total_cost"]
+            transaction.set(order_ref, {
+                "id_": order_ref.id,
+                "user": dataclasses.asdict(User(user_id, **not_none(user.to_dict()))),
+                "total_cost": total_cost.amount,
+                "currency": total_cost.currency,
+                "state": OrderState.PENDING.value,
+                "items": [{"product": product_to_dict(item.product), "quantity": item.quantity} for item in items],
+            })
+            transaction.delete(cart_ref)
+            return order_ref.id
+
+        return await place(self.db.transaction())
+
+    async def get_orders(self, **kwargs) -> list[Order]:
+        # orders keep a copy of their user, so they are filtered by the copy's ID
+        query = self.db.collection("orders")
+        if "user_id" in kwargs:
+            query = query.where(filter=FieldFilter("user.id_", "==", kwargs["user_id"]))
+        if "state" in kwargs:
+            query = query.where(filter=FieldFilter("state", "==", OrderState(kwargs["state"]).value))
+        return [order_from_dict(order.id, not_none(order.to_dict())) async for order in query.stream()]
+
+    async def get_orders_by_order_state(self, state: OrderState) -> list[Order]:
+        return await self.get_orders(state=state)
+
+    async def get_order_by_id(self, id_):
+        order = await self.db.collection("orders").document(id_).get()
+        if order.exists:
+            return order_from_dict(order.id, not_none(order.to_dict()))
+        return None
+
+    async def update_order(self, order_id, state):
+        await self.db.collection("orders").document(order_id).update({"state": OrderState(state).value})
+
+    async def create_order_in_progress(self, user_id: str, product: Product):
+        await self.db.collection("orders_id_progress").document(user_id).set({
+            "quantity": 0,
+            "product": product_to_dict(product),
+        })
+
+    async def update_order_in_progress(self, user_id: str, quantity: int):
+        await self.db.collection("orders_id_progress").document(user_id).update({"quantity": quantity})
+
+    async def get_order_in_progress(self, user_id: str) -> (OrderInProgress | None):
+        order = await self.db.collection("orders_id_progress").document(user_id).get()
+        if order.exists:
+            order = not_none(order.to_dict())
+            return OrderInProgress(product=product_from_dict(order["product"]), quantity=order["quantity"])
+        return None
+
+    async def remove_order_in_progress(self, user_id: str):
+        await self.db.collection("orders_id_progress").document(user_id).delete()
+
+    async def update_user_navigation(self, user_id: str, path: str, reset: bool = False):
+        await self.db.collection("navigation").document(user_id).set({
+            "current_page": path,
+            "breadcrump": ArrayUnion([path]) if not reset else [path]
+        }, merge=True)
+
+    async def get_user_navigation(self, user_id: str) -> NavigationHistory:
+        navigation = await self.db.collection("navigation").document(user_id).get()
+        if navigation.exists:
+            navigation = not_none(navigation.to_dict())
+            return NavigationHistory(user_id=user_id, breadcrumb=navigation["breadcrump"], current_page=navigation["current_page"])
+        return NavigationHistory(user_id=user_id, breadcrumb=[], current_page="")
+
+    async def get_conversation_state(self, chat_id: str) -> ConversationState:
+        state = await self.db.collection("conversations").document(chat_id).get()
+        if state.exists:
+            state = not_none(state.to_dict())
+            return ConversationState(chat_id=chat_id, current=state["current"], path=state["path"])
+        return ConversationState(chat_id=chat_id, current="", path=[])
+
+    async def save_conversation_state(self, state: ConversationState):
+        await self.db.collection("conversations").document(state.chat_id).set({
+            "current": state.current,
+            "path": state.path,
+        })
+
+    async def claim_update(self, update_id: int) -> bool:
+        try:
+            await self.db.collection("processed_updates").document(str(update_id)).create({
+                "expires_at": datetime.now(timezone.utc) + timedelta(days=1),
+            })
+        except AlreadyExists:
+            return False
+        return True
+
+    async def release_update(self, update_id: int):
+        await self.db.collection("processed_updates").document(str(update_id)).delete()
@@ -0,0 +1,194 @@
+"""
+This module contains the asynchronous interface for the database.
+"""
+
+from abc import ABC, abstractmethod
+
+from .DatabaseInterface import (CartItem, ConversationState, DBInterface, NavigationHistory, Order, OrderInProgress,
+                                OrderState, Product, User)
+from .money import Money
+
+
+class AsyncDBInterface(ABC):
+    """
+    Interface for databases used from an event loop.
+
+    Every method is a coroutine with the arguments, results and behaviour of the DBInterface method
+    of the same name, see DBInterface for them. Calls that do not depend on each other can be
+    awaited together with asyncio.gather.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def close(self):
+        """
+        Releases the connections held by the database.
+        """
+
+    @abstractmethod
+    async def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "",
+                              is_admin: int = 0):
+        """Creates a new user in the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "",
+                                    address: str = "") -> bool:
+        """Creates a user unless one with the same ID exists, returns whether it was created."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_admins(self) -> list[User]:
+        """Retrieves all admins from the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user_by_id(self, id_: str) -> (User | None):
+        """Retrieves a user by their ID, None if it doesn't exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_user(self, id_: str, **kwargs) -> User:
+        """Updates the fields of a user and returns the updated user."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_users(self) -> list[User]:
+        """Retrieves all users from the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def authenticate_user(self, id_: str) -> User:
+        """Makes a user an admin."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_product(self, name, price: Money, description: str, image: str):
+        """Creates a new product in the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_products(self) -> list[Product]:
+        """Retrieves all products from the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_products_by_name(self, name: str) -> list[Product]:
+        """Retrieves all products with a specific name."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_product_by_id(self, id_: str) -> (Product | None):
+        """Retrieves a product by its ID, None if it doesn't exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_product(self, id_: str):
+        """Removes a product from the database."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_cart_items(self, user_id: str) -> list[CartItem]:
+        """Retrieves all items in a user's cart."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_to_cart(self, user_id, product: str, quantity: int, price: (Money | None)):
+        """Adds a product, by ID, to a user's cart."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_cart(self, user_id: str) -> DBInterface.GetCartReturn:
+        """Retrieves a user's cart items and its total cost."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_item_from_cart(self, user_id: str, item: CartItem) -> bool:
+        """Removes an item from a user's cart."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_orders(self, **kwargs: str) -> list[Order]:
+        """Retrieves the orders, filtered by user_id and state."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_orders_by_order_state(self, state: OrderState) -> list[Order]:
+        """Retrieves all orders with a specific state."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_order_by_id(self, id_: str) -> (Order | None):
+        """Retrieves an order by its ID, None if it doesn't exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]) -> str:
+        """Creates a new order and returns its ID."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def place_order(self, user_id: str) -> (str | None):
+        """Creates an order from a user's cart and clears the cart, atomically."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_order(self, order_id: str, state: OrderState):
+        """Updates the state of an order."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_product(self, id_, **kwargs: str):
+        """Updates the fields of a product."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_order_in_progress(self, user_id: str, product: Product):
+        """Starts an order in progress of a product."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_order_in_progress(self, user_id: str, quantity: int):
+        """Sets the quantity of an order in progress."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_order_in_progress(self, user_id: str) -> (OrderInProgress | None):
+        """Retrieves a user's order in progress, None if they have none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_order_in_progress(self, user_id: str):
+        """Removes a user's order in progress."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_user_navigation(self, user_id: str, path: str, reset: bool = False):
+        """Records that a user opened a page."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user_navigation(self, user_id: str) -> NavigationHistory:
+        """Retrieves the navigation history of a user."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_conversation_state(self, chat_id: str) -> ConversationState:
+        """Retrieves the conversation state of a chat, empty if it has none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_conversation_state(self, state: ConversationState):
+        """Saves the conversation state of a chat."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_update(self, update_id: int) -> bool:
+        """Records that a Telegram update is being processed, False if it was claimed before."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_update(self, update_id: int):
+        """Forgets the claim of a Telegram update whose processing failed."""
+        raise NotImplementedError
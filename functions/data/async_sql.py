@@ -0,0 +1,212 @@
+# pylint: disable = missing-module-docstring, missing-function-docstring, too-many-arguments, too-many-public-methods
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import config
+import models
+from media_handler import delete_image
+from migrations import upgrade_sql_connection
+from .SqlDb import SqlDb, apply_profile, engine_options
+from .async_interface import AsyncDBInterface
+
+T = TypeVar("T")
+
+
+class BoundSqlDb(SqlDb):
+    """A SqlDb whose calls all run in a session it is given, instead of one from its own engine"""
+
+    def __init__(self, session: Session):  # pylint: disable = super-init-not-called
+        self.bound = session
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        yield self.bound
+
+
+class AsyncSqlDb(AsyncDBInterface):
+    """
+    Implementation of the AsyncDBInterface on SQLAlchemy's asyncio extension, with the tables,
+    migrations and SQLite profiles of SqlDb. SQLite is used through aiosqlite.
+
+    The queries are SqlDb's own: each call runs the SqlDb method of the same name through
+    AsyncSession.run_sync, on the synchronous session the async one wraps, so the two backends
+    cannot drift apart.
+    """
+
+    def __init__(self, url=config.SQL_ASYNC_URL, echo=False, profile=config.SQL_PROFILE):
+        """
+        Every call gets its own session from a pool of connections, so calls awaited together run
+        on connections of their own.
+
+        Args:
+            url (str, optional): The database URL of an async driver. Defaults to config.SQL_ASYNC_URL.
+            echo (bool, optional): Log database activity to terminal. Defaults to False.
+            profile (str, optional): The SQLITE_PROFILES entry used for SQLite. Defaults to config.SQL_PROFILE.
+        """
+        self.engine = create_async_engine(url, echo=echo, future=True,
+                                          **engine_options(url, profile, AsyncAdaptedQueuePool))
+        if url.startswith("sqlite"):
+            apply_profile(self.engine.sync_engine, profile)
+        self.Session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False, future=True)
+        # the schema is upgraded before the first call, constructors cannot await
+        self.created = False
+        self.creating = asyncio.Lock()
+
+    async def create(self):
+        """Creates the database tables, or upgrades the schema of an existing database"""
+        async with self.creating:
+            if not self.created:
+                async with self.engine.begin() as connection:
+                    await connection.run_sync(upgrade_sql_connection)
+                self.created = True
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """A session for a single call, committed when the call ends
+
+        Yields:
+            AsyncSession: The session
+        """
+        if not self.created:
+            await self.create()
+        async with self.Session.begin() as session:
+            yield session
+
+    async def run(self, method: Callable[..., T], *args, **kwargs) -> T:
+        """Runs a SqlDb method in a session of its own
+
+        Args:
+            method (Callable[..., T]): The method, taken from the SqlDb class
+            *args, **kwargs: Passed on to the method
+
+        Returns:
+            T: What the method returned
+        """
+        async with self.session() as session:
+            return await session.run_sync(lambda bound: method(BoundSqlDb(bound), *args, **kwargs))
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def create_new_user(self, id_, display_name="", phone="", address="", is_admin=0):
+        await self.run(SqlDb.create_new_user, id_, display_name, phone, address, is_admin)
+
+    async def create_user_if_absent(self, id_, display_name="", phone="", address=""):
+        # inserted without reading first, see SqlDb.create_user_if_absent
+        try:
+            await self.run(SqlDb.create_new_user, id_, display_name, phone, address)
+        except IntegrityError:
+            return False
+        return True
+
+    async def get_admins(self):
+        return await self.run(SqlDb.get_admins)
+
+    async def get_user_by_id(self, id_):
+        return await self.run(SqlDb.get_user_by_id, id_)
+
+    async def authenticate_user(self, id_):
+        return await self.run(SqlDb.authenticate_user, id_)
+
+    async def update_user(self, id_, **kwargs):
+        return await self.run(SqlDb.update_user, id_, **kwargs)
+
+    async def get_users(self):
+        return await self.run(SqlDb.get_users)
+
+    async def create_product(self, name, price, description, image):
+        await self.run(SqlDb.create_product, name, price, description, image)
+
+    async def get_products(self):
+        return await self.run(SqlDb.get_products)
+
+    async def get_products_by_name(self, name):
+        return await self.run(SqlDb.get_products_by_name, name)
+
+    async def get_product_by_id(self, id_):
+        return await self.run(SqlDb.get_product_by_id, id_)
+
+    async def remove_product(self, id_):
+        name = await self.run(SqlDb.delete_product, id_)
+        if name is not None:
+            # the image is deleted over the network by a blocking client
+            await asyncio.to_thread(delete_image, name)
+
+    async def update_product(self, id_, **kwargs):
+        await self.run(SqlDb.update_product, id_, **kwargs)
+
+    async def get_cart_items(self, user_id):
+        return await self.run(SqlDb.get_cart_items, user_id)
+
+    async def add_to_cart(self, user_id, product, quantity, price):
+        await self.run(SqlDb.add_to_cart, user_id, product, quantity, price)
+
+    async def get_cart(self, user_id):
+        return await self.run(SqlDb.get_cart, user_id)
+
+    async def remove_item_from_cart(self, user_id, item):
+        return await self.run(SqlDb.remove_item_from_cart, user_id, item)
+
+    async def get_orders(self, **kwargs):
+        return await self.run(SqlDb.get_orders, **kwargs)
+
+    async def get_orders_by_order_state(self, state):
+        return await self.run(SqlDb.get_orders_by_order_state, state)
+
+    async def get_order_by_id(self, id_):
+        return await self.run(SqlDb.get_order_by_id, id_)
+
+    async def create_order(self, user_id, total_cost, items):
+        return await self.run(SqlDb.create_order, user_id, total_cost, items)
+
+    async def place_order(self, user_id):
+        return await self.run(SqlDb.place_order, user_id)
+
+    async def update_order(self, order_id, state):
+        await self.run(SqlDb.update_order, order_id, state)
+
+    async def create_order_in_progress(self, user_id, product):
+        await self.run(SqlDb.create_order_in_progress, user_id, product)
+
+    async def update_order_in_progress(self, user_id, quantity):
+        await self.run(SqlDb.update_order_in_progress, user_id, quantity)
+
+    async def get_order_in_progress(self, user_id):
+        return await self.run(SqlDb.get_order_in_progress, user_id)
+
+    async def remove_order_in_progress(self, user_id):
+        await self.run(SqlDb.remove_order_in_progress, user_id)
+
+    async def update_user_navigation(self, user_id, path, reset=False):
+        await self.run(SqlDb.update_user_navigation, user_id, path, reset)
+
+    async def get_user_navigation(self, user_id):
+        return await self.run(SqlDb.get_user_navigation, user_id)
+
+    async def get_conversation_state(self, chat_id):
+        return await self.run(SqlDb.get_conversation_state, chat_id)
+
+    async def save_conversation_state(self, state):
+        await self.run(SqlDb.save_conversation_state, state)
+
+    # SqlDb claims updates outside of its batches with sessions from its own engine, which a
+    # BoundSqlDb does not have. Every call here has a session of its own anyway.
+
+    async def claim_update(self, update_id):
+        try:
+            async with self.session() as session:
+                session.add(models.ProcessedUpdate(update_id=update_id))
+        except IntegrityError:
+            return False
+        return True
+
+    async def release_update(self, update_id):
+        async with self.session() as session:
+            await session.execute(delete(models.ProcessedUpdate).where(models.ProcessedUpdate.update_id == update_id))
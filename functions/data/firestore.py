@@ -1,12 +1,19 @@
 # pylint: disable = line-too-long, missing-module-docstring, missing-class-docstring, missing-function-docstring, too-many-arguments, redefined-builtin
 import dataclasses
-from decimal import Decimal
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Union, TypeVar
 
-from google.cloud.firestore_v1 import ArrayRemove, FieldFilter, ArrayUnion
+from cachetools import TTLCache
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from google.cloud.firestore_v1 import DELETE_FIELD, ArrayUnion, FieldFilter, Increment
+from google.cloud.firestore_v1.field_path import FieldPath
 from google.cloud import firestore
 
-from .DatabaseInterface import CartItem, DBInterface, NavigationHistory, Order, OrderInProgress, OrderState, User, Product
+import config
+from .DatabaseInterface import CartItem, ConversationState, DBInterface, NavigationHistory, Order, OrderInProgress, OrderItem, OrderState, User, Product
+from .money import Money
 
 
 T = TypeVar('T')
@@ -17,6 +24,33 @@ def not_none(obj: Optional[T]) -> T:
     return obj
 
 
+def product_to_dict(product: Product) -> dict:
+    """The fields stored for a product, with the price in minor units next to its currency"""
+    data = dataclasses.asdict(product)
+    data.update(price=product.price.amount, currency=product.price.currency)
+    return data
+
+
+def product_from_dict(data: dict, id_: Optional[str] = None) -> Product:
+    """Builds a product from its stored fields. Prices stored without a currency are in major units."""
+    data = dict(data)
+    price = Money.from_stored(data.pop("price"), data.pop("currency", None))
+    if id_ is not None:
+        data["id_"] = id_
+    return Product(price=price, **data)
+
+
+def order_from_dict(id_: str, data: dict) -> Order:
+    """Builds an order from its stored fields. Totals stored without a currency are in major units."""
+    items = []
+    for index, item in enumerate(data["items"]):
+        product = product_from_dict(item["product"])
+        items.append(OrderItem(str(index), product, item["quantity"], product.price))
+    return Order(id_=id_, user=User(**data["user"]),
+                 total_cost=Money.from_stored(data["total_cost"], data.get("currency")),
+                 items=items, state=OrderState(data["state"]))
+
+
 class Firestore(DBInterface):
     """
     Implementation of the DBInterface for Firestore
@@ -24,7 +58,109 @@ class Firestore(DBInterface):
 
     def __init__(self):
 
-        self.db = firestore.Client()
+        self._client: Optional[firestore.Client] = None
+        # writes are collected in the thread's batch instead of being sent while it is open
+        self.local = threading.local()
+
+        # products are cached for the life of the instance, keyed by the query that produced them.
+        # The cache is dropped when the catalog version stamp changes, which is checked at most
+        # once per update.
+        self.catalog: TTLCache = TTLCache(
+            maxsize=config.CATALOG_CACHE_SIZE, ttl=config.CATALOG_CACHE_TTL)
+        self.catalog_version = None
+        self.catalog_checked = False
+
+        # the last copy of each user this instance read or wrote, with the document's update time
+        # then, used to return updated users without reading them back
+        self.users: TTLCache = TTLCache(
+            maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+        # admins are cached until the admins version stamp changes
+        self.admins: Optional[list[User]] = None
+        self.admins_version = None
+
+    @property
+    def db(self) -> firestore.Client:
+        """The Firestore client, created on first use so that importing the bot stays cheap"""
+        if self._client is None:
+            self._client = firestore.Client()
+        return self._client
+
+    @property
+    def pending(self) -> Optional[firestore.WriteBatch]:
+        """The batch open in the current thread, if any"""
+        return getattr(self.local, "batch", None)
+
+    @contextmanager
+    def batch(self):
+        self.local.batch = self.db.batch()
+        try:
+            yield
+            if len(self.local.batch):
+                self.local.batch.commit()
+        finally:
+            self.local.batch = None
+
+    def set_document(self, ref, data: dict, merge: bool = False):
+        """Sets a document, or adds the write to the open batch
+
+        Returns:
+            The result of the write, None if it was added to the batch
+        """
+        if self.pending is not None:
+            self.pending.set(ref, data, merge=merge)
+            return None
+        return ref.set(data, merge=merge)
+
+    def update_document(self, ref, data: dict):
+        """Updates a document, or adds the write to the open batch"""
+        if self.pending is not None:
+            self.pending.update(ref, data)
+        else:
+            ref.update(data)
+
+    def delete_document(self, ref):
+        """Deletes a document, or adds the delete to the open batch"""
+        if self.pending is not None:
+            self.pending.delete(ref)
+        else:
+            ref.delete()
+
+    def begin_update(self):
+        self.catalog_checked = False
+
+    def check_catalog_version(self):
+        """Clears the catalog cache if the products changed since it was filled"""
+        if self.catalog_checked:
+            return
+        self.catalog_checked = True
+
+        version = self.get_version("catalog")
+        if version != self.catalog_version:
+            self.catalog.clear()
+            self.catalog_version = version
+
+    def get_version(self, name: str):
+        """Reads a version stamp from the meta collection
+
+        Args:
+            name (str): The name of the stamp
+
+        Returns:
+            int | None: The version, or None if the stamp was never bumped
+        """
+        stamp = self.db.collection("meta").document(name).get()
+        return stamp.get("version") if stamp.exists else None
+
+    def bump_version(self, name: str):
+        """Increments a version stamp so every instance drops what it cached under it"""
+        self.set_document(self.db.collection("meta").document(name),
+                          {"version": Increment(1)}, merge=True)
+
+    def invalidate_catalog(self):
+        """Clears the local catalog cache and bumps the catalog version stamp for other instances"""
+        self.catalog.clear()
+        self.bump_version("catalog")
 
     def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "", is_admin: int = 0):
         """Creates a new user in the database
@@ -36,27 +172,80 @@ class Firestore(DBInterface):
             address (str, optional): The user's address. Defaults to "".
             is_admin (int, optional): Whether the user is an admin. Defaults to 0.
         """
-        self.db.collection("users").document(id_).set({
+        result = self.set_document(self.db.collection("users").document(id_), {
             "display_name": display_name,
             "phone": phone,
             "address": address,
             "is_admin": is_admin
         })
+        if result is not None:
+            self.users[id_] = (User(id_, display_name, phone, address, is_admin), result.update_time)
+        else:
+            self.users.pop(id_, None)
+        if is_admin:
+            self.admins = None
+            self.bump_version("admins")
+
+    def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "", address: str = "") -> bool:
+        # create() fails if the user exists, so this takes a single request either way
+        try:
+            result = self.db.collection("users").document(id_).create({
+                "display_name": display_name,
+                "phone": phone,
+                "address": address,
+                "is_admin": 0
+            })
+        except AlreadyExists:
+            return False
+        self.users[id_] = (User(id_, display_name, phone, address, 0), result.update_time)
+        return True
 
     def get_admins(self) -> list[User]:
-        admins = self.db.collection("users").where(
-            filter=FieldFilter("is_admin", "==", 1)).stream()
-        return [User(id_=admin.id, **not_none(admin.to_dict())) for admin in admins]
+        version = self.get_version("admins")
+        if self.admins is None or version != self.admins_version:
+            admins = self.db.collection("users").where(
+                filter=FieldFilter("is_admin", "==", 1)).stream()
+            self.admins = [User(id_=admin.id, **not_none(admin.to_dict())) for admin in admins]
+            self.admins_version = version
+        return self.admins
 
     def get_user_by_id(self, id_):
         user = self.db.collection("users").document(id_).get()
         if user.exists:
-            return User(id_, **not_none(user.to_dict()))
+            self.users[id_] = (User(id_, **not_none(user.to_dict())), user.update_time)
+            return self.users[id_][0]
         return None
 
-    def update_user(self, id_: str, **kwargs) -> User:
-        self.db.collection("users").document(id_).update(kwargs)
-        return not_none(self.get_user_by_id(id_))
+    def update_user(self, id_: str, **kwargs) -> (User | None):
+        ref = self.db.collection("users").document(id_)
+        user = None
+        cached = self.users.get(id_)
+        if cached is not None and self.pending is None:
+            # the update only applies if the user is unchanged since this instance's copy was read or
+            # written, another instance may have changed it since. If it applies, the copy with the
+            # changes merged in is the stored user and it is not read back.
+            try:
+                result = ref.update(kwargs, option=self.db.write_option(last_update_time=cached[1]))
+                user = dataclasses.replace(cached[0], **kwargs)
+                self.users[id_] = (user, result.update_time)
+            except FailedPrecondition:
+                pass
+
+        if user is None and self.pending is None:
+            ref.update(kwargs)
+            user = not_none(self.get_user_by_id(id_))
+        elif user is None:
+            # the batch is committed later and its update time is not known until then, so the copy
+            # is dropped. The changes are merged into it for the return value, without a read.
+            self.update_document(ref, kwargs)
+            self.users.pop(id_, None)
+            if cached is not None:
+                user = dataclasses.replace(cached[0], **kwargs)
+
+        if "is_admin" in kwargs:
+            self.admins = None
+            self.bump_version("admins")
+        return user
 
     def get_users(self) -> list[User]:
         return [User(user.id, **not_none(user.to_dict())) for user in self.db.collection("users").stream()]
@@ -72,12 +261,12 @@ class Firestore(DBInterface):
         """
         return self.update_user(id_, is_admin=1)
 
-    def create_product(self, name, price: str, description: str, image: str):
+    def create_product(self, name, price: Money, description: str, image: str):
         """Creates a product in the database
 
         Args:
             name ([type]): The product's name
-            price (str): The product's price
+            price (Money): The product's price
             description (str): The product's description
             image (str): The product's image
 
@@ -86,10 +275,14 @@ class Firestore(DBInterface):
         """
         self.db.collection("products").add({
             "name": name,
-            "price": price,
+            "price": price.amount,
+            "currency": price.currency,
             "description": description,
-            "image": image
+            "image": image,
+            "published": True,
+            "status": "IN_STOCK",
         })
+        self.catalog.clear()
 
     def get_products(self) -> list[Product]:
         """Gets all products from the database
@@ -97,18 +290,28 @@ class Firestore(DBInterface):
         Returns:
             list[Product]: The products
         """
-        return [Product(product.id, **not_none(product.to_dict())) for product in self.db.collection("products").stream()]
+        self.check_catalog_version()
+        if ("products",) not in self.catalog:
+            self.catalog[("products",)] = [product_from_dict(not_none(product.to_dict()), product.id)
+                                           for product in self.db.collection("products").stream()]
+        return self.catalog[("products",)]
 
     def get_products_by_name(self, name: str) -> list[Product]:
-        products = self.db.collection("products").where(
-            filter=FieldFilter("name", "==", name)).stream()
-        return [Product(product.id, **not_none(product.to_dict())) for product in products]
+        self.check_catalog_version()
+        if ("name", name) not in self.catalog:
+            products = self.db.collection("products").where(
+                filter=FieldFilter("name", "==", name)).stream()
+            self.catalog[("name", name)] = [product_from_dict(not_none(product.to_dict()), product.id)
+                                            for product in products]
+        return self.catalog[("name", name)]
 
     def get_product_by_id(self, id_: str) -> Union[Product, None]:
-        product = self.db.collection("products").document(id_).get()
-        if product.exists:
-            return Product(id_=product.id, **not_none(product.to_dict()))
-        return None
+        self.check_catalog_version()
+        if ("product", id_) not in self.catalog:
+            product = self.db.collection("products").document(id_).get()
+            self.catalog[("product", id_)] = product_from_dict(not_none(product.to_dict()), product.id) \
+                if product.exists else None
+        return self.catalog[("product", id_)]
 
     def remove_product(self, id_: str):
         """Removes a product from the database
@@ -117,106 +320,194 @@ class Firestore(DBInterface):
             id_ (str): The product's ID
         """
         self.db.collection("products").document(id_).delete()
+        self.catalog.clear()
+
+    def add_to_cart(self, user_id, product: str, quantity: int, price: Money):
+        # carts map product IDs to a snapshot of the product and a quantity, changed with an
+        # increment, so adding never reads or rewrites the rest of the cart. Carts stored as an array
+        # must have been converted by migrations.py, a merge would replace the array. Adding a
+        # product again replaces its snapshot, and a running total kept with increments would stop
+        # matching the snapshots when the price changed in between, so carts store no total and
+        # get_cart sums the snapshots.
+        snapshot = not_none(self.get_product_by_id(product))
+        if price is not None:
+            snapshot = dataclasses.replace(snapshot, price=price)
+        self.set_document(self.db.collection("carts").document(user_id), {
+            "items": {
+                product: {
+                    "product": product_to_dict(snapshot),
+                    "quantity": Increment(quantity),
+                },
+            },
+        }, merge=True)
 
-    def add_to_cart(self, user_id, product: str, quantity: int, price: Decimal):
-        self.db.collection("carts").document(user_id).set({
-            "items": [{
-                "product_id": product,
-                "quantity": quantity,
-            }],
-        })
-
-    def get_cart_items(self, user_id) -> list[CartItem]:
-
-        cart_ref = self.db.collection("carts").document(user_id).get()
-
-        cart: list[CartItem] = []
+    def get_products_by_ids(self, ids: list[str]) -> dict[str, Product]:
+        """Gets several products, reading the ones that are not cached in a single request
 
-        if cart_ref.exists:
-            not_none(cart_ref.to_dict())
-            cart_dict = not_none(cart_ref.to_dict())
-            cart_items = cart_dict["items"]
-            for item in cart_items:
-                product = self.get_product_by_id(item["product_id"])
-                if product is not None:
-                    cart.append(
-                        CartItem(product=product, quantity=item["quantity"]))
+        Args:
+            ids (list[str]): The products' IDs
 
-        return cart
+        Returns:
+            dict[str, Product]: The products that exist, keyed by ID
+        """
+        self.check_catalog_version()
+        products: dict[str, Optional[Product]] = {}
+        missing = []
+        for id_ in set(ids):
+            if ("product", id_) in self.catalog:
+                products[id_] = self.catalog[("product", id_)]
+            else:
+                missing.append(self.db.collection("products").document(id_))
+
+        if missing:
+            for product in self.db.get_all(missing):
+                products[product.id] = product_from_dict(not_none(product.to_dict()), product.id) \
+                    if product.exists else None
+                self.catalog[("product", product.id)] = products[product.id]
+
+        return {id_: product for id_, product in products.items() if product is not None}
+
+    def cart_from_snapshot(self, cart, convert: bool = True) -> DBInterface.GetCartReturn:
+        """Reads a cart document, converting carts stored as an array of items to the map layout
 
-    def get_cart(self, user_id) -> dict[str, Union[Decimal, list[CartItem]]]:
+        Args:
+            cart (DocumentSnapshot): The cart document
+            convert (bool, optional): Rewrite carts stored as an array in the map layout. Defaults to True.
 
-        total_cost = Decimal(0.0)
-        cart_items = self.get_cart_items(user_id)
+        Returns:
+            DBInterface.GetCartReturn: The cart's items and total cost
+        """
+        if not cart.exists:
+            return {"total_cost": Money(0), "products": []}
+
+        data = not_none(cart.to_dict())
+        if isinstance(data["items"], list):
+            products = self.get_products_by_ids([item["product_id"] for item in data["items"]])
+            items = [CartItem(product=products[item["product_id"]], quantity=item["quantity"])
+                     for item in data["items"] if item["product_id"] in products]
+            total_cost = sum((item.product.price * item.quantity for item in items), Money(0))
+            if convert:
+                self.set_document(cart.reference, {
+                    "items": {item.product.id_: {"product": product_to_dict(item.product), "quantity": item.quantity}
+                              for item in items},
+                })
+            return {"total_cost": total_cost, "products": items}
+
+        items = [CartItem(product=product_from_dict(item["product"]), quantity=item["quantity"])
+                 for item in data["items"].values() if item["quantity"] > 0]
+        if not items:
+            return {"total_cost": Money(0), "products": []}
+        # carts store no total, see add_to_cart
+        return {"total_cost": sum((item.product.price * item.quantity for item in items), Money(0)),
+                "products": items}
 
-        for item in cart_items:
-            total_cost += Decimal(item.product.price) * item.quantity
+    def get_cart_items(self, user_id) -> list[CartItem]:
+        return self.get_cart(user_id)["products"]
 
-        return {
-            "total_cost": total_cost,
-            "products": cart_items
-        }
+    def get_cart(self, user_id) -> DBInterface.GetCartReturn:
+        return self.cart_from_snapshot(self.db.collection("carts").document(user_id).get())
 
     def remove_item_from_cart(self, user_id: str, item: CartItem):
-        self.db.collection("carts").document(user_id).update({"items": ArrayRemove(
-            [{"product_id": item.product.id_, "quantity": item.quantity}])})
+        self.update_document(self.db.collection("carts").document(user_id), {
+            FieldPath("items", item.product.id_).to_api_repr(): DELETE_FIELD,
+        })
+        return True
 
-    def create_order(self, user_id: str, total_cost: Decimal, items: list[CartItem]):
+    def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]):
         order_ref = self.db.collection("orders").document()
         order_ref.set({
             "id_": order_ref.id,
             "user": dataclasses.asdict(not_none(self.get_user_by_id(user_id))),
-            "total_cost": float(total_cost),
+            "total_cost": total_cost.amount,
+            "currency": total_cost.currency,
             "state": OrderState.PENDING.value,
-            "items": [{"product": dataclasses.asdict(item.product), "quantity": item.quantity} for item in items],
+            "items": [{"product": product_to_dict(item.product), "quantity": item.quantity} for item in items],
         })
         return order_ref.id
 
+    def place_order(self, user_id: str) -> Optional[str]:
+        cart_ref = self.db.collection("carts").document(user_id)
+        user_ref = self.db.collection("users").document(user_id)
+        order_ref = self.db.collection("orders").document()
+
+        # the transaction reads the cart and the user in one request and commits the order and the
+        # cleared cart together, it is retried if the cart changes in between
+        @firestore.transactional
+        def place(transaction) -> Optional[str]:
+            snapshots = {snapshot.reference.parent.id: snapshot
+                         for snapshot in transaction.get_all([cart_ref, user_ref])}
+            if not snapshots["users"].exists:
+                return None
+            # the cart is deleted below, so an array cart is not worth converting
+            cart = self.cart_from_snapshot(snapshots["carts"], convert=False)
+            if not cart["products"]:
+                return None
+
+            items, total_cost = cart["products"], cart["total_cost"]
+            user = User(user_id, **not_none(snapshots["users"].to_dict()))
+            self.users[user_id] = (user, snapshots["users"].update_time)
+            transaction.set(order_ref, {
+                "id_": order_ref.id,
+                "user": dataclasses.asdict(user),
+                "total_cost": total_cost.amount,
+                "currency": total_cost.currency,
+                "state": OrderState.PENDING.value,
+                "items": [{"product": product_to_dict(item.product), "quantity": item.quantity} for item in items],
+            })
+            transaction.delete(cart_ref)
+            return order_ref.id
+
+        return place(self.db.transaction())
+
     def get_orders(self, **kwargs) -> list[Order]:
-        orders = self.db.collection("orders").stream()
-        return [Order(order.id, **not_none(order.to_dict())) for order in orders]
+        # orders keep a copy of their user, so they are filtered by the copy's ID
+        query = self.db.collection("orders")
+        if "user_id" in kwargs:
+            query = query.where(filter=FieldFilter("user.id_", "==", kwargs["user_id"]))
+        if "state" in kwargs:
+            query = query.where(filter=FieldFilter("state", "==", OrderState(kwargs["state"]).value))
+        return [order_from_dict(order.id, not_none(order.to_dict())) for order in query.stream()]
 
     def get_orders_by_order_state(self, state: OrderState) -> list[Order]:
-        orders = self.db.collection("orders").where(
-            filter=FieldFilter("state", "==", state)).stream()
-        return [Order(order.id, **not_none(order.to_dict())) for order in orders]
+        return self.get_orders(state=state)
 
     def get_order_by_id(self, id_):
         order = self.db.collection("orders").document(id_).get()
         if order.exists:
-            return Order(order.id, **not_none(order.to_dict()))
+            return order_from_dict(order.id, not_none(order.to_dict()))
         return None
 
     def update_order(self, order_id, state):
         self.db.collection("orders").document(
-            order_id).update({"state": state})
+            order_id).update({"state": OrderState(state).value})
 
     def update_product(self, id_: str, **kwargs):
         self.db.collection("products").document(id_).update(kwargs)
+        self.catalog.clear()
 
     def create_order_in_progress(self, user_id: str, product: Product):
-        self.db.collection("orders_id_progress").document(user_id).set({
+        self.set_document(self.db.collection("orders_id_progress").document(user_id), {
             "quantity": 0,
-            "product": dataclasses.asdict(product),
+            "product": product_to_dict(product),
         })
 
     def update_order_in_progress(self, user_id: str, quantity: int):
-        self.db.collection("orders_id_progress").document(
-            user_id).update({"quantity": quantity})
+        self.update_document(self.db.collection("orders_id_progress").document(user_id),
+                             {"quantity": quantity})
 
     def get_order_in_progress(self, user_id: str) -> (OrderInProgress | None):
         order = self.db.collection(
             "orders_id_progress").document(user_id).get()
         if order.exists:
             order = not_none(order.to_dict())
-            return OrderInProgress(product=Product(**order["product"]), quantity=order["quantity"])
+            return OrderInProgress(product=product_from_dict(order["product"]), quantity=order["quantity"])
         return None
 
     def remove_order_in_progress(self, user_id: str):
-        self.db.collection("orders_id_progress").document(user_id).delete()
+        self.delete_document(self.db.collection("orders_id_progress").document(user_id))
 
     def update_user_navigation(self, user_id: str, path: str, reset: bool = False):
-        self.db.collection("navigation").document(user_id).set({
+        self.set_document(self.db.collection("navigation").document(user_id), {
             "current_page": path,
             "breadcrump": ArrayUnion([path]) if not reset else [path]
         }, merge=True)
@@ -227,3 +518,31 @@ class Firestore(DBInterface):
             navigation = not_none(navigation.to_dict())
             return NavigationHistory(user_id=user_id, breadcrumb=navigation["breadcrump"], current_page=navigation["current_page"])
         return NavigationHistory(user_id=user_id, breadcrumb=[], current_page="")
+
+    def get_conversation_state(self, chat_id: str) -> ConversationState:
+        state = self.db.collection("conversations").document(chat_id).get()
+        if state.exists:
+            state = not_none(state.to_dict())
+            return ConversationState(chat_id=chat_id, current=state["current"], path=state["path"])
+        return ConversationState(chat_id=chat_id, current="", path=[])
+
+    def save_conversation_state(self, state: ConversationState):
+        self.set_document(self.db.collection("conversations").document(state.chat_id), {
+            "current": state.current,
+            "path": state.path,
+        })
+
+    def claim_update(self, update_id: int) -> bool:
+        # create() fails if the document exists, so only one delivery of an update can claim it.
+        # expires_at lets a Firestore TTL policy remove old claims.
+        try:
+            self.db.collection("processed_updates").document(str(update_id)).create({
+                "expires_at": datetime.now(timezone.utc) + timedelta(days=1),
+            })
+        except AlreadyExists:
+            return False
+        return True
+
+    def release_update(self, update_id: int):
+        # like the claim, never part of an open batch
+        self.db.collection("processed_updates").document(str(update_id)).delete()
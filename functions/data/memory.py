@@ -0,0 +1,390 @@
+"""A database kept in the memory of the process, for a bot polling from a single instance.
+
+Every table is a dict keyed by ID, with indexes for the lookups that are not by ID, so each call
+takes microseconds. When given a directory the database survives restarts. Every write is appended
+to a log there, and every snapshot_interval writes the tables are written to a snapshot and the
+log is started over. On start the snapshot is loaded and the log replayed over it.
+
+The log is flushed to the operating system on every write, so it survives the process crashing
+but a write can be lost if the machine loses power before the OS writes it out. Snapshots are
+synced to disk and replaced atomically. Both are pickles, only point the database at a directory
+it wrote.
+"""
+
+# pylint: disable = missing-function-docstring
+
+import dataclasses
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Optional
+
+import config
+from .DatabaseInterface import (CartItem, ConversationState, DBInterface, NavigationHistory, Order, OrderInProgress,
+                                OrderItem, OrderState, Product, User)
+from .money import Money
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("meta", "users", "products", "carts", "orders", "orders_in_progress", "navigation", "conversations",
+          "updates")
+
+# seconds a claimed update is remembered for, like the processed_updates documents in Firestore
+UPDATE_TTL = 24 * 60 * 60
+
+
+class MemoryDb(DBInterface):
+    """Implementation of the DBInterface in process memory, optionally persisted to a directory"""
+
+    def __init__(self, path: str = config.MEMORY_DB_PATH, snapshot_interval: int = config.MEMORY_SNAPSHOT_INTERVAL):
+        """
+        Args:
+            path (str, optional): The directory the snapshot and the log are kept in, empty keeps
+                nothing on disk. Defaults to config.MEMORY_DB_PATH.
+            snapshot_interval (int, optional): The writes logged before a snapshot is taken.
+                Defaults to config.MEMORY_SNAPSHOT_INTERVAL.
+        """
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.RLock()
+        self.tables: dict[str, dict] = {table: {} for table in TABLES}
+
+        self.admins: set[str] = set()
+        self.products_by_name: dict[str, set[str]] = defaultdict(set)
+        self.orders_by_user: dict[str, set[str]] = defaultdict(set)
+        self.orders_by_state: dict[OrderState, set[str]] = defaultdict(set)
+
+        # records written since the last snapshot, and those of the open batch
+        self.logged = 0
+        self.pending: Optional[list[tuple]] = None
+        self.log = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.recover()
+            self.log = open(self.log_path, "ab")  # pylint: disable = consider-using-with
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.path, "snapshot.pickle")
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.path, "log.pickle")
+
+    def recover(self):
+        """Loads the snapshot and replays the log written after it. A record cut short by a crash
+        ends the log, and is cut off so later records are not appended after it."""
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as snapshot:
+                self.tables.update(pickle.load(snapshot))
+        if not os.path.exists(self.log_path):
+            return
+
+        with open(self.log_path, "rb+") as log:
+            end = 0
+            while True:
+                try:
+                    operation, table, key, value = pickle.load(log)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                end = log.tell()
+                self.apply(operation, table, key, value)
+                self.logged += 1
+            if end != os.fstat(log.fileno()).st_size:
+                logger.warning("Dropped a partly written record at the end of %s", self.log_path)
+                log.truncate(end)
+
+        # the indexes are rebuilt from the tables rather than stored
+        for key, user in self.tables["users"].items():
+            self.index("users", key, None, user)
+        for key, product in self.tables["products"].items():
+            self.index("products", key, None, product)
+        for key, order in self.tables["orders"].items():
+            self.index("orders", key, None, order)
+
+    def snapshot(self):
+        """Writes the tables to a new snapshot and starts the log over"""
+        if not self.path:
+            return
+        with self.lock:
+            now = time.time()
+            self.tables["updates"] = {key: expires for key, expires in self.tables["updates"].items() if expires > now}
+
+            temporary = self.snapshot_path + ".tmp"
+            with open(temporary, "wb") as snapshot:
+                pickle.dump(self.tables, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(temporary, self.snapshot_path)
+
+            # replaying the old log over the new snapshot gives the same tables, so a crash before
+            # the log is emptied loses nothing
+            self.log.truncate(0)
+            self.log.seek(0)
+            self.logged = 0
+
+    def close(self):
+        """Takes a snapshot and closes the log"""
+        if self.log is not None:
+            self.snapshot()
+            self.log.close()
+            self.log = None
+
+    def index(self, table: str, key: str, old: Any, new: Any):
+        """Moves a row from the index entries of its old value to those of its new value"""
+        if table == "users":
+            self.admins.discard(key)
+            if new is not None and new.is_admin:
+                self.admins.add(key)
+        elif table == "products":
+            if old is not None:
+                self.products_by_name[old.name].discard(key)
+            if new is not None:
+                self.products_by_name[new.name].add(key)
+        elif table == "orders":
+            if old is not None:
+                self.orders_by_user[old.user.id_].discard(key)
+                self.orders_by_state[old.state].discard(key)
+            if new is not None:
+                self.orders_by_user[new.user.id_].add(key)
+                self.orders_by_state[new.state].add(key)
+
+    def apply(self, operation: str, table: str, key, value=None):
+        """Changes a row and its index entries"""
+        rows = self.tables[table]
+        old = rows.get(key)
+        if operation == "put":
+            rows[key] = value
+        else:
+            rows.pop(key, None)
+        self.index(table, key, old, value)
+
+    def write(self, operation: str, table: str, key, value=None):
+        """Changes a row and logs the change. Rows are replaced rather than changed in place, so
+        rows handed out earlier and the rows in the log never change."""
+        with self.lock:
+            self.apply(operation, table, key, value)
+            if self.log is None:
+                return
+            record = (operation, table, key, value)
+            if self.pending is not None:
+                self.pending.append(record)
+            else:
+                self.append([record])
+
+    def append(self, records: list[tuple]):
+        """Writes records to the end of the log, taking a snapshot if enough have been written"""
+        self.log.write(b"".join(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL) for record in records))
+        self.log.flush()
+        self.logged += len(records)
+        if self.logged >= self.snapshot_interval:
+            self.snapshot()
+
+    def put(self, table: str, key, value):
+        self.write("put", table, key, value)
+
+    def delete(self, table: str, key):
+        self.write("delete", table, key)
+
+    def next_id(self, name: str) -> str:
+        """Returns the next number of a sequence, as a string ID"""
+        number = self.tables["meta"].get(name, 0) + 1
+        self.put("meta", name, number)
+        return str(number)
+
+    @contextmanager
+    def batch(self):
+        # the writes of a batch are logged together, and no other thread sees them half done
+        with self.lock:
+            if self.pending is not None:
+                yield
+                return
+            self.pending = []
+            try:
+                yield
+            finally:
+                records, self.pending = self.pending, None
+                if records and self.log is not None:
+                    self.append(records)
+
+    def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "", is_admin: int = 0):
+        self.put("users", id_, User(id_, display_name, phone, address, is_admin))
+
+    def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "", address: str = "") -> bool:
+        with self.lock:
+            if id_ in self.tables["users"]:
+                return False
+            self.create_new_user(id_, display_name, phone, address)
+            return True
+
+    def get_admins(self) -> list[User]:
+        with self.lock:
+            return [dataclasses.replace(self.tables["users"][id_]) for id_ in self.admins]
+
+    def get_user_by_id(self, id_: str) -> (User | None):
+        user = self.tables["users"].get(id_)
+        return dataclasses.replace(user) if user is not None else None
+
+    def update_user(self, id_: str, **kwargs) -> User:
+        with self.lock:
+            user = dataclasses.replace(self.tables["users"][id_], **kwargs)
+            self.put("users", id_, user)
+            return dataclasses.replace(user)
+
+    def get_users(self) -> list[User]:
+        with self.lock:
+            return [dataclasses.replace(user) for user in self.tables["users"].values()]
+
+    def authenticate_user(self, id_: str) -> User:
+        return self.update_user(id_, is_admin=1)
+
+    def create_product(self, name, price: Money, description: str, image: str):
+        with self.lock:
+            id_ = self.next_id("product")
+            self.put("products", id_, Product(id_, name, price, description, image, True, "IN_STOCK"))
+
+    def get_products(self) -> list[Product]:
+        with self.lock:
+            return [dataclasses.replace(product) for product in self.tables["products"].values()]
+
+    def get_products_by_name(self, name: str) -> list[Product]:
+        with self.lock:
+            return [dataclasses.replace(self.tables["products"][id_]) for id_ in self.products_by_name.get(name, ())]
+
+    def get_product_by_id(self, id_: str) -> (Product | None):
+        product = self.tables["products"].get(id_)
+        return dataclasses.replace(product) if product is not None else None
+
+    def remove_product(self, id_: str):
+        self.delete("products", id_)
+
+    def update_product(self, id_, **kwargs):
+        with self.lock:
+            self.put("products", id_, dataclasses.replace(self.tables["products"][id_], **kwargs))
+
+    def add_to_cart(self, user_id, product: str, quantity: int, price: Money):
+        with self.lock:
+            snapshot = self.tables["products"][product]
+            if price is not None:
+                snapshot = dataclasses.replace(snapshot, price=price)
+            cart = dict(self.tables["carts"].get(user_id, {}))
+            if product in cart:
+                quantity += cart[product].quantity
+            cart[product] = CartItem(snapshot, quantity)
+            self.put("carts", user_id, cart)
+
+    def get_cart(self, user_id) -> DBInterface.GetCartReturn:
+        items = [CartItem(dataclasses.replace(item.product), item.quantity)
+                 for item in self.tables["carts"].get(user_id, {}).values()]
+        return {"total_cost": sum((item.product.price * item.quantity for item in items), Money(0)),
+                "products": items}
+
+    def get_cart_items(self, user_id) -> list[CartItem]:
+        return self.get_cart(user_id)["products"]
+
+    def remove_item_from_cart(self, user_id: str, item: CartItem) -> bool:
+        with self.lock:
+            cart = dict(self.tables["carts"].get(user_id, {}))
+            if cart.pop(item.product.id_, None) is None:
+                return False
+            self.put("carts", user_id, cart)
+            return True
+
+    def copy_order(self, order: Order) -> Order:
+        return dataclasses.replace(order, user=dataclasses.replace(order.user),
+                                   items=[dataclasses.replace(item, product=dataclasses.replace(item.product))
+                                          for item in order.items])
+
+    def get_orders(self, **kwargs) -> list[Order]:
+        with self.lock:
+            ids = set(self.tables["orders"])
+            if "user_id" in kwargs:
+                ids &= self.orders_by_user.get(kwargs["user_id"], set())
+            if "state" in kwargs:
+                ids &= self.orders_by_state.get(OrderState(kwargs["state"]), set())
+            return [self.copy_order(self.tables["orders"][id_]) for id_ in ids]
+
+    def get_orders_by_order_state(self, state: OrderState) -> list[Order]:
+        return self.get_orders(state=state)
+
+    def get_order_by_id(self, id_: str) -> (Order | None):
+        order = self.tables["orders"].get(id_)
+        return self.copy_order(order) if order is not None else None
+
+    def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]) -> str:
+        with self.lock:
+            id_ = self.next_id("order")
+            self.put("orders", id_, Order(id_, dataclasses.replace(self.tables["users"][user_id]), total_cost,
+                                          [OrderItem(str(index), dataclasses.replace(item.product), item.quantity,
+                                                     item.product.price)
+                                           for index, item in enumerate(items)], OrderState.PENDING))
+            return id_
+
+    def place_order(self, user_id: str) -> Optional[str]:
+        with self.batch():
+            cart = self.get_cart(user_id)
+            if not cart["products"] or user_id not in self.tables["users"]:
+                return None
+            id_ = self.create_order(user_id, cart["total_cost"], cart["products"])
+            self.delete("carts", user_id)
+            return id_
+
+    def update_order(self, order_id: str, state: OrderState):
+        with self.lock:
+            self.put("orders", order_id, dataclasses.replace(self.tables["orders"][order_id], state=OrderState(state)))
+
+    def create_order_in_progress(self, user_id: str, product: Product):
+        self.put("orders_in_progress", user_id, OrderInProgress(dataclasses.replace(product), 0))
+
+    def update_order_in_progress(self, user_id: str, quantity: int):
+        with self.lock:
+            order = self.tables["orders_in_progress"][user_id]
+            self.put("orders_in_progress", user_id, OrderInProgress(order.product, quantity))
+
+    def get_order_in_progress(self, user_id: str) -> (OrderInProgress | None):
+        order = self.tables["orders_in_progress"].get(user_id)
+        return OrderInProgress(dataclasses.replace(order.product), order.quantity) if order is not None else None
+
+    def remove_order_in_progress(self, user_id: str):
+        self.delete("orders_in_progress", user_id)
+
+    def update_user_navigation(self, user_id: str, path: str, reset: bool = False):
+        with self.lock:
+            navigation = self.tables["navigation"].get(user_id)
+            if reset or navigation is None:
+                breadcrumb = [path]
+            elif path in navigation.breadcrumb:
+                breadcrumb = navigation.breadcrumb
+            else:
+                breadcrumb = navigation.breadcrumb + [path]
+            self.put("navigation", user_id, NavigationHistory(user_id, path, breadcrumb))
+
+    def get_user_navigation(self, user_id: str) -> NavigationHistory:
+        navigation = self.tables["navigation"].get(user_id)
+        if navigation is None:
+            return NavigationHistory(user_id, "", [])
+        return NavigationHistory(user_id, navigation.current_page, list(navigation.breadcrumb))
+
+    def get_conversation_state(self, chat_id: str) -> ConversationState:
+        state = self.tables["conversations"].get(chat_id)
+        if state is None:
+            return ConversationState(chat_id, "", [])
+        return ConversationState(chat_id, state.current, list(state.path))
+
+    def save_conversation_state(self, state: ConversationState):
+        self.put("conversations", state.chat_id, ConversationState(state.chat_id, state.current, list(state.path)))
+
+    def claim_update(self, update_id: int) -> bool:
+        with self.lock:
+            expires = self.tables["updates"].get(update_id)
+            if expires is not None and expires > time.time():
+                return False
+            self.put("updates", update_id, time.time() + UPDATE_TTL)
+            return True
+
+    def release_update(self, update_id: int):
+        self.delete("updates", update_id)
@@ -0,0 +1,134 @@
+"""
+This module contains the money type used for prices and totals.
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional, Union
+
+import config
+
+# digits after the decimal point for currencies that do not use two
+MINOR_UNITS = {"BHD": 3, "JPY": 0, "KRW": 0, "KWD": 3, "OMR": 3, "TND": 3, "XAF": 0, "XOF": 0}
+
+
+@dataclass(frozen=True, slots=True)
+class Money:
+    """
+    An amount of money, kept as an integer number of the currency's minor units so that prices
+    add up exactly and can be stored, indexed and sorted as integers.
+
+    Amounts in different currencies cannot be added, subtracted or compared, except zero, which is
+    the same in every currency. So sum() can start from 0 or Money(0) whatever the currency summed.
+
+    Attributes:
+        amount (int): The amount in minor units, e.g. pesewas for GHS or cents for USD
+        currency (str): The ISO 4217 code of the currency
+    """
+    amount: int
+    currency: str = config.CURRENCY
+
+    @classmethod
+    def parse(cls, value: Union[str, int, float, Decimal], currency: Optional[str] = None) -> "Money":
+        """Converts an amount in major units, such as "25.50", to Money
+
+        Args:
+            value (Union[str, int, float, Decimal]): The amount in major units
+            currency (Optional[str], optional): The currency. Defaults to config.CURRENCY.
+
+        Returns:
+            Money: The amount in minor units
+        """
+        currency = currency or config.CURRENCY
+        minor = Decimal(str(value)).scaleb(MINOR_UNITS.get(currency, 2))
+        return cls(int(minor.quantize(Decimal(1), rounding=ROUND_HALF_UP)), currency)
+
+    @classmethod
+    def from_stored(cls, amount: Union[str, int, float], currency: Optional[str] = None) -> "Money":
+        """Reads an amount from the database. Amounts stored before there was a currency next to
+        them are in major units.
+
+        Args:
+            amount (Union[str, int, float]): The stored amount
+            currency (Optional[str], optional): The stored currency, None for amounts in major units.
+
+        Returns:
+            Money: The amount
+        """
+        if currency is None:
+            return cls.parse(amount)
+        return cls(int(amount), currency)
+
+    @property
+    def exponent(self) -> int:
+        """Digits after the decimal point in the currency"""
+        return MINOR_UNITS.get(self.currency, 2)
+
+    def to_decimal(self) -> Decimal:
+        """The amount in major units"""
+        return Decimal(self.amount).scaleb(-self.exponent)
+
+    def check_currency(self, other: "Money"):
+        """Raises a ValueError when amounts in different currencies other than zero are combined"""
+        if self.currency != other.currency and self.amount and other.amount:
+            raise ValueError(f"Cannot combine {self.currency} and {other.currency}")
+
+    def combined_currency(self, other: "Money") -> str:
+        """The currency of the result of combining two amounts, which a zero does not decide"""
+        self.check_currency(other)
+        return self.currency if self.amount or not other.amount else other.currency
+
+    def __add__(self, other: "Money") -> "Money":
+        return Money(self.amount + other.amount, self.combined_currency(other))
+
+    def __radd__(self, other: Union["Money", int]) -> "Money":
+        # lets sum() start from 0
+        if other == 0:
+            return self
+        return self + other  # type: ignore
+
+    def __sub__(self, other: "Money") -> "Money":
+        return Money(self.amount - other.amount, self.combined_currency(other))
+
+    def __lt__(self, other: "Money") -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self.check_currency(other)
+        return self.amount < other.amount
+
+    def __le__(self, other: "Money") -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self.check_currency(other)
+        return self.amount <= other.amount
+
+    def __gt__(self, other: "Money") -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self.check_currency(other)
+        return self.amount > other.amount
+
+    def __ge__(self, other: "Money") -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self.check_currency(other)
+        return self.amount >= other.amount
+
+    def __mul__(self, quantity: int) -> "Money":
+        return Money(self.amount * quantity, self.currency)
+
+    __rmul__ = __mul__
+
+    def __neg__(self) -> "Money":
+        return Money(-self.amount, self.currency)
+
+    def __bool__(self) -> bool:
+        return self.amount != 0
+
+    def __str__(self) -> str:
+        exponent = self.exponent
+        whole, fraction = divmod(abs(self.amount), 10 ** exponent)
+        sign = "-" if self.amount < 0 else ""
+        if exponent == 0:
+            return f"{self.currency} {sign}{whole:,}"
+        return f"{self.currency} {sign}{whole:,}.{fraction:0{exponent}d}"
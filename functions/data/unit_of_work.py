@@ -0,0 +1,318 @@
+"""
+This module contains a unit of work that wraps a database for the duration of a Telegram update.
+"""
+
+import dataclasses
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+from .DatabaseInterface import (CartItem, ConversationState, DBInterface, NavigationHistory, Order, OrderInProgress,
+                                OrderState, Product, User)
+from .money import Money
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UnitOfWorkStats:
+    """
+    Counts what a unit of work did
+
+    Attributes:
+        reads (int): Reads sent to the database
+        reads_saved (int): Reads answered from memory
+        writes (int): Writes made by the handlers
+        commits (int): Commits the writes were sent in
+    """
+    reads: int = 0
+    reads_saved: int = 0
+    writes: int = 0
+    commits: int = 0
+
+    @property
+    def round_trips(self) -> int:
+        """Requests made to the database"""
+        return self.reads + self.commits
+
+    @property
+    def round_trips_saved(self) -> int:
+        """Requests the unit of work avoided"""
+        return self.reads_saved + self.writes - self.commits
+
+
+@dataclass
+class UpdateScope:
+    """
+    What a unit of work remembers and collects for the update a thread is handling
+
+    Attributes:
+        reads (dict[Hashable, Any]): The values read, by key
+        writes (list[Callable[[], Any]]): The writes collected
+        dirty (set[Hashable]): Keys whose remembered value is missing because a collected write changed them
+        changes (dict[Hashable, dict[str, Any]]): Fields collected writes changed in values that are not
+            remembered, merged into them when they are read
+        stats (UnitOfWorkStats): What the update did so far
+        active (bool): Whether an update is being handled
+    """
+    reads: dict[Hashable, Any] = field(default_factory=dict)
+    writes: list[Callable[[], Any]] = field(default_factory=list)
+    dirty: set[Hashable] = field(default_factory=set)
+    changes: dict[Hashable, dict[str, Any]] = field(default_factory=dict)
+    stats: UnitOfWorkStats = field(default_factory=UnitOfWorkStats)
+    active: bool = False
+
+
+class UnitOfWork(DBInterface):
+    """
+    Wraps a database for the duration of one update.
+
+    Reads are remembered until the update ends, so handlers can ask for the same user or cart
+    repeatedly without another request. Writes are applied to the remembered values and collected,
+    then sent to the database in a single batch when the update ends. A read of something a
+    collected write changed in a way that cannot be worked out locally sends the writes first.
+    Writes whose result is needed straight away, such as create_order, are sent immediately.
+    update_user does not read the user to return it, so it returns None unless the user is
+    remembered, and the changes are merged into the user if it is read later in the update.
+    Outside of an update, for example in the order triggers, calls go straight to the database.
+
+    An instance can handle several updates at once, each on a thread of its own, so what is
+    remembered and collected is kept per thread and one update never sees or sends another's.
+    """
+
+    def __init__(self, db: DBInterface):
+        self.db = db
+        self.local = threading.local()
+        self.totals = UnitOfWorkStats()
+        self.totals_lock = threading.Lock()
+
+    @property
+    def scope(self) -> UpdateScope:
+        """The scope of the update this thread is handling"""
+        scope = getattr(self.local, "scope", None)
+        if scope is None:
+            scope = self.local.scope = UpdateScope()
+        return scope
+
+    @property
+    def reads(self) -> dict[Hashable, Any]:
+        """The values this thread's update remembers"""
+        return self.scope.reads
+
+    @property
+    def stats(self) -> UnitOfWorkStats:
+        """What this thread's update did so far"""
+        return self.scope.stats
+
+    @property
+    def active(self) -> bool:
+        """Whether this thread is handling an update"""
+        return self.scope.active
+
+    def begin_update(self):
+        self.local.scope = UpdateScope(active=True)
+        self.db.begin_update()
+
+    def end_update(self):
+        try:
+            self.flush()
+        finally:
+            scope, self.local.scope = self.scope, UpdateScope()
+            self.db.end_update()
+
+        with self.totals_lock:
+            for stat in dataclasses.fields(UnitOfWorkStats):
+                setattr(self.totals, stat.name, getattr(self.totals, stat.name) +
+                        getattr(scope.stats, stat.name))
+        logger.debug("Update made %d database round trips and saved %d",
+                     scope.stats.round_trips, scope.stats.round_trips_saved)
+
+    def flush(self):
+        """Sends the collected writes to the database in one batch"""
+        scope = self.scope
+        if scope.writes:
+            writes, scope.writes = scope.writes, []
+            with self.db.batch():
+                for write in writes:
+                    write()
+            scope.stats.commits += 1
+        scope.dirty.clear()
+        scope.changes.clear()
+
+    def read(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Returns the remembered value of a key, fetching it the first time"""
+        scope = self.scope
+        if not scope.active:
+            return fetch()
+        if key in scope.dirty:
+            self.flush()
+        if key in scope.reads:
+            scope.stats.reads_saved += 1
+            return scope.reads[key]
+
+        scope.stats.reads += 1
+        scope.reads[key] = fetch()
+        return scope.reads[key]
+
+    def write(self, write: Callable[[], Any], *changed: Hashable):
+        """Collects a write, forgetting the remembered values it changes"""
+        scope = self.scope
+        if not scope.active:
+            write()
+            return
+        scope.writes.append(write)
+        scope.stats.writes += 1
+        for key in changed:
+            scope.reads.pop(key, None)
+            scope.dirty.add(key)
+
+    def write_now(self, write: Callable[[], Any], *changed: Hashable) -> Any:
+        """Sends the collected writes and then a write whose result is needed"""
+        self.flush()
+        self.stats.writes += 1
+        self.stats.commits += 1
+        for key in changed:
+            self.reads.pop(key, None)
+        return write()
+
+    def create_new_user(self, id_: str, display_name: str = "", phone: str = "", address: str = "", is_admin: int = 0):
+        self.write(lambda: self.db.create_new_user(id_, display_name, phone, address, is_admin), ("admins",))
+        self.reads[("user", id_)] = User(id_, display_name, phone, address, is_admin)
+
+    def create_user_if_absent(self, id_: str, display_name: str = "", phone: str = "", address: str = "") -> bool:
+        return self.write_now(lambda: self.db.create_user_if_absent(id_, display_name, phone, address),
+                              ("user", id_))
+
+    def get_admins(self) -> list[User]:
+        return self.read(("admins",), self.db.get_admins)
+
+    def get_user_by_id(self, id_: str) -> (User | None):
+        def fetch():
+            user = self.db.get_user_by_id(id_)
+            changes = self.scope.changes.pop(("user", id_), {})
+            return dataclasses.replace(user, **changes) if user is not None and changes else user
+
+        return self.read(("user", id_), fetch)
+
+    def update_user(self, id_: str, **kwargs) -> (User | None):
+        if not self.active:
+            return self.db.update_user(id_, **kwargs)
+
+        self.write(lambda: self.db.update_user(id_, **kwargs),
+                   *([("admins",)] if "is_admin" in kwargs else []))
+        user = self.reads.get(("user", id_))
+        if user is None:
+            # the user is not read to return it, the changes are merged into it if it is read later
+            self.scope.changes.setdefault(("user", id_), {}).update(kwargs)
+            return None
+
+        self.reads[("user", id_)] = dataclasses.replace(user, **kwargs)
+        return self.reads[("user", id_)]
+
+    def get_users(self) -> list[User]:
+        return self.read(("users",), self.db.get_users)
+
+    def authenticate_user(self, id_: str) -> (User | None):
+        return self.update_user(id_, is_admin=1)
+
+    def create_product(self, name, price: Money, description: str, image: str):
+        return self.write_now(lambda: self.db.create_product(name, price, description, image), *self.catalog_keys())
+
+    def get_products(self) -> list[Product]:
+        return self.read(("products",), self.db.get_products)
+
+    def get_products_by_name(self, name: str) -> list[Product]:
+        return self.read(("products_by_name", name), lambda: self.db.get_products_by_name(name))
+
+    def get_product_by_id(self, id_: str) -> (Product | None):
+        return self.read(("product", id_), lambda: self.db.get_product_by_id(id_))
+
+    def remove_product(self, id_: str):
+        return self.write_now(lambda: self.db.remove_product(id_), *self.catalog_keys())
+
+    def update_product(self, id_, **kwargs: str):
+        return self.write_now(lambda: self.db.update_product(id_, **kwargs), *self.catalog_keys())
+
+    def catalog_keys(self) -> list[Hashable]:
+        """The remembered keys that hold products"""
+        return [key for key in self.reads if key[0] in ("products", "products_by_name", "product")]
+
+    def get_cart_items(self, user_id: str) -> list[CartItem]:
+        return self.read(("cart_items", user_id), lambda: self.db.get_cart_items(user_id))
+
+    def add_to_cart(self, user_id, product: str, quantity: int, price: Money):
+        self.write(lambda: self.db.add_to_cart(user_id, product, quantity, price),
+                   ("cart", user_id), ("cart_items", user_id))
+
+    def get_cart(self, user_id: str) -> DBInterface.GetCartReturn:
+        return self.read(("cart", user_id), lambda: self.db.get_cart(user_id))
+
+    def remove_item_from_cart(self, user_id: str, item: CartItem) -> bool:
+        self.write(lambda: self.db.remove_item_from_cart(user_id, item),
+                   ("cart", user_id), ("cart_items", user_id))
+        return True
+
+    def get_orders(self, **kwargs: str) -> list[Order]:
+        return self.db.get_orders(**kwargs)
+
+    def get_orders_by_order_state(self, state: OrderState) -> list[Order]:
+        return self.db.get_orders_by_order_state(state)
+
+    def get_order_by_id(self, id_: str) -> (Order | None):
+        return self.db.get_order_by_id(id_)
+
+    def create_order(self, user_id: str, total_cost: Money, items: list[CartItem]) -> str:
+        return self.write_now(lambda: self.db.create_order(user_id, total_cost, items))
+
+    def place_order(self, user_id: str) -> (str | None):
+        return self.write_now(lambda: self.db.place_order(user_id), ("cart", user_id), ("cart_items", user_id))
+
+    def update_order(self, order_id: str, state: OrderState):
+        return self.write_now(lambda: self.db.update_order(order_id, state))
+
+    def create_order_in_progress(self, user_id: str, product: Product):
+        self.write(lambda: self.db.create_order_in_progress(user_id, product))
+        self.reads[("order_in_progress", user_id)] = OrderInProgress(product=product, quantity=0)
+
+    def update_order_in_progress(self, user_id: str, quantity: int):
+        order = self.get_order_in_progress(user_id)
+        if order is None:
+            self.write(lambda: self.db.update_order_in_progress(user_id, quantity),
+                       ("order_in_progress", user_id))
+            return
+
+        self.write(lambda: self.db.update_order_in_progress(user_id, quantity))
+        self.reads[("order_in_progress", user_id)] = dataclasses.replace(order, quantity=quantity)
+
+    def get_order_in_progress(self, user_id: str) -> (OrderInProgress | None):
+        return self.read(("order_in_progress", user_id), lambda: self.db.get_order_in_progress(user_id))
+
+    def remove_order_in_progress(self, user_id: str):
+        self.write(lambda: self.db.remove_order_in_progress(user_id))
+        self.reads[("order_in_progress", user_id)] = None
+
+    def update_user_navigation(self, user_id: str, path: str, reset: bool = False):
+        self.write(lambda: self.db.update_user_navigation(user_id, path, reset), ("navigation", user_id))
+
+    def get_user_navigation(self, user_id: str) -> NavigationHistory:
+        return self.read(("navigation", user_id), lambda: self.db.get_user_navigation(user_id))
+
+    def get_conversation_state(self, chat_id: str) -> ConversationState:
+        return self.read(("conversation", chat_id), lambda: self.db.get_conversation_state(chat_id))
+
+    def save_conversation_state(self, state: ConversationState):
+        state = dataclasses.replace(state, path=list(state.path))
+        self.write(lambda: self.db.save_conversation_state(state))
+        self.reads[("conversation", state.chat_id)] = state
+
+    def claim_update(self, update_id: int) -> bool:
+        return self.db.claim_update(update_id)
+
+    def release_update(self, update_id: int):
+        self.db.release_update(update_id)
+
+    def invalidate_catalog(self):
+        for key in self.catalog_keys():
+            self.reads.pop(key, None)
+        self.db.invalidate_catalog()
@@ -1,22 +1,84 @@
-"""Database module for the bot."""
+"""Database module for the bot.
+
+Database backends and media handlers are registered by name and their modules are only imported
+when they are selected, so a deployment never loads the libraries of the ones it does not use.
+"""
+
+from importlib import import_module
 
 from data.DatabaseInterface import DBInterface
+from data.async_interface import AsyncDBInterface
 from media_handler import MediaHandler  # pylint: disable = import-error
 
+# name -> "module:ClassName"
+DATABASES = {
+    "firestore": "data.firestore:Firestore",
+    "sql": "data.SqlDb:SqlDb",
+    "memory": "data.memory:MemoryDb",
+}
+
+ASYNC_DATABASES = {
+    "firestore": "data.async_firestore:AsyncFirestore",
+    "sql": "data.async_sql:AsyncSqlDb",
+}
+
+MEDIA_HANDLERS = {
+    "firebase": "media_handler:FirebaseStorage",
+}
+
+
+def load(registry: dict[str, str], name: str) -> type:
+    """Imports the class registered under a name
+
+    Args:
+        registry (dict[str, str]): The registry to look the name up in
+        name (str): The name the class is registered under
+
+    Raises:
+        ValueError: If nothing is registered under the name
+
+    Returns:
+        type: The registered class
+    """
+    if name not in registry:
+        raise ValueError(
+            f"Unknown implementation '{name}', expected one of {', '.join(registry)}")
 
-def get_db(db: DBInterface, *args, **kwargs) -> DBInterface:
+    module, _, class_name = registry[name].partition(":")
+    return getattr(import_module(module), class_name)
+
+
+def get_db(db_type: str, *args, **kwargs) -> DBInterface:
     """Returns a DB object
 
+    Args:
+        db_type (str): The name of the database backend, usually config.DB_TYPE
+
     Returns:
         DB: A DB object
     """
-    return db(*args, **kwargs)
+    return load(DATABASES, db_type)(*args, **kwargs)
+
+
+def get_async_db(db_type: str, *args, **kwargs) -> AsyncDBInterface:
+    """Returns a DB object for use from an event loop
+
+    Args:
+        db_type (str): The name of the database backend, usually config.DB_TYPE
+
+    Returns:
+        AsyncDBInterface: An async DB object
+    """
+    return load(ASYNC_DATABASES, db_type)(*args, **kwargs)
 
 
-def get_media_handler(handler: MediaHandler):
+def get_media_handler(handler_type: str) -> MediaHandler:
     """Returns a media handler object
 
+    Args:
+        handler_type (str): The name of the media handler, usually config.MEDIA_TYPE
+
     Returns:
         MediaHandler: A media handler object
     """
-    return handler()
+    return load(MEDIA_HANDLERS, handler_type)()
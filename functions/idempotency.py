@@ -0,0 +1,55 @@
+"""Drops Telegram updates that were already processed.
+
+Telegram redelivers an update when the webhook is slow to answer, so the same update_id can reach
+us more than once, possibly on different instances. Every new id is claimed in the database, which
+only lets the first claim succeed, and ids claimed here are remembered in memory. An id is only
+remembered once its claim succeeded, and an update whose processing failed is released again, so
+the delivery Telegram retries after an error is processed rather than dropped.
+"""
+
+from cachetools import LRUCache
+
+from data.DatabaseInterface import DBInterface
+
+
+class UpdateDeduplicator:
+    """Tracks the update_ids that have been processed"""
+
+    def __init__(self, db: DBInterface, size: int = 1024):
+        """
+        Args:
+            db (DBInterface): The database where update_ids are claimed
+            size (int, optional): How many update_ids to remember in memory. Defaults to 1024.
+        """
+        self.db = db
+        self.recent: LRUCache = LRUCache(maxsize=size)
+        self.processed = 0
+        self.duplicates = 0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Checks whether an update was already processed, claiming it if it was not
+
+        Args:
+            update_id (int): The update's ID
+
+        Returns:
+            bool: True if the update was processed before, False if it should be processed now
+        """
+        if update_id in self.recent or not self.claim(update_id):
+            self.duplicates += 1
+            return True
+
+        self.processed += 1
+        return False
+
+    def claim(self, update_id: int) -> bool:
+        """Claims an update_id in the database, remembering it if the claim succeeded"""
+        if not self.db.claim_update(update_id):
+            return False
+        self.recent[update_id] = True
+        return True
+
+    def release(self, update_id: int):
+        """Forgets an update_id whose processing failed, so a redelivery of it is processed"""
+        self.recent.pop(update_id, None)
+        self.db.release_update(update_id)
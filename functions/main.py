@@ -7,11 +7,19 @@
 # To get started, simply uncomment the below code or create your own.
 # Deploy with `firebase deploy`
 
+import dataclasses
+import json
+import statistics
+import time
+from collections import deque
+from functools import cache
+from typing import TYPE_CHECKING
 
 from firebase_functions import https_fn
 from firebase_functions.firestore_fn import (
     on_document_created,
     on_document_updated,
+    on_document_written,
     Change,
     Event,
     DocumentSnapshot,
@@ -20,14 +28,21 @@ from firebase_functions.firestore_fn import (
 import firebase_admin
 
 import sentry_sdk
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 from telebot import types
 
-from bot import bot, db
-
 import config
-from data.DatabaseInterface import Order, OrderItem, User
-from data.firestore import not_none
+from idempotency import UpdateDeduplicator
+from notifications import fan_out
+from tasks import TaskQueue, get_task_queue
+
+if TYPE_CHECKING:
+    from data.DatabaseInterface import DBInterface
+    from sender import RateLimitedTeleBot
+
+# pylint: disable=import-outside-toplevel
+# the bot is imported by the functions that handle updates and the triggers only load the database
+# and a sender, so a cold start only loads what the triggered function needs
 
 try:
     firebase_admin.initialize_app()
@@ -48,6 +63,63 @@ sentry_sdk.init(
 
 app = Flask(__name__)
 
+# how long the webhook took to answer, in milliseconds, for the most recent updates
+response_times: deque[float] = deque(maxlen=1000)
+
+
+@cache
+def get_deduplicator() -> UpdateDeduplicator:
+    """
+    Returns the instance's UpdateDeduplicator, creating it on first use.
+    """
+    from bot import db
+
+    return UpdateDeduplicator(db, config.PROCESSED_UPDATES_CACHE_SIZE)
+
+
+@cache
+def get_database() -> "DBInterface":
+    """
+    Returns the database for the triggers, which use it without loading the bot.
+    """
+    from db import get_db
+
+    return get_db(config.DB_TYPE)
+
+
+@cache
+def get_sender() -> "RateLimitedTeleBot":
+    """
+    Returns a rate limited bot without handlers, for the triggers that only send messages.
+    """
+    from sender import create_sender
+
+    return create_sender()
+
+
+@cache
+def get_queue() -> TaskQueue:
+    """
+    Returns the queue updates are processed on, as selected by config.WEBHOOK_MODE.
+    """
+    return get_task_queue(config.WEBHOOK_MODE)
+
+
+def process_update(update: types.Update):
+    """
+    Runs the bot's handlers for an update, reporting any error to sentry.
+    A failed update is released so that Telegram's retry of it is processed, and the error is
+    raised again so that in sync mode the webhook answers with an error and Telegram retries.
+    """
+    from bot import bot
+
+    try:
+        bot.process_new_updates([update])
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        get_deduplicator().release(update.update_id)
+        raise
+
 
 @app.route("/")
 def main():
@@ -71,22 +143,51 @@ def hello_world():
 def webhook():
     """
     Webhook endpoint for receiving updates from Telegram.
-    Processes the updates using the bot module.
+    Processes the updates using the bot module, either before answering or on a background
+    thread depending on config.WEBHOOK_MODE.
     """
     if request.headers.get('content-type') == 'application/json':
-        json_string = request.get_data().decode('utf-8')
-        update = types.Update.de_json(json_string)
+        started = time.perf_counter()
+        payload = json.loads(request.get_data().decode('utf-8'))
+        # retried deliveries are acknowledged without being parsed or processed again
+        if "update_id" in payload and get_deduplicator().is_duplicate(payload["update_id"]):
+            return "Success", 200, {"Access-Control-Allow-Origin": "*"}
+
+        update = types.Update.de_json(payload)
         if update:
             try:
-                bot.process_new_updates([update])
-            except Exception as e:  # pylint: disable=broad-except
-                sentry_sdk.capture_exception(e)
-                return "Success", 200, {"Access-Control-Allow-Origin": "*"}
+                get_queue().submit(process_update, update)
+            except Exception:  # pylint: disable=broad-except
+                # already reported by process_update
+                return "Error", 500, {"Access-Control-Allow-Origin": "*"}
 
+        response_times.append((time.perf_counter() - started) * 1000)
         return "Success", 200, {"Access-Control-Allow-Origin": "*"}
     abort(403)
 
 
+@app.route("/stats")
+def stats():
+    """
+    Reports webhook response times, the share of redelivered updates, the queue depth and the
+    outbound rate limiter's metrics.
+    """
+    from bot import bot
+
+    deduplicator = get_deduplicator()
+    deliveries = deduplicator.processed + deduplicator.duplicates
+    times = sorted(response_times)
+    return jsonify({
+        "mode": config.WEBHOOK_MODE,
+        "updates": deduplicator.processed,
+        "retry_rate": deduplicator.duplicates / deliveries if deliveries else 0,
+        "response_ms_p50": statistics.median(times) if times else 0,
+        "response_ms_p95": times[int(len(times) * 0.95)] if times else 0,
+        "queue_depth": get_queue().depth,
+        "sender": dataclasses.asdict(bot.metrics),
+    })
+
+
 @https_fn.on_request()
 def expose_flask_server(req: https_fn.Request) -> https_fn.Response:
     """
@@ -101,14 +202,12 @@ def order_created(event: Event) -> None:
     """
     Cloud Function endpoint for handling order creation.
     """
+    from data.firestore import not_none, order_from_dict
+
     order: DocumentSnapshot = event.data
 
-    order_processed = Order(**not_none(order.to_dict()))
-    admins = db.get_admins()
-    for admin in admins:
-        bot.send_message(
-            admin.id_,
-            f"""Order created! Please contact the user to confirm the order.
+    order_processed = order_from_dict(order.id, not_none(order.to_dict()))
+    text = f"""Order created! Please contact the user to confirm the order.
             
             User ID: {order_processed.user.id_}
             Name: {order_processed.user.display_name}
@@ -118,8 +217,22 @@ def order_created(event: Event) -> None:
             
             For more information, vistit the web portal
             
-            """,
-        )
+            """
+
+    sender = get_sender()
+    failed = fan_out(lambda chat_id: sender.send_message(chat_id, text),
+                     [admin.id_ for admin in get_database().get_admins()], workers=config.NOTIFICATION_WORKERS)
+    for error in failed.values():
+        sentry_sdk.capture_exception(error)
+
+
+@on_document_written(document="products/{product_id}")
+def product_written(event: Event) -> None:  # pylint: disable=unused-argument
+    """
+    Cloud Function endpoint for handling product changes.
+    Bumps the catalog version so running instances drop their cached products.
+    """
+    get_database().invalidate_catalog()
 
 
 @on_document_updated(document="orders/{order_id}")
@@ -127,17 +240,22 @@ def order_updated(event: Event) -> None:
     """
     Cloud Function endpoint for handling order updates.
     """
+    from data.firestore import not_none, order_from_dict
+
     change: Change = event.data
     order: DocumentSnapshot = change.after
 
-    order_processed = Order(user=User(**order.get("user")), id_=order.id, total_cost=order.get(
-        "total_cost"), items=[OrderItem(**order_item) for order_item in order.get("items")], state=order.get("state"))
+    # only changes of state are worth telling the user about
+    if change.before.get("state") == order.get("state"):
+        return
+
+    order_processed = order_from_dict(order.id, not_none(order.to_dict()))
 
-    bot.send_message(
+    get_sender().send_message(
         order_processed.user.id_,
         f"""Your order has been updated.
         
         Order ID: {order_processed.id_}
-        state: {order_processed.state}
+        state: {order_processed.state.value}
         """,
     )
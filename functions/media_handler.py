@@ -1,29 +1,42 @@
 """This module contains functions to handle media files saved on cloudinary storage"""
 
 from abc import ABC, abstractmethod
-from typing import Type
+from functools import cache
+from typing import TYPE_CHECKING, Optional, Type
 import config
 
-from google.cloud import storage
+# cloudinary and google-cloud-storage are imported when first used, so deployments that do not
+# use them never pay for loading them
+# pylint: disable = import-outside-toplevel
+if TYPE_CHECKING:
+    from google.cloud import storage
 
-import cloudinary
-if config.ENV == "development":
-    cloudinary.config(
-        cloud_name=config.CLOUDINARY_CLOUD_NAME,
-        api_key=config.CLOUDINARY_API_KEY,
-        api_secret=config.CLOUDINARY_API_SECRET,
-    )
-else:
-    # proxies are required for cloudinary to work in production on pythonanywhere
-    cloudinary.config(
-        cloud_name=config.CLOUDINARY_CLOUD_NAME,
-        api_key=config.CLOUDINARY_API_KEY,
-        api_secret=config.CLOUDINARY_API_SECRET,
-        api_proxy='http://proxy.server:3128'
-    )
 
-import cloudinary.api
-import cloudinary.uploader
+@cache
+def cloudinary_uploader():
+    """Imports and configures cloudinary the first time it is needed
+
+    Returns:
+        module: The cloudinary.uploader module
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    if config.ENV == "development":
+        cloudinary.config(
+            cloud_name=config.CLOUDINARY_CLOUD_NAME,
+            api_key=config.CLOUDINARY_API_KEY,
+            api_secret=config.CLOUDINARY_API_SECRET,
+        )
+    else:
+        # proxies are required for cloudinary to work in production on pythonanywhere
+        cloudinary.config(
+            cloud_name=config.CLOUDINARY_CLOUD_NAME,
+            api_key=config.CLOUDINARY_API_KEY,
+            api_secret=config.CLOUDINARY_API_SECRET,
+            api_proxy='http://proxy.server:3128'
+        )
+    return cloudinary.uploader
 
 
 def upload_image(image, public_id):
@@ -37,8 +50,8 @@ def upload_image(image, public_id):
         dict: The response from cloudinary
     """
     if config.ENV == "development":
-        return cloudinary.uploader.upload(image, folder='dev-ecommerce-bot', public_id=public_id, overwrite=True)
-    return cloudinary.uploader.upload(image, folder='ecommerce-bot', public_id=public_id, overwrite=True)
+        return cloudinary_uploader().upload(image, folder='dev-ecommerce-bot', public_id=public_id, overwrite=True)
+    return cloudinary_uploader().upload(image, folder='ecommerce-bot', public_id=public_id, overwrite=True)
 
 
 def delete_image(public_id):
@@ -51,7 +64,7 @@ def delete_image(public_id):
         dict: The response from cloudinary
     """
     print(public_id)
-    return cloudinary.uploader.destroy(public_id, invalidate=True)
+    return cloudinary_uploader().destroy(public_id, invalidate=True)
 
 
 class MediaHandler(ABC):
@@ -96,8 +109,15 @@ class FirebaseStorage(MediaHandler):
     """Class for handling media files on firebase storage"""
 
     def __init__(self):
-        self.storage_client = storage.Client()
-        self.bucket = self.storage_client.bucket(config.FIREBASE_BUCKET_NAME)
+        self._bucket: Optional["storage.Bucket"] = None
+
+    @property
+    def bucket(self) -> "storage.Bucket":
+        """The storage bucket, whose client is created on first use"""
+        if self._bucket is None:
+            from google.cloud import storage
+            self._bucket = storage.Client().bucket(config.FIREBASE_BUCKET_NAME)
+        return self._bucket
 
     def upload(self, file: str, filename: str):
         blob = self.bucket.blob(filename)
@@ -0,0 +1,38 @@
+"""Middleware that runs around the handlers of every message and callback query."""
+
+from typing import Callable
+
+from telebot import types
+from telebot.handler_backends import BaseMiddleware
+
+
+class UpdateMiddleware(BaseMiddleware):
+    """
+    Calls setup functions with the chat's ID before the handlers of an update run, and teardown
+    functions after they ran, even if a handler failed.
+    """
+
+    def __init__(self, begin: list[Callable[[str], None]], end: list[Callable[[], None]]):
+        """
+        Args:
+            begin (list[Callable[[str], None]]): Called in order with the chat's ID
+            end (list[Callable[[], None]]): Called in order once the handlers finished
+        """
+        super().__init__()
+        self.begin = begin
+        self.end = end
+        self.update_types = ['message', 'callback_query']
+
+    def pre_process(self, message, data):
+        if isinstance(message, types.CallbackQuery):
+            message = message.message
+        for begin in self.begin:
+            begin(str(message.chat.id))
+
+    def post_process(self, message, data, exception):
+        for end in self.end:
+            end()
+        # telebot only logs errors raised by handlers when middlewares are used,
+        # raise them again so the webhook can report them
+        if exception is not None:
+            raise exception
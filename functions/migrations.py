@@ -0,0 +1,363 @@
+"""Migrations of data already stored by the bot.
+
+SQL databases record the schema version they are at in their schema_version table, and SqlDb runs
+the migrations after it whenever it opens a database. Each migration defines the tables it creates
+as they were when it was written, so it does the same whatever models.py looks like now. Firestore
+has no schema, its documents are converted by running this once after deploying:
+
+    python migrations.py firestore
+    python migrations.py sql [db_name]
+
+Documents and rows that are already converted are left alone, so running it again is harmless.
+"""
+
+import logging
+import sys
+from typing import Callable
+
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, create_engine, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+import config
+from data.money import Money
+
+# tables with an amount column, and the amount columns
+SQL_MONEY_COLUMNS = {
+    "product": ["price"],
+    "cart": ["total_cost"],
+    "cart_item": ["price"],
+    "order": ["total_cost"],
+    "order_item": ["price"],
+}
+
+FIRESTORE_BATCH_SIZE = 500
+
+# the number of SQL_MIGRATIONS a database has run, in its only row
+SCHEMA_VERSION = Table("schema_version", MetaData(), Column("version", Integer, nullable=False))
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_firestore_money(client):
+    """Prices and totals used to be strings or floats in major units. They are now integer minor
+    units stored next to a currency code, see data.money.
+
+    Converts the prices and totals of the products, carts, orders and orders in progress. Carts
+    stored as an array of items are rewritten in the map layout too: add_to_cart merges into the
+    map without reading the cart, which would replace an array and lose its items. Carts no longer
+    store a total, get_cart sums their items, so the totals carts stored are removed.
+
+    Args:
+        client (firestore.Client): The Firestore client
+    """
+    # pylint: disable = import-outside-toplevel
+    from google.cloud.firestore_v1 import DELETE_FIELD
+
+    from data.firestore import product_from_dict, product_to_dict
+
+    batch, writes = client.batch(), 0
+
+    def update(ref, data: dict):
+        nonlocal batch, writes
+        batch.update(ref, data)
+        writes += 1
+        if writes % FIRESTORE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = client.batch()
+
+    def snapshot(product: dict) -> dict:
+        return product_to_dict(product_from_dict(product))
+
+    for product in client.collection("products").stream():
+        data = product.to_dict()
+        if "currency" not in data:
+            price = Money.parse(data["price"])
+            update(product.reference, {"price": price.amount, "currency": price.currency})
+
+    for order in client.collection("orders").stream():
+        data = order.to_dict()
+        if "currency" not in data:
+            total_cost = Money.parse(data["total_cost"])
+            update(order.reference, {
+                "total_cost": total_cost.amount,
+                "currency": total_cost.currency,
+                "items": [{"product": snapshot(item["product"]), "quantity": item["quantity"]}
+                          for item in data["items"]],
+            })
+
+    for order in client.collection("orders_id_progress").stream():
+        data = order.to_dict()
+        if "currency" not in data["product"]:
+            update(order.reference, {"product": snapshot(data["product"])})
+
+    for cart in client.collection("carts").stream():
+        data = cart.to_dict()
+        if isinstance(data.get("items"), list):
+            # the same conversion as Firestore.cart_from_snapshot, items of removed products are dropped
+            refs = [client.collection("products").document(item["product_id"]) for item in data["items"]]
+            products = {product.id: snapshot({**product.to_dict(), "id_": product.id})
+                        for product in client.get_all(refs) if product.exists}
+            items = {item["product_id"]: {"product": products[item["product_id"]], "quantity": item["quantity"]}
+                     for item in data["items"] if item["product_id"] in products}
+            update(cart.reference, {"items": items, "total_cost": DELETE_FIELD, "currency": DELETE_FIELD})
+        elif isinstance(data.get("items"), dict) and "total_cost" in data:
+            items = {id_: {"product": snapshot(item["product"]), "quantity": item["quantity"]}
+                     for id_, item in data["items"].items()}
+            update(cart.reference, {"items": items, "total_cost": DELETE_FIELD, "currency": DELETE_FIELD})
+
+    batch.commit()
+    logger.info("Updated %d documents", writes)
+
+
+def rebuild_sql_table(connection: Connection, table: Table, convert: Callable[[dict], None]):
+    """Recreates a table with new columns, copying and converting its rows. SQLite cannot change
+    the type of a column, so changes of type are made by copying the table.
+
+    Args:
+        connection (Connection): A connection in a transaction
+        table (Table): The table as it is after the migration, in a MetaData with the tables its
+            foreign keys point at
+        convert (Callable[[dict], None]): Changes a row of the old table in place to fit the new one
+    """
+    name = table.name
+    rows = [dict(row) for row in connection.execute(text(f'SELECT * FROM "{name}"')).mappings()]
+    for row in rows:
+        convert(row)
+
+    # the new table is renamed over the old one, renaming the old one instead would point the
+    # foreign keys of other tables at it
+    metadata = MetaData()
+    for other in table.metadata.sorted_tables:
+        other.to_metadata(metadata)
+    new = table.to_metadata(metadata, name=f"{name}_new")
+    new.create(connection)
+    if rows:
+        connection.execute(new.insert(), rows)
+    connection.execute(text(f'DROP TABLE "{name}"'))
+    connection.execute(text(f'ALTER TABLE "{name}_new" RENAME TO "{name}"'))
+    logger.info("Rebuilt %s with %d rows", name, len(rows))
+
+
+def migrate_sql_money(connection: Connection):
+    """Rebuilds the tables with amount columns as integers of minor units with a currency column
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    metadata = MetaData()
+    Table("user", metadata, Column("id", String, primary_key=True), Column("fullname", String),
+          Column("phone", String), Column("address", String), Column("is_admin", Integer))
+    Table("product", metadata, Column("id", Integer, primary_key=True), Column("name", String),
+          Column("price", Integer), Column("currency", String(3)), Column("description", String),
+          Column("image", String))
+    Table("cart", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", Integer, ForeignKey("user.id")), Column("total_cost", Integer),
+          Column("currency", String(3)))
+    Table("cart_item", metadata, Column("id", Integer, primary_key=True),
+          Column("product_id", Integer, ForeignKey("product.id")), Column("quantity", Integer),
+          Column("price", Integer), Column("currency", String(3)), Column("cart_id", Integer, ForeignKey("cart.id")))
+    Table("order", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", Integer, ForeignKey("user.id")), Column("total_cost", Integer),
+          Column("currency", String(3)), Column("state", String))
+    Table("order_item", metadata, Column("id", Integer, primary_key=True), Column("product", String),
+          Column("quantity", Integer), Column("price", Integer), Column("currency", String(3)),
+          Column("order_id", Integer, ForeignKey("order.id")))
+
+    def convert(columns: list[str]) -> Callable[[dict], None]:
+        def convert_row(row: dict):
+            for column in columns:
+                row[column] = Money.parse(row[column] or 0).amount
+            row["currency"] = config.CURRENCY
+        return convert_row
+
+    for name, columns in SQL_MONEY_COLUMNS.items():
+        inspector = inspect(connection)
+        if inspector.has_table(name) and \
+                "currency" not in {column["name"] for column in inspector.get_columns(name)}:
+            rebuild_sql_table(connection, metadata.tables[name], convert(columns))
+
+
+def migrate_sql_user_ids(connection: Connection):
+    """Rebuilds the tables whose user_id was an integer column referencing the text user.id.
+    SQLite compared the two as numbers, so joins on them could not use the user table's key.
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    metadata = MetaData()
+    Table("user", metadata, Column("id", String, primary_key=True), Column("fullname", String),
+          Column("phone", String), Column("address", String), Column("is_admin", Integer))
+    Table("cart", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", String, ForeignKey("user.id")), Column("total_cost", Integer),
+          Column("currency", String(3)))
+    Table("order", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", String, ForeignKey("user.id")), Column("total_cost", Integer),
+          Column("currency", String(3)), Column("state", String))
+
+    def convert(row: dict):
+        row["user_id"] = None if row["user_id"] is None else str(row["user_id"])
+
+    for name in ("cart", "order"):
+        if inspect(connection).has_table(name):
+            rebuild_sql_table(connection, metadata.tables[name], convert)
+
+
+def create_sql_indexes(connection: Connection):
+    """Creates the indexes on the columns SqlDb filters on that the database does not have yet
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    indexes = {
+        "ix_product_name": ("product", "name"),
+        "ix_cart_user_id": ("cart", "user_id"),
+        # a user's orders are looked up alone or by state, the leading user_id serves both
+        "ix_order_user_id_state": ("order", "user_id, state"),
+        "ix_order_state": ("order", "state"),
+        "ix_order_item_order_id": ("order_item", "order_id"),
+        # items are read by cart and removed by cart and ID
+        "ix_cart_item_cart_id_id": ("cart_item", "cart_id, id"),
+    }
+    for index, (table, columns) in indexes.items():
+        if inspect(connection).has_table(table):
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {index} ON "{table}" ({columns})'))
+
+
+def add_sql_product_fields(connection: Connection):
+    """Adds the columns SqlDb needs to return the same Product and OrderItem as the other
+    backends: whether a product is published and its stock status, and the product an order item
+    was made from. Existing products are published and in stock.
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    columns = {
+        "product": {"published": "BOOLEAN", "status": "VARCHAR"},
+        "order_item": {"product_id": "INTEGER"},
+    }
+    for name, added in columns.items():
+        inspector = inspect(connection)
+        if not inspector.has_table(name):
+            continue
+        # earlier versions of the migrations before it rebuilt tables with the columns of the
+        # models, which already included these
+        existing = {column["name"] for column in inspector.get_columns(name)}
+        for column, type_ in added.items():
+            if column not in existing:
+                connection.execute(text(f'ALTER TABLE "{name}" ADD COLUMN {column} {type_}'))
+
+    if inspect(connection).has_table("product"):
+        connection.execute(text("UPDATE product SET published = 1 WHERE published IS NULL"))
+        connection.execute(text("UPDATE product SET status = 'IN_STOCK' WHERE status IS NULL"))
+
+
+def migrate_sql_order_states(connection: Connection):
+    """Order states were stored in lower case, they are now OrderState values
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    if inspect(connection).has_table("order"):
+        connection.execute(text('UPDATE "order" SET state = upper(state) WHERE state != upper(state)'))
+
+
+def drop_sql_cart_totals(connection: Connection):
+    """Carts kept a running total that went wrong when a product was added again at a new price.
+    Their total is now worked out from their items, so the columns are dropped.
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table("cart"):
+        return
+    existing = {column["name"] for column in inspector.get_columns("cart")}
+    for column in ("total_cost", "currency"):
+        if column in existing:
+            connection.execute(text(f'ALTER TABLE cart DROP COLUMN {column}'))
+
+
+# the schema of version n is reached by running the first n migrations. Append new ones, never
+# reorder or remove them.
+SQL_MIGRATIONS: list[Callable[[Connection], None]] = [
+    migrate_sql_money,
+    migrate_sql_user_ids,
+    create_sql_indexes,
+    add_sql_product_fields,
+    migrate_sql_order_states,
+    drop_sql_cart_totals,
+]
+
+
+def get_sql_version(connection: Connection) -> int:
+    """The number of SQL_MIGRATIONS a database has run
+
+    Args:
+        connection (Connection): A connection to the database
+
+    Returns:
+        int: The schema version, 0 for a database that never recorded one
+    """
+    if inspect(connection).has_table(SCHEMA_VERSION.name):
+        return connection.execute(select(SCHEMA_VERSION.c.version)).scalar() or 0
+    # SQLite databases upgraded before the version was kept in a table recorded it in user_version
+    if connection.dialect.name == "sqlite":
+        return connection.execute(text("PRAGMA user_version")).scalar()
+    return 0
+
+
+def set_sql_version(connection: Connection, version: int):
+    """Records the number of SQL_MIGRATIONS a database has run
+
+    Args:
+        connection (Connection): A connection in a transaction
+        version (int): The schema version
+    """
+    SCHEMA_VERSION.create(connection, checkfirst=True)
+    connection.execute(SCHEMA_VERSION.delete())
+    connection.execute(SCHEMA_VERSION.insert().values(version=version))
+
+
+def upgrade_sql(engine: Engine):
+    """Brings a SQL database to the latest schema version. A new database is created at the
+    latest version, an existing one runs the migrations it has not run yet.
+
+    Args:
+        engine (Engine): The database engine
+    """
+    with engine.begin() as connection:
+        upgrade_sql_connection(connection)
+
+
+def upgrade_sql_connection(connection: Connection):
+    """Does what upgrade_sql does on a connection in a transaction, such as the one an async
+    engine hands to run_sync
+
+    Args:
+        connection (Connection): A connection in a transaction
+    """
+    # pylint: disable = import-outside-toplevel
+    from models import Base
+
+    version = get_sql_version(connection)
+    if inspect(connection).get_table_names():
+        for number, migration in enumerate(SQL_MIGRATIONS[version:], start=version + 1):
+            migration(connection)
+            set_sql_version(connection, number)
+    # tables added since the database was created are created with their indexes
+    Base.metadata.create_all(connection)
+    set_sql_version(connection, len(SQL_MIGRATIONS))
+
+
+if __name__ == "__main__":
+    # the migrations report what they changed through logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) > 1 and sys.argv[1] == "firestore":
+        from google.cloud import firestore  # pylint: disable = ungrouped-imports
+        migrate_firestore_money(firestore.Client())
+    elif len(sys.argv) > 1 and sys.argv[1] == "sql":
+        upgrade_sql(create_engine(
+            f"sqlite:///{sys.argv[2] if len(sys.argv) > 2 else 'db.sqlite3'}", future=True))
+    else:
+        print(__doc__)
+        sys.exit(1)
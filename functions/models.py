@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Index, JSON
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -18,11 +18,16 @@ class User(Base):
 
 class Order(Base):
     __tablename__ = 'order'
+    # a user's orders are looked up alone or by state, the leading user_id serves both
+    __table_args__ = (Index('ix_order_user_id_state', 'user_id', 'state'),)
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(String, ForeignKey('user.id'))
+    user = relationship("User")
     items = relationship("OrderItem")
-    total_cost = Column(String)
-    state = Column(String)  # pending, confirmed, completed, cancelled
+    # amounts are integer minor units of the currency next to them
+    total_cost = Column(Integer)
+    currency = Column(String(3))
+    state = Column(String, index=True)  # an OrderState value
 
     def __repr__(self):
         return f"Order(oid='{self.id}', user='{self.user_id}', cost='{self.total_cost}')"
@@ -31,10 +36,13 @@ class Order(Base):
 class OrderItem(Base):
     __tablename__ = 'order_item'
     id = Column(Integer, primary_key=True)
+    # the product's name and ID when the order was placed, the product may be changed or removed since
     product = Column(String)
+    product_id = Column(Integer)
     quantity = Column(Integer)
-    price = Column(String)
-    order_id = Column(Integer, ForeignKey('order.id'))
+    price = Column(Integer)
+    currency = Column(String(3))
+    order_id = Column(Integer, ForeignKey('order.id'), index=True)
 
     def __repr__(self):
         return f"OrderItem(id='{self.id}', order='{self.order_id}', product='{self.product}', quantity='{self.quantity}')"
@@ -43,10 +51,13 @@ class OrderItem(Base):
 class Product(Base):
     __tablename__ = 'product'
     id = Column(Integer, primary_key=True)
-    name = Column(String)
-    price = Column(String)
+    name = Column(String, index=True)
+    price = Column(Integer)
+    currency = Column(String(3))
     description = Column(String)
     image = Column(String)
+    published = Column(Boolean, default=True)
+    status = Column(String, default="IN_STOCK")
 
     def __repr__(self):
         return f"Product(name='{self.name}', price='{self.price}')"
@@ -55,9 +66,8 @@ class Product(Base):
 class Cart(Base):
     __tablename__ = 'cart'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(String, ForeignKey('user.id'), index=True)
     items = relationship("CartItem")
-    total_cost = Column(String)
 
     def __repr__(self):
         return f"Cart(id='{self.id}', user='{self.user_id}')"
@@ -65,10 +75,14 @@ class Cart(Base):
 
 class CartItem(Base):
     __tablename__ = 'cart_item'
+    # items are read by cart and removed by cart and ID
+    __table_args__ = (Index('ix_cart_item_cart_id_id', 'cart_id', 'id'),)
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('product.id'))
+    product = relationship("Product")
     quantity = Column(Integer)
-    price = Column(String)
+    price = Column(Integer)
+    currency = Column(String(3))
     cart_id = Column(Integer, ForeignKey('cart.id'))
 
     def __repr__(self):
@@ -78,3 +92,33 @@ class CartItem(Base):
 class OrderNotificationUser(Base):
     __tablename__ = 'order_notification_user'
     chat_id = Column(Integer, primary_key=True)
+
+
+class ProcessedUpdate(Base):
+    __tablename__ = 'processed_update'
+    update_id = Column(Integer, primary_key=True)
+
+
+class Conversation(Base):
+    __tablename__ = 'conversation'
+    chat_id = Column(String, primary_key=True)
+    current = Column(String)
+    path = Column(JSON)
+
+
+class OrderInProgress(Base):
+    __tablename__ = 'order_in_progress'
+    user_id = Column(String, ForeignKey('user.id'), primary_key=True)
+    product_id = Column(Integer, ForeignKey('product.id'))
+    product = relationship("Product")
+    quantity = Column(Integer)
+
+    def __repr__(self):
+        return f"OrderInProgress(user='{self.user_id}', product='{self.product_id}', quantity='{self.quantity}')"
+
+
+class Navigation(Base):
+    __tablename__ = 'navigation'
+    user_id = Column(String, primary_key=True)
+    current_page = Column(String)
+    breadcrumb = Column(JSON)
@@ -0,0 +1,152 @@
+"""Buffers navigation events so they stay off the critical path of a tap.
+
+Navigation history is only used for analytics, so every screen a user opens is recorded in memory
+and written to the database in batches instead of with a write per screen. The buffer is written
+on the task queue it was given once it holds batch_size events, or once its oldest event is
+flush_interval seconds old, whether a timer or the end of an update notices first. With a
+flush_interval of 0 the events of an update are written when the update ends.
+
+A function whose CPU is only allocated during requests may not run the timer while it is idle, so
+flush_on_shutdown also writes the buffer when the process exits or receives SIGTERM, as an
+instance being scaled down does. A tracker created with flush_at_shutdown does this once its first
+event is buffered, so creating one has no side effects. Events are only lost if the process is
+killed without warning, for example when it runs out of memory.
+"""
+
+import atexit
+import logging
+import signal
+import sys
+import threading
+import time
+import zlib
+from typing import Optional
+
+from data.DatabaseInterface import DBInterface
+from tasks import TaskQueue
+
+logger = logging.getLogger(__name__)
+
+
+class NavigationTracker:
+    """Records the screens users open and writes them to the database in batches"""
+
+    def __init__(self, db: DBInterface, queue: TaskQueue, mode: str = "all", sample_rate: float = 1.0,
+                 flush_interval: float = 30, batch_size: int = 100, flush_at_shutdown: bool = False):
+        """
+        Args:
+            db (DBInterface): The database the events are written to
+            queue (TaskQueue): The queue flushes run on
+            mode (str, optional): "all" records every user, "sample" a share of users and
+                "off" nobody. Defaults to "all".
+            sample_rate (float, optional): The share of users recorded in "sample" mode.
+                Defaults to 1.0.
+            flush_interval (float, optional): The most seconds an event waits to be written.
+                Defaults to 30.
+            batch_size (int, optional): The most events written in one batch. Defaults to 100.
+            flush_at_shutdown (bool, optional): Call flush_on_shutdown when the first event is
+                buffered. Defaults to False.
+        """
+        if mode not in ("all", "sample", "off"):
+            raise ValueError(
+                f"Unknown navigation tracking mode '{mode}', expected all, sample or off")
+
+        self.db = db
+        self.queue = queue
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.flush_at_shutdown = flush_at_shutdown
+        self.shutdown_hooked = False
+        self.events: list[tuple[str, str, bool]] = []
+        self.oldest = 0.0
+        self.lock = threading.Lock()
+        # flushes the buffer flush_interval seconds after its oldest event, if no update ends by then
+        self.timer: Optional[threading.Timer] = None
+
+    def is_tracked(self, user_id: str) -> bool:
+        """Whether a user's navigation is recorded. Sampling is by user, so sampled trails are whole."""
+        if self.mode == "sample":
+            return zlib.crc32(user_id.encode()) % 10000 < self.sample_rate * 10000
+        return self.mode == "all"
+
+    def record(self, user_id: str, path: str, reset: bool = False):
+        """Records that a user opened a screen
+
+        Args:
+            user_id (str): The ID of the user
+            path (str): The screen the user opened
+            reset (bool, optional): Start a new breadcrumb. Defaults to False.
+        """
+        if not self.is_tracked(user_id):
+            return
+
+        with self.lock:
+            first = not self.events
+            if first:
+                self.oldest = time.monotonic()
+            self.events.append((user_id, path, reset))
+            full = len(self.events) >= self.batch_size
+            hook = self.flush_at_shutdown and not self.shutdown_hooked
+            if hook:
+                self.shutdown_hooked = True
+
+        if hook:
+            self.flush_on_shutdown()
+        if full:
+            self.queue.submit(self.flush)
+        elif first and self.flush_interval > 0:
+            self.start_timer()
+
+    def start_timer(self):
+        """Schedules a flush for when the oldest buffered event is due, unless one is scheduled"""
+        with self.lock:
+            if self.timer is not None and self.timer.is_alive():
+                return
+            self.timer = threading.Timer(self.flush_interval, self.queue.submit, (self.flush,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def end_update(self):
+        """Schedules a flush if the buffered events are due to be written"""
+        with self.lock:
+            due = self.events and time.monotonic() - self.oldest >= self.flush_interval
+
+        if due:
+            self.queue.submit(self.flush)
+
+    def flush(self):
+        """Writes the buffered events in a single batch"""
+        with self.lock:
+            events, self.events = self.events, []
+
+        if not events:
+            return
+
+        with self.db.batch():
+            for user_id, path, reset in events:
+                self.db.update_user_navigation(user_id, path, reset)
+        logger.debug("Wrote %d navigation events", len(events))
+
+    def flush_on_shutdown(self):
+        """Writes the buffer when the process exits, straight away since the task queue may not get
+        to run again. If this is the main thread, the only one signal handlers can be set from,
+        SIGTERM is also made to exit the process normally rather than kill it."""
+        atexit.register(self.flush)
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def on_sigterm(signum, frame):
+            # the handler runs between two statements of the main thread, which may be handling an
+            # update and hold the lock or be halfway through a batch. Flushing here could deadlock
+            # or interleave with that work, so the handler only exits and the exit hook flushes once
+            # the main thread has unwound.
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                sys.exit(128 + signum)
+
+        signal.signal(signal.SIGTERM, on_sigterm)
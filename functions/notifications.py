@@ -0,0 +1,70 @@
+"""Sends the same notification to many chats at once.
+
+Each recipient is sent to on a worker thread and retried on its own, so a slow or failing chat does
+not hold up the others. The number of workers keeps the fan-out below Telegram's limit of about 30
+messages per second for a bot. A 429 response is not retried here: RateLimitedTeleBot already
+retried it after the delay Telegram asked for, and retrying it again would multiply those waits.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after(error: Exception) -> float | None:
+    """Returns how long Telegram asked us to wait, if the error is a 429 response"""
+    if isinstance(error, ApiTelegramException) and error.error_code == 429:
+        return float(error.result_json.get("parameters", {}).get("retry_after", 1))
+    return None
+
+
+def send_with_retries(send: Callable[[str], Any], chat_id: str, attempts: int = 3, backoff: float = 0.5):
+    """Sends to a chat, retrying attempts that failed with anything but a 429
+
+    Args:
+        send (Callable[[str], Any]): Sends the notification to a chat ID
+        chat_id (str): The chat to notify
+        attempts (int, optional): How many times to try. Defaults to 3.
+        backoff (float, optional): Seconds to wait after the first failure, doubled after each
+            following one. Defaults to 0.5.
+
+    Raises:
+        Exception: The last error if every attempt failed
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return send(chat_id)
+        except Exception as e:  # pylint: disable=broad-except
+            # a 429 reaching us was already retried by the sender
+            if attempt == attempts or retry_after(e) is not None:
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning("Notifying %s failed (%s), retrying in %ss", chat_id, e, delay)
+            time.sleep(delay)
+
+
+def fan_out(send: Callable[[str], Any], chat_ids: list[str], workers: int = 8, attempts: int = 3) -> dict[str, Exception]:
+    """Sends a notification to every chat concurrently
+
+    Args:
+        send (Callable[[str], Any]): Sends the notification to a chat ID
+        chat_ids (list[str]): The chats to notify
+        workers (int, optional): How many chats are sent to at the same time. Defaults to 8.
+        attempts (int, optional): How many times to try each chat. Defaults to 3.
+
+    Returns:
+        dict[str, Exception]: The error of every chat that could not be notified
+    """
+    if not chat_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(chat_ids))) as executor:
+        futures = {chat_id: executor.submit(send_with_retries, send, chat_id, attempts)
+                   for chat_id in chat_ids}
+
+    return {chat_id: future.exception() for chat_id, future in futures.items() if future.exception()}
@@ -0,0 +1,152 @@
+"""Routes messages to handlers through tables instead of trying every handler's filter in turn.
+
+telebot calls the filter of every message handler in the order they were registered until one
+accepts the message. A Router keeps its routes in dicts keyed by command, by exact text, by
+conversation step and by text and step together. A message looks up the few routes those keys
+give and takes the one registered first, so the handler it reaches is the one the filters would
+have chosen and finding it costs the same however many routes there are. The chat's step is only
+read when a route keyed by it could win, which keeps the state store out of updates like /start.
+
+Routes only see the text of a message, an empty string for messages without one, so no
+condition can fail on a photo or a sticker.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from telebot import types, util
+
+Handler = Callable[[types.Message], Any]
+
+
+@dataclass
+class Route:
+    """A handler and the condition on the message's text it is taken under"""
+
+    order: int
+    handler: Handler
+    when: Optional[Callable[[str], bool]] = None
+
+    def accepts(self, text: str) -> bool:
+        return self.when is None or bool(self.when(text))
+
+
+class Router:
+    """A table of message handlers, looked up by command, text and conversation step"""
+
+    def __init__(self, step: Callable[[types.Message], str]):
+        """
+        Args:
+            step (Callable[[types.Message], str]): Returns the conversation step of a message's chat
+        """
+        self.step = step
+        self.commands: dict[str, list[Route]] = {}
+        self.texts: dict[str, list[Route]] = {}
+        self.states: dict[str, list[Route]] = {}
+        self.text_states: dict[tuple[str, str], list[Route]] = {}
+        # keyword -> route, taken for replies to a message of the bot whose text has the keyword
+        self.replies: dict[str, Route] = {}
+        self.default: Optional[Handler] = None
+        # the first route keyed by step alone, and by step and each text. The step of a message
+        # is only read when one of these could come before the route it has without it.
+        self.first_state_route = math.inf
+        self.first_text_state_route: dict[str, int] = {}
+        self.routes = 0
+
+    def add(self, table: dict, key, handler: Handler, when: Optional[Callable[[str], bool]] = None) -> Route:
+        """Adds a route to a table, after every route added before it"""
+        route = Route(self.routes, handler, when)
+        self.routes += 1
+        if table is self.replies:
+            table[key] = route
+        else:
+            table.setdefault(key, []).append(route)
+        if table is self.states:
+            self.first_state_route = min(self.first_state_route, route.order)
+        elif table is self.text_states:
+            self.first_text_state_route.setdefault(key[0], route.order)
+        return route
+
+    def command(self, *commands: str, when: Optional[Callable[[str], bool]] = None):
+        """Routes commands, e.g. "start" for /start, to the decorated handler"""
+        def decorator(handler: Handler) -> Handler:
+            for command in commands:
+                self.add(self.commands, command, handler, when)
+            return handler
+        return decorator
+
+    def text(self, *texts: str, state: Optional[str] = None):
+        """Routes messages with one of the texts, sent at a step if given, to the decorated handler"""
+        def decorator(handler: Handler) -> Handler:
+            for text in texts:
+                if state is None:
+                    self.add(self.texts, text, handler)
+                else:
+                    self.add(self.text_states, (text, state), handler)
+            return handler
+        return decorator
+
+    def state(self, state: str, when: Optional[Callable[[str], bool]] = None):
+        """Routes messages sent at a step, whose text passes the condition if given, to the decorated handler"""
+        def decorator(handler: Handler) -> Handler:
+            self.add(self.states, state, handler, when)
+            return handler
+        return decorator
+
+    def reply(self, keyword: str):
+        """Routes texts sent in reply to a message with the keyword, in any case, to the decorated handler"""
+        def decorator(handler: Handler) -> Handler:
+            self.add(self.replies, keyword, handler, bool)
+            return handler
+        return decorator
+
+    def fallback(self, handler: Handler) -> Handler:
+        """Routes the messages no other route takes to the decorated handler"""
+        self.default = handler
+        return handler
+
+    def resolve(self, message: types.Message) -> Optional[Handler]:
+        """Finds the handler of a message
+
+        Args:
+            message (types.Message): The message
+
+        Returns:
+            Optional[Handler]: The handler of the first route that takes the message, else the fallback
+        """
+        text = message.text or ""
+        best: Optional[Route] = None
+
+        def consider(routes):
+            nonlocal best
+            for route in routes:
+                if best is not None and route.order >= best.order:
+                    return
+                if route.accepts(text):
+                    best = route
+                    return
+
+        command = util.extract_command(text) if text else None
+        if command is not None:
+            consider(self.commands.get(command, ()))
+        consider(self.texts.get(text, ()))
+        if self.replies and message.reply_to_message is not None and message.reply_to_message.text:
+            replied = message.reply_to_message.text.lower()
+            consider(sorted((route for keyword, route in self.replies.items() if keyword in replied),
+                            key=lambda route: route.order))
+
+        before = best.order if best is not None else math.inf
+        if self.first_state_route < before or self.first_text_state_route.get(text, math.inf) < before:
+            step = self.step(message)
+            consider(self.states.get(step, ()))
+            consider(self.text_states.get((text, step), ()))
+
+        return best.handler if best is not None else self.default
+
+    def dispatch(self, message: types.Message):
+        """Calls the handler of a message and returns what it returned"""
+        handler = self.resolve(message)
+        if handler is not None:
+            return handler(message)
+        return None
@@ -0,0 +1,173 @@
+"""Rate limited sending for the bot.
+
+Telegram allows a bot about 30 messages per second overall and roughly one per second in a single
+chat, and answers with 429 and a retry_after when we go faster. RateLimitedTeleBot waits for a
+token from a global bucket and from the chat's bucket before each outbound call, and retries calls
+that are still rejected after the delay Telegram asks for. Handlers keep calling bot.send_message
+and friends as before.
+
+The waits happen on the thread making the call, which for the bot's handlers is the thread
+processing the update, so a throttled chat holds the update and one of the instance's concurrent
+requests for as long as it waits. Sends are not queued off that thread because handlers use what
+they return, such as the file_id of an uploaded photo. Instead a chat's burst covers the output of
+a couple of handlers, at most four calls each, so a chat is only slowed down once it keeps
+sending faster than its rate for several updates in a row.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+
+import telebot
+from cachetools import LRUCache
+from telebot.apihelper import ApiTelegramException
+
+import config
+from notifications import retry_after
+
+
+class TokenBucket:
+    """Hands out tokens at a steady rate, allowing bursts up to a capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): The most tokens the bucket holds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token, going into debt if none is left
+
+        Returns:
+            float: Seconds to wait before the token may be used
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+@dataclass
+class SenderMetrics:
+    """
+    Counters of the rate limited sender
+
+    Attributes:
+        calls (int): Outbound calls made
+        waiting (int): Calls currently waiting for a token
+        waited (int): Calls that had to wait
+        wait_seconds (float): Total time spent waiting for tokens
+        max_wait_seconds (float): Longest single wait
+        retries (int): Calls retried after a 429
+    """
+    calls: int = 0
+    waiting: int = 0
+    waited: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    retries: int = 0
+
+
+class RateLimitedTeleBot(telebot.TeleBot):
+    """TeleBot whose outbound calls respect Telegram's global and per-chat limits"""
+
+    def __init__(self, *args, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 10,
+                 max_retries: int = 3, **kwargs):
+        """
+        Args:
+            global_rate (float, optional): Calls per second across all chats. Defaults to 30.
+            chat_rate (float, optional): Calls per second in one chat. Defaults to 1.
+            chat_burst (float, optional): Calls a chat can make at once. Defaults to 10.
+            max_retries (int, optional): Times a call is retried after a 429. Defaults to 3.
+        """
+        super().__init__(*args, **kwargs)
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: LRUCache = LRUCache(maxsize=10000)
+        self.chat_buckets_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.metrics = SenderMetrics()
+        self.metrics_lock = threading.Lock()
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        """Returns the token bucket of a chat"""
+        with self.chat_buckets_lock:
+            key = str(chat_id)
+            if key not in self.chat_buckets:
+                self.chat_buckets[key] = TokenBucket(
+                    self.chat_rate, self.chat_burst)
+            return self.chat_buckets[key]
+
+    def wait_for_token(self, chat_id=None):
+        """Blocks until both the global bucket and the chat's bucket allow a call"""
+        delay = self.global_bucket.reserve()
+        if chat_id is not None:
+            delay = max(delay, self.chat_bucket(chat_id).reserve())
+
+        with self.metrics_lock:
+            self.metrics.calls += 1
+            if delay > 0:
+                self.metrics.waiting += 1
+                self.metrics.waited += 1
+                self.metrics.wait_seconds += delay
+                self.metrics.max_wait_seconds = max(
+                    self.metrics.max_wait_seconds, delay)
+
+        if delay > 0:
+            time.sleep(delay)
+            with self.metrics_lock:
+                self.metrics.waiting -= 1
+
+    def throttled(self, call, chat_id, *args, **kwargs):
+        """Makes an outbound call once tokens are available, retrying it after a 429"""
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_token(chat_id)
+            try:
+                return call(*args, **kwargs)
+            except ApiTelegramException as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                with self.metrics_lock:
+                    self.metrics.retries += 1
+                time.sleep(delay)
+        return None
+
+    def send_message(self, chat_id, *args, **kwargs):
+        return self.throttled(super().send_message, chat_id, chat_id, *args, **kwargs)
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self.throttled(super().send_photo, chat_id, chat_id, *args, **kwargs)
+
+    def edit_message_reply_markup(self, chat_id=None, *args, **kwargs):
+        return self.throttled(super().edit_message_reply_markup, chat_id, chat_id, *args, **kwargs)
+
+    def answer_callback_query(self, *args, **kwargs):
+        return self.throttled(super().answer_callback_query, None, *args, **kwargs)
+
+
+def create_sender(**kwargs) -> RateLimitedTeleBot:
+    """Returns a bot with config's token and rate limits, which only sends until handlers are added
+
+    Args:
+        **kwargs: Passed on to RateLimitedTeleBot
+
+    Returns:
+        RateLimitedTeleBot: The bot
+    """
+    if not config.API_KEY:
+        raise ValueError("API_KEY is not set")
+
+    # Firebase does not support threading for cloud functions
+    return RateLimitedTeleBot(token=config.API_KEY, threaded=False, global_rate=config.TELEGRAM_GLOBAL_RATE,
+                              chat_rate=config.TELEGRAM_CHAT_RATE, chat_burst=config.TELEGRAM_CHAT_BURST, **kwargs)
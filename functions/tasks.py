@@ -0,0 +1,103 @@
+"""Queues that run work after the webhook has answered Telegram.
+
+In deferred mode the webhook only validates an update and submits it to a queue, so Telegram gets
+its response before any message is sent or document written. ThreadQueue runs the work on a
+background thread of the instance; the cloud function must keep its CPU allocated outside of
+requests for the thread to make progress. InlineQueue runs work as it is submitted and stands in
+for the thread queue in sync mode and when testing.
+"""
+
+import logging
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue(ABC):
+    """Abstract class for task queues"""
+
+    @abstractmethod
+    def submit(self, task: Callable, *args):
+        """Schedules a task
+
+        Args:
+            task (Callable): The function to run
+            *args: The arguments to call it with
+        """
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def depth(self) -> int:
+        """The number of tasks waiting to run"""
+        raise NotImplementedError
+
+
+class InlineQueue(TaskQueue):
+    """Runs tasks immediately, in the caller's thread"""
+
+    def submit(self, task: Callable, *args):
+        task(*args)
+
+    @property
+    def depth(self) -> int:
+        return 0
+
+
+class ThreadQueue(TaskQueue):
+    """Runs tasks one at a time, in submission order, on a daemon thread started by the first task"""
+
+    def __init__(self):
+        self.tasks: queue.Queue = queue.Queue()
+        self.worker = threading.Thread(
+            target=self.run, name="task-queue", daemon=True)
+        self.worker_lock = threading.Lock()
+
+    def submit(self, task: Callable, *args):
+        with self.worker_lock:
+            if not self.worker.is_alive():
+                self.worker.start()
+        self.tasks.put((task, args))
+
+    @property
+    def depth(self) -> int:
+        return self.tasks.qsize()
+
+    def run(self):
+        """Runs tasks until the process exits"""
+        while True:
+            task, args = self.tasks.get()
+            try:
+                task(*args)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Task %s failed", task.__name__)
+            finally:
+                self.tasks.task_done()
+
+    def join(self):
+        """Blocks until every submitted task has run"""
+        self.tasks.join()
+
+
+QUEUES = {
+    "sync": InlineQueue,
+    "deferred": ThreadQueue,
+}
+
+
+def get_task_queue(mode: str) -> TaskQueue:
+    """Returns a task queue for a webhook mode
+
+    Args:
+        mode (str): "sync" to process updates before answering, "deferred" to process them after
+
+    Returns:
+        TaskQueue: The task queue
+    """
+    if mode not in QUEUES:
+        raise ValueError(
+            f"Unknown webhook mode '{mode}', expected one of {', '.join(QUEUES)}")
+    return QUEUES[mode]()
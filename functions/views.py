@@ -0,0 +1,93 @@
+"""Texts and keyboards the bot sends.
+
+They are built here, apart from the handlers of bot.py that send them.
+"""
+
+# pylint: disable = missing-function-docstring, line-too-long
+
+from telebot import types
+
+from data.DatabaseInterface import DBInterface, OrderInProgress, Product, User
+
+NEXT = "What would you like to do next?"
+ERROR = "An error occurred, please try again"
+PRODUCTS = "Hello, what would you like to purchase?\nSelect a product from the list below"
+PRODUCT_NOT_FOUND = "Product not found, please try again"
+CART_EMPTY = "Your cart is empty"
+PHONE_PROMPT = "Please enter your phone number to proceed with payment\n\nFormat: 0201234567"
+INVALID_PHONE = "Please enter a valid phone number\n\nFormat: 0201234567"
+ADDRESS_PROMPT = "Please enter your address\n\nFormat: 1234 Street Name, City, Region\n\nExample: 1234 Street Name, Accra, Greater Accra"
+NAME_PROMPT = "Please enter your name\n\nFormat: First Name Last Name\n\nExample: John Doe"
+CASH_ONLY = "Due to current limitations, we only accept cash payments." \
+    "Once you confirm your order, you will be contacted by our delivery agent to arrange payment and delivery."
+
+
+def main_menu_markup() -> types.InlineKeyboardMarkup:
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("Make A Purchase", callback_data="make_purchase"),
+               types.InlineKeyboardButton("View Cart", callback_data="view_cart"),
+               types.InlineKeyboardButton("Checkout", callback_data="checkout"))
+    return markup
+
+
+def products_markup(products: list[Product]) -> types.InlineKeyboardMarkup:
+    markup = types.InlineKeyboardMarkup()
+    for product in products:
+        markup.add(types.InlineKeyboardButton(
+            product.name, callback_data=f"product_selection_{product.id_}"))
+    markup.add(types.InlineKeyboardButton("Main Menu", callback_data="main_menu"),
+               types.InlineKeyboardButton("Checkout", callback_data="checkout"))
+    return markup
+
+
+def cart_text(cart: DBInterface.GetCartReturn) -> str:
+    if not cart["products"]:
+        return CART_EMPTY
+
+    text = f"Total Cost: {cart['total_cost']}\n\n"
+    for cart_item in cart["products"]:
+        text += f"Product: {cart_item.product.name}\nQuantity: {cart_item.quantity}\n\n"
+    return text
+
+
+def product_text(product: Product) -> str:
+    return f"Product: {product.name}\nPrice: {product.price}\n\nHow many would you like to purchase?"
+
+
+def quantity_markup() -> types.ReplyKeyboardMarkup:
+    markup = types.ReplyKeyboardMarkup(
+        resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Enter Quantity", row_width=3)
+    markup.add(*[str(i) for i in range(1, 11)], "Back")
+    return markup
+
+
+def order_in_progress_text(order: OrderInProgress, quantity: int) -> str:
+    return f"{order.product.name}\nQuantity: {quantity}\nTotal Cost: {order.product.price * quantity}\n\n" \
+        "Would you like to add this to your cart?"
+
+
+def yes_no_markup() -> types.ReplyKeyboardMarkup:
+    markup = types.ReplyKeyboardMarkup(
+        resize_keyboard=True, one_time_keyboard=True, input_field_placeholder="Select An Option")
+    markup.row("Yes", "No")
+    markup.row("Back")
+    return markup
+
+
+def prompt_markup(placeholder: str) -> types.ForceReply:
+    return types.ForceReply(input_field_placeholder=placeholder)
+
+
+def delivery_text(user: User) -> str:
+    return f"will be delivered to\n\n{user.display_name}\n\n{user.address}\n\n{user.phone}\n\nPlease confirm your order"
+
+
+def confirm_order_markup() -> types.InlineKeyboardMarkup:
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("Confirm Order", callback_data="confirm_order"))
+    markup.add(types.InlineKeyboardButton("Cancel Order", callback_data="cancel_order"))
+    return markup
+
+
+def order_placed_text(order_id: str) -> str:
+    return f"Your order with ID {order_id[:5]} is being processed. You will be contacted by our delivery agent shortly."